@@ -1,19 +1,23 @@
 """Пример работы с чатом через langchain"""
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
 
-from gigachain import GigaChatModel
+from gigachain import GigaChatModel, TokenBudgetMemory
 
 chat = GigaChatModel()
 
-messages = [
-    SystemMessage(
-        content="Ты эмпатичный бот-психолог, который помогает пользователю решить его проблемы."
-    )
-]
+system = SystemMessage(
+    content="Ты эмпатичный бот-психолог, который помогает пользователю решить его проблемы."
+)
+# Старые реплики сворачиваются в краткое содержание, запрос не растет бесконечно
+memory = TokenBudgetMemory(llm=chat, max_token_limit=2000)
 
 while(True):
     user_input = input("User: ")
-    messages.append(HumanMessage(content=user_input))
-    res = chat(messages)
-    messages.append(res)
-    print("Bot: ", res.content)
+    question = HumanMessage(content=user_input)
+    print("Bot: ", end="", flush=True)
+    answer = ""
+    for chunk in chat.stream([system] + memory.messages + [question]):
+        answer += chunk.content
+        print(chunk.content, end="", flush=True)
+    print()
+    memory.add_messages([question, AIMessage(content=answer)])
@@ -1,4 +1,3 @@
-from langchain.chains.summarize import load_summarize_chain
 from langchain.document_loaders import WebBaseLoader
 
 import gigachain
@@ -7,7 +6,11 @@ loader = WebBaseLoader("https://www.indiansworld.org/ketzalcoatl.html")
 docs = loader.load()
 
 llm = gigachain.GigaChatModel(profanity=False)
-chain = load_summarize_chain(llm, chain_type="stuff", prompt = gigachain.SUMMARY_STUFF_PROMPT)
+# Документ любой длины: части суммаризируются параллельно, затем сводятся деревом
+chain = gigachain.MapReduceSummarizer(llm=llm, prompt=gigachain.SUMMARY_STUFF_PROMPT, max_concurrency=4)
 
-res = chain.run(docs)
-print(res)
+for partial in chain.stream_summaries(docs):
+    if partial.final:
+        print(partial.text)
+    else:
+        print(f"[уровень {partial.level}, часть {partial.index}] {partial.text}\n")
@@ -1,20 +1,23 @@
 import os
 
 from langchain.chains import RetrievalQA
-from langchain.document_loaders import TextLoader
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores import Chroma
 
 import gigachain
 
-loader = TextLoader("cookbook/data/bicameral.txt")
-documents = loader.load()
-text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-texts = text_splitter.split_documents(documents)
+# Векторы кэшируются на диске: при повторном запуске корпус не пересчитывается
+embeddings = gigachain.GigaChatEmbeddings(cache_dir="cookbook/data/.embeddings")
 
-embeddings = OpenAIEmbeddings()
-docsearch = Chroma.from_documents(texts, embeddings)
+index_path = "cookbook/data/.index"
+if os.path.exists(index_path):
+    # Индекс отображается в память с диска, построение не повторяется
+    docsearch = gigachain.NumpyVectorStore.load(index_path, embeddings)
+else:
+    docsearch = gigachain.NumpyVectorStore(embeddings)
+    # Файлы читаются потоково и индексируются пачками. Для больших корпусов
+    # уберите workers=0: нарезка пойдет в пуле процессов
+    # (тогда код запуска нужно поместить под if __name__ == "__main__")
+    gigachain.IngestionPipeline(docsearch, chunk_tokens=300, workers=0).run(["cookbook/data/bicameral.txt"])
+    docsearch.save(index_path)
 
 qa = RetrievalQA.from_chain_type(
     llm=gigachain.GigaChatModel(profanity=False), chain_type="stuff", retriever=docsearch.as_retriever(), chain_type_kwargs = {"prompt": gigachain.prompts.QA_PROMPT})
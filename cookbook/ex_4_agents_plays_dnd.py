@@ -1,95 +1,16 @@
 """ Игра DnD с тремя агентами """
 import os
-from typing import Callable, List
 
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
 
-from gigachain import GigaChatModel
+from gigachain import (DialogueAgent, DialogueSimulator, GigaChatModel,
+                       TokenBudgetMemory)
 
 giga = GigaChatModel(profanity=False, temperature=0.2)
 llm = ChatOpenAI(model="gpt-4", temperature=0.4)
 
 
-class DialogueAgent:
-    def __init__(
-        self,
-        name: str,
-        system_message: SystemMessage,
-        model: llm,
-    ) -> None:
-        self.name = name
-        self.system_message = system_message
-        self.model = model
-        self.prefix = f"{self.name}:"
-        self.reset()
-
-    def reset(self):
-        self.message_history = ["Вот разговор:"]
-
-    def send(self) -> str:
-        """
-        Applies the chatmodel to the message history
-        and returns the message string
-        """
-        message = self.model(
-            [
-                self.system_message,
-                HumanMessage(content="\n".join(
-                    self.message_history + [self.prefix])),
-            ]
-        )
-        return message.content
-
-    def receive(self, name: str, message: str) -> None:
-        """
-        Concatenates {message} spoken by {name} into message history
-        """
-        self.message_history.append(f"{name}: {message}")
-
-
-class DialogueSimulator:
-    def __init__(
-        self,
-        agents: List[DialogueAgent],
-        selection_function: Callable[[int, List[DialogueAgent]], int],
-    ) -> None:
-        self.agents = agents
-        self._step = 0
-        self.select_next_speaker = selection_function
-
-    def reset(self):
-        for agent in self.agents:
-            agent.reset()
-
-    def inject(self, name: str, message: str):
-        """
-        Initiates the conversation with a {message} from {name}
-        """
-        for agent in self.agents:
-            agent.receive(name, message)
-
-        # increment time
-        self._step += 1
-
-    def step(self) -> tuple[str, str]:
-        # 1. choose the next speaker
-        speaker_idx = self.select_next_speaker(self._step, self.agents)
-        speaker = self.agents[speaker_idx]
-
-        # 2. next speaker sends message
-        message = speaker.send()
-
-        # 3. everyone receives message
-        for receiver in self.agents:
-            receiver.receive(speaker.name, message)
-
-        # 4. increment time
-        self._step += 1
-
-        return speaker.name, message
-
-
 protagonist_name = "Гарри Поттер"
 storyteller_name = "Старый маг"
 thirdparty_name = "Призрак-шутник"
@@ -225,35 +146,30 @@ specified_quest = llm(quest_specifier_prompt).content
 print(f"\nOriginal quest:\n{quest}\n")
 print(f"Detailed quest:\n{specified_quest}\n")
 
+# Старые реплики сворачиваются в краткое содержание, запрос не растет бесконечно
 protagonist = DialogueAgent(
     name=protagonist_name,
     system_message=protagonist_system_message,
     model=llm,
+    memory=TokenBudgetMemory(llm=giga, max_token_limit=1500),
 )
 storyteller = DialogueAgent(
     name=storyteller_name,
     system_message=storyteller_system_message,
     model=llm,
+    memory=TokenBudgetMemory(llm=giga, max_token_limit=1500),
 )
 thirdparty = DialogueAgent(
     name=thirdparty_name,
     system_message=thirdparty_system_message,
     model=llm,
+    memory=TokenBudgetMemory(llm=giga, max_token_limit=1500),
 )
 
-def select_next_speaker(step: int, agents: List[DialogueAgent]) -> int:
-    idx = step % len(agents)
-    return idx
-
-
-
 max_iters = 100
 n = 0
 
-simulator = DialogueSimulator(
-    agents=[storyteller, protagonist, thirdparty], selection_function=select_next_speaker
-)
-simulator.reset()
+simulator = DialogueSimulator(agents=[storyteller, protagonist, thirdparty])
 simulator.inject(storyteller_name, specified_quest)
 print(f"\033[33m({storyteller_name}): {specified_quest}\033[0m")
 print("\n")
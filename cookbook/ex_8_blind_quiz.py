@@ -0,0 +1,56 @@
+""" Викторина: два участника отвечают, не слыша друг друга """
+import asyncio
+
+from langchain.schema import SystemMessage
+
+from gigachain import DialogueAgent, DialogueSimulator, GigaChatModel
+
+giga = GigaChatModel(profanity=False, temperature=0.7)
+
+host_name = "Ведущий"
+first_name = "Анна"
+second_name = "Борис"
+rounds = 5
+
+host = DialogueAgent(
+    name=host_name,
+    system_message=SystemMessage(content=(
+        f"Ты ведущий викторины. Участники {first_name} и {second_name} пишут ответы на карточках "
+        f"и не видят ответы друг друга. Оцени ответы на прошлый вопрос, назови текущий счет "
+        f"и задай новый вопрос по истории России. Отвечай коротко, одной строкой."
+    )),
+    model=giga,
+)
+
+# Участники слышат только ведущего, поэтому ответ Бориса готовится,
+# пока Анна еще пишет свой
+first = DialogueAgent(
+    name=first_name,
+    system_message=SystemMessage(content=(
+        f"Ты участник викторины {first_name}. Ответь на последний вопрос ведущего "
+        f"одной короткой фразой."
+    )),
+    model=giga,
+    hears=[host_name],
+)
+second = DialogueAgent(
+    name=second_name,
+    system_message=SystemMessage(content=(
+        f"Ты участник викторины {second_name}, любишь пошутить. Ответь на последний вопрос "
+        f"ведущего одной короткой фразой."
+    )),
+    model=giga,
+    hears=[host_name],
+)
+
+simulator = DialogueSimulator(agents=[host, first, second], speculate=True)
+
+
+async def main():
+    async for name, message in simulator.aiter_turns(3 * rounds):
+        print(f"({name}): {message}\n")
+    stats = simulator.stats
+    print(f"Ответов подготовлено заранее: {stats.speculation_hits} из {stats.speculated}")
+
+
+asyncio.run(main())
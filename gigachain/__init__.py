@@ -1,2 +1,28 @@
 from .gigachat_model import GigaChatModel
-from .prompts import *
\ No newline at end of file
+from .prompts import *
+from .transport import (AsyncHTTPTransport, HTTPTransport, TransportStats,
+                        get_async_transport, get_transport)
+from .auth import TokenManager, get_token_manager
+from .cache import CacheStats, LRUCache, ResponseCache, make_body_key, make_cache_key
+from .batch import BatchResult, aiter_batch, iter_batch
+from .errors import (AuthenticationError, CircuitOpenError, DeadlineExceededError, GigaChatError,
+                     RateLimitError, ResponseError, ServiceUnavailableError)
+from .ratelimit import AdaptiveConcurrencyLimiter, RateLimiter, TokenBucket
+from .retry import CircuitBreaker, RetryPolicy
+from .balancer import Endpoint, LoadBalancer, get_balancer
+from .metrics import Metrics, RequestTrace
+from .serialization import PayloadEncoder, encode_payload, message_to_dict
+from .memory import TokenBudgetMemory
+from .tokenizer import TokenCounter
+from .summarize import MapReduceSummarizer, PartialSummary
+from .embeddings import EmbeddingCache, GigaChatEmbeddings, LocalEmbeddings
+from .vectorstore import NumpyVectorStore
+from .ingest import IngestionPipeline, IngestionStats
+from .semantic_cache import SemanticCache, SemanticCacheStats
+from .coalesce import SingleFlight
+from .dialogue import (DialogueAgent, DialogueSimulator, DialogueStats,
+                       Transcript, arun_simulations)
+from .self_check import SelfCheckChain, SelfCheckStep
+from .scheduler import (BATCH, INTERACTIVE, RequestScheduler, SchedulerStats,
+                        set_default_scheduler)
+from .capture import CapturedRequest, TrafficRecorder, read_capture
@@ -0,0 +1,217 @@
+"""Shared GigaChat access token management"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from .errors import AuthenticationError
+from .metrics import untraced
+from .transport import HTTPTransport
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_TTL = 30 * 60
+
+REFRESH_JITTER = 5
+"""Most seconds the background refresh runs early, so workers sharing a token file don't refresh at once"""
+
+
+class TokenManager:
+    """Access token for one GigaChat user, shared by every model in the process.
+
+    Concurrent callers of a cold or expired manager wait for a single request to
+    ``/v1/token``. While the token is in use it is refreshed in the background
+    ``refresh_margin`` seconds before it expires, but no earlier than halfway
+    through its lifetime, so short-lived tokens are reused. With ``cache_dir`` set the token
+    is also kept in a file, so worker processes of the same user share one token
+    and take turns (under a file lock) to refresh it.
+    """
+
+    def __init__(
+        self,
+        transport: HTTPTransport,
+        user: str,
+        password: str,
+        cache_dir: Optional[str] = None,
+        refresh_margin: float = 60,
+        timeout: float = 3,
+    ):
+        self.transport = transport
+        self.user = user
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lifetime = float("inf")
+        self._rejected: Optional[str] = None
+        self._used = False
+        self._timer: Optional[threading.Timer] = None
+
+        self._cache_path: Optional[str] = None
+        if cache_dir is not None:
+            key = hashlib.sha256(f"{transport.api_url}\n{user}".encode()).hexdigest()[:16]
+            self._cache_path = os.path.join(cache_dir, f"gigachat-token-{key}.json")
+
+    def _margin(self, lifetime: float) -> float:
+        return min(self.refresh_margin, lifetime / 2)
+
+    def _is_fresh(self, token: Optional[str], expires_at: float, lifetime: float) -> bool:
+        return (token is not None and token != self._rejected
+                and time.time() < expires_at - self._margin(lifetime))
+
+    def get_token(self) -> str:
+        token = self._token
+        if self._is_fresh(token, self._expires_at, self._lifetime):
+            self._used = True
+            return token
+        with self._lock:
+            if not self._is_fresh(self._token, self._expires_at, self._lifetime):
+                self._refresh()
+            self._used = True
+            return self._token
+
+    async def aget_token(self) -> str:
+        token = self._token
+        if self._is_fresh(token, self._expires_at, self._lifetime):
+            self._used = True
+            return token
+        # The fetch is rare and single-flight, so it is fine to run it in a thread
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_token)
+
+    def invalidate(self, token: str) -> None:
+        """Forget ``token`` after the service rejected it with 401"""
+        with self._lock:
+            self._rejected = token
+            if self._token == token:
+                self._expires_at = 0.0
+
+    def _refresh(self, stale: Optional[str] = None) -> None:
+        """Get a fresh token, from the cache file if another process has put one there other than ``stale``"""
+        with self._file_lock():
+            cached = self._read_cache()
+            if cached is not None and cached[0] != stale and self._is_fresh(*cached):
+                self._token, self._expires_at, self._lifetime = cached
+            else:
+                self._token, self._expires_at, self._lifetime = self._fetch()
+                self._write_cache()
+        self._used = False
+        self._schedule_refresh()
+
+    def _fetch(self) -> Tuple[str, float, float]:
+        # Counted as the auth phase as a whole, not as connect and read of the chat request
+        fetched_at = time.time()
+        with untraced():
+            response = self.transport.post(
+                "/v1/token", auth=(self.user, self.password), data=[], timeout=self.timeout)
+        if not response.ok:
+            raise AuthenticationError(
+                "Can't authorize to GigaChat. Error code: " + str(response.status_code))
+        body = response.json()
+        expires_at = body.get("exp")
+        if expires_at is None:
+            expires_at = fetched_at + DEFAULT_TOKEN_TTL
+        elif expires_at > 1e11:  # milliseconds since epoch
+            expires_at /= 1000
+        logger.debug("Fetched GigaChat token for %s, expires at %s", self.user, expires_at)
+        return body["tok"], float(expires_at), float(expires_at) - fetched_at
+
+    def _schedule_refresh(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = self._expires_at - self._margin(self._lifetime) - time.time()
+        if delay <= 0:
+            return
+        # Shortly before the token stops being fresh, so callers don't wait for the refresh
+        delay -= random.uniform(0, min(REFRESH_JITTER, delay / 10))
+        self._timer = threading.Timer(delay, self._background_refresh, args=(self._token,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self, token: str) -> None:
+        # An idle manager is not kept warm, the next caller refreshes it on demand
+        if not self._used:
+            return
+        try:
+            with self._lock:
+                # Still fresh, but about to expire, unless a caller has replaced it meanwhile
+                if self._token == token:
+                    self._refresh(stale=token)
+        except Exception:
+            logger.warning("Background GigaChat token refresh failed", exc_info=True)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        if self._cache_path is None or fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+        with open(self._cache_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_cache(self) -> Optional[Tuple[str, float, float]]:
+        if self._cache_path is None:
+            return None
+        try:
+            with open(self._cache_path) as f:
+                cached = json.load(f)
+            return cached["tok"], float(cached["exp"]), float(cached.get("ttl", "inf"))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_cache(self) -> None:
+        if self._cache_path is None:
+            return
+        directory = os.path.dirname(self._cache_path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".gigachat-token-")
+        except OSError:
+            logger.warning("Can't write GigaChat token cache %s", self._cache_path, exc_info=True)
+            return
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"tok": self._token, "exp": self._expires_at, "ttl": self._lifetime}, f)
+            os.replace(tmp_path, self._cache_path)
+        except OSError:
+            logger.warning("Can't write GigaChat token cache %s", self._cache_path, exc_info=True)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+
+_managers: Dict[Tuple[str, str, str, Optional[str]], TokenManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(
+    transport: HTTPTransport,
+    user: str,
+    password: str,
+    cache_dir: Optional[str] = None,
+) -> TokenManager:
+    """Return the token manager shared by all models of ``user`` at the same endpoint"""
+    key = (transport.api_url, user, password, cache_dir)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = TokenManager(transport, user, password, cache_dir=cache_dir)
+            _managers[key] = manager
+        return manager
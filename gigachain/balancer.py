@@ -0,0 +1,375 @@
+"""Load balancing between several GigaChat endpoints"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait
+from contextlib import contextmanager
+from typing import (Any, Awaitable, Callable, Dict, Iterator, List, Optional,
+                    Sequence, Tuple, TypeVar)
+
+from .retry import CircuitBreaker
+from .transport import (AsyncHTTPTransport, CancelScope, HTTPTransport,
+                        cancel_scope, get_async_transport, get_transport)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ROUTING_POLICIES = ("round_robin", "least_outstanding", "ewma")
+
+
+class Endpoint:
+    """One GigaChat gateway with its transports and health statistics"""
+
+    def __init__(self, api_url: str, balancer: "LoadBalancer"):
+        self.api_url = api_url.rstrip("/")
+        self._balancer = balancer
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def transport(self) -> HTTPTransport:
+        b = self._balancer
+        return get_transport(self.api_url, b.pool_maxsize, b.connect_timeout, b.read_timeout)
+
+    @property
+    def async_transport(self) -> AsyncHTTPTransport:
+        b = self._balancer
+        return get_async_transport(self.api_url, b.max_concurrency, b.connect_timeout, b.read_timeout)
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.api_url!r}, outstanding={self.outstanding}, ewma={self.ewma_latency})"
+
+
+class LoadBalancer:
+    """Routes requests between several GigaChat endpoints.
+
+    ``policy`` is one of ``round_robin``, ``least_outstanding`` (fewest
+    requests in flight) or ``ewma`` (lowest smoothed latency weighted by load).
+    An endpoint that fails ``eject_after`` times in a row, or fails a
+    background health probe, is ejected for ``eject_time`` seconds.
+
+    With ``hedge_percentile`` set, a request still unanswered after that
+    percentile of recent latencies is duplicated to another endpoint and the
+    first answer wins. The loser is cancelled, on the sync path by shutting
+    down its connection (see :class:`~gigachain.transport.CancelScope`).
+    """
+
+    def __init__(
+        self,
+        api_urls: Sequence[str],
+        policy: str = "round_robin",
+        pool_maxsize: int = 10,
+        max_concurrency: int = 64,
+        connect_timeout: float = 5,
+        read_timeout: float = 600,
+        eject_after: int = 3,
+        eject_time: float = 30,
+        health_check_interval: Optional[float] = None,
+        health_check_path: str = "/v1/models",
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        ewma_decay: float = 0.3,
+    ):
+        if not api_urls:
+            raise ValueError("At least one GigaChat endpoint is required")
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy {policy}, expected one of {ROUTING_POLICIES}")
+        self.policy = policy
+        self.pool_maxsize = pool_maxsize
+        self.max_concurrency = max_concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.eject_after = eject_after
+        self.eject_time = eject_time
+        self.health_check_path = health_check_path
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.ewma_decay = ewma_decay
+
+        self.endpoints = [Endpoint(url, self) for url in api_urls]
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._latencies: deque = deque(maxlen=256)
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self._stop = threading.Event()
+        if health_check_interval:
+            thread = threading.Thread(
+                target=self._health_loop, args=(health_check_interval,), daemon=True,
+                name="gigachat-health-check")
+            thread.start()
+
+    # --- routing ---
+
+    def choose(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.available and e not in exclude]
+            if not candidates:
+                # Everything is ejected: better to try a bad node than to fail
+                candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+            if self.policy == "round_robin":
+                return candidates[next(self._counter) % len(candidates)]
+            if self.policy == "least_outstanding":
+                low = min(e.outstanding for e in candidates)
+                return random.choice([e for e in candidates if e.outstanding == low])
+            # An endpoint without an answer yet is assumed to be average, not instant
+            latencies = self._latencies
+            default = sum(latencies) / len(latencies) if latencies else 0.0
+            return min(candidates, key=lambda e: (default if e.ewma_latency is None else e.ewma_latency)
+                       * (e.outstanding + 1))
+
+    def _start(self, endpoint: Endpoint) -> float:
+        with self._lock:
+            endpoint.outstanding += 1
+        return time.perf_counter()
+
+    def _finish(self, endpoint: Endpoint, started: float, error: Optional[BaseException]) -> None:
+        latency = time.perf_counter() - started
+        with self._lock:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.failures = 0
+                endpoint.ewma_latency = latency if endpoint.ewma_latency is None else (
+                    self.ewma_decay * latency + (1 - self.ewma_decay) * endpoint.ewma_latency)
+                self._latencies.append(latency)
+            elif CircuitBreaker.is_failure(error):
+                endpoint.failures += 1
+                self._penalize(endpoint, latency)
+                if endpoint.failures >= self.eject_after and endpoint.available:
+                    logger.warning("Ejecting GigaChat endpoint %s after %d failures",
+                                   endpoint.api_url, endpoint.failures)
+                    endpoint.ejected_until = time.monotonic() + self.eject_time
+
+    def _penalize(self, endpoint: Endpoint, latency: float) -> None:
+        """Count a failure as a slow answer in the latency of ``endpoint``, called with the lock held.
+
+        As slow as twice the slowest endpoint, and at least the connect
+        timeout, so a failing endpoint scores worse than any working one.
+        """
+        known = [e.ewma_latency for e in self.endpoints if e.ewma_latency is not None]
+        penalty = max(latency, 2 * max(known, default=0.0), self.connect_timeout)
+        endpoint.ewma_latency = penalty if endpoint.ewma_latency is None else (
+            self.ewma_decay * penalty + (1 - self.ewma_decay) * endpoint.ewma_latency)
+
+    def _cancel(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    @contextmanager
+    def track(self, endpoint: Endpoint, scope: Optional[CancelScope] = None) -> Iterator[Endpoint]:
+        """Account a request to ``endpoint`` that is run by the caller"""
+        started = self._start(endpoint)
+        try:
+            yield endpoint
+        except Exception as error:
+            if scope is not None and scope.cancelled:
+                # Aborted through its cancel scope, the error comes from the closed socket
+                self._cancel(endpoint)
+            else:
+                self._finish(endpoint, started, error)
+            raise
+        except BaseException:
+            # Cancelled (for instance a hedging loser), tells nothing about the endpoint
+            self._cancel(endpoint)
+            raise
+        self._finish(endpoint, started, None)
+
+    def _run(self, endpoint: Endpoint, fn: Callable[[Endpoint], T], scope: Optional[CancelScope] = None) -> T:
+        if scope is None:
+            with self.track(endpoint):
+                return fn(endpoint)
+        with cancel_scope(scope), self.track(endpoint, scope):
+            return fn(endpoint)
+
+    async def _arun(self, endpoint: Endpoint, fn: Callable[[Endpoint], Awaitable[T]]) -> T:
+        with self.track(endpoint):
+            return await fn(endpoint)
+
+    # --- hedging ---
+
+    def hedge_delay(self) -> Optional[float]:
+        """Delay before a duplicate request, None while hedging is off or not warmed up"""
+        if self.hedge_percentile is None or len(self.endpoints) < 2:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile))
+        return latencies[index]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * self.pool_maxsize * len(self.endpoints),
+                    thread_name_prefix="gigachat-hedge")
+            return self._executor
+
+    def call(self, fn: Callable[[Endpoint], T]) -> T:
+        """Run ``fn`` against the chosen endpoint, hedging it if enabled"""
+        primary = self.choose()
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._run(primary, fn)
+
+        executor = self._get_executor()
+        scopes = {}
+
+        def submit(endpoint: Endpoint) -> Future:
+            scope = CancelScope()
+            # Copy the context so the request trace follows the request into the pool
+            future = executor.submit(contextvars.copy_context().run, self._run, endpoint, fn, scope)
+            scopes[future] = scope
+            return future
+
+        first = submit(primary)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        with self._lock:
+            self._hedges += 1
+        second = submit(self.choose(exclude=[primary]))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is second:
+                            with self._lock:
+                                self._hedge_wins += 1
+                        return future.result()
+                    error = error or future.exception()
+            raise error
+        finally:
+            # Close the loser's connection, so it gives back its pool slot and permits now
+            for future in pending:
+                future.cancel()
+                scopes[future].cancel()
+
+    async def acall(self, fn: Callable[[Endpoint], Awaitable[T]]) -> T:
+        """Async version of :meth:`call`, the losing request is really cancelled"""
+        primary = self.choose()
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._arun(primary, fn)
+
+        first = asyncio.ensure_future(self._arun(primary, fn))
+        second: Optional[asyncio.Future] = None
+        pending = {first}
+        error: Optional[BaseException] = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                with self._lock:
+                    self._hedges += 1
+                second = asyncio.ensure_future(self._arun(self.choose(exclude=[primary]), fn))
+                pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            with self._lock:
+                                self._hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # Also when the caller is cancelled, the requests must not outlive it
+            for task in pending:
+                task.cancel()
+
+    # --- health checks ---
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        """Check that ``endpoint`` answers; any status below 500 counts as alive"""
+        try:
+            response = endpoint.transport.request(
+                "GET", self.health_check_path, timeout=(self.connect_timeout, self.connect_timeout))
+            return response.status_code < 500
+        except Exception:
+            return False
+
+    def _health_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            for endpoint in self.endpoints:
+                healthy = self.probe(endpoint)
+                with self._lock:
+                    if healthy:
+                        if not endpoint.available:
+                            logger.info("GigaChat endpoint %s is back", endpoint.api_url)
+                            # Forget the penalties, it scores as an average endpoint again
+                            endpoint.ewma_latency = None
+                        endpoint.failures = 0
+                        endpoint.ejected_until = 0.0
+                    elif endpoint.available:
+                        logger.warning("GigaChat endpoint %s failed health check", endpoint.api_url)
+                        endpoint.ejected_until = time.monotonic() + self.eject_time
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "endpoints": [
+                    {
+                        "api_url": e.api_url,
+                        "available": e.available,
+                        "outstanding": e.outstanding,
+                        "ewma_latency": e.ewma_latency,
+                        "failures": e.failures,
+                    }
+                    for e in self.endpoints
+                ],
+                "hedges": self._hedges,
+                "hedge_wins": self._hedge_wins,
+            }
+
+
+_balancers: Dict[Tuple[Any, ...], LoadBalancer] = {}
+_balancers_lock = threading.Lock()
+
+
+def get_balancer(
+    api_urls: List[str],
+    policy: str = "round_robin",
+    pool_maxsize: int = 10,
+    max_concurrency: int = 64,
+    connect_timeout: float = 5,
+    read_timeout: float = 600,
+    health_check_interval: Optional[float] = None,
+) -> LoadBalancer:
+    """Return a balancer shared by all models routing over the same endpoints with the same settings"""
+    key = (tuple(api_urls), policy, pool_maxsize, max_concurrency, connect_timeout, read_timeout,
+           health_check_interval)
+    with _balancers_lock:
+        balancer = _balancers.get(key)
+        if balancer is None:
+            balancer = LoadBalancer(
+                api_urls, policy, pool_maxsize, max_concurrency, connect_timeout, read_timeout,
+                health_check_interval=health_check_interval)
+            _balancers[key] = balancer
+        return balancer
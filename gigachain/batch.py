@@ -0,0 +1,155 @@
+"""Lazy high-throughput batch execution of chat requests"""
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import (AsyncIterable, AsyncIterator, Awaitable, Callable, Deque,
+                    Iterable, Iterator, List, Optional, Set, Tuple, Union)
+
+from langchain.schema.messages import BaseMessage
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one conversation of a batch"""
+
+    index: int
+    """Position of the conversation in the input"""
+
+    message: Optional[BaseMessage] = None
+
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _run_one(call: Callable[[List[BaseMessage]], BaseMessage], index: int,
+             messages: List[BaseMessage]) -> BatchResult:
+    try:
+        return BatchResult(index, message=call(messages))
+    except Exception as error:
+        return BatchResult(index, error=error)
+
+
+def iter_batch(
+    call: Callable[[List[BaseMessage]], BaseMessage],
+    inputs: Iterable[List[BaseMessage]],
+    max_workers: int = 8,
+    ordered: bool = True,
+) -> Iterator[BatchResult]:
+    """Run ``call`` over ``inputs`` in a thread pool and yield results.
+
+    At most ``2 * max_workers`` conversations are taken from ``inputs`` ahead of
+    the consumer, so a generator over millions of prompts is never materialized.
+    Results come in input order, or as soon as they complete if ``ordered`` is
+    false. A failed conversation is reported in its result and does not stop
+    the batch.
+    """
+    window = 2 * max_workers
+    source = enumerate(inputs)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit() -> Optional[Future]:
+        item = next(source, None)
+        if item is None:
+            return None
+        return executor.submit(_run_one, call, *item)
+
+    try:
+        if ordered:
+            queue: Deque[Future] = deque()
+            for _ in range(window):
+                future = submit()
+                if future is None:
+                    break
+                queue.append(future)
+            while queue:
+                result = queue.popleft().result()
+                future = submit()
+                if future is not None:
+                    queue.append(future)
+                yield result
+        else:
+            running: Set[Future] = set()
+            for _ in range(window):
+                future = submit()
+                if future is None:
+                    break
+                running.add(future)
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    refill = submit()
+                    if refill is not None:
+                        running.add(refill)
+                    yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def _aenumerate(
+    inputs: Union[Iterable[List[BaseMessage]], AsyncIterable[List[BaseMessage]]]
+) -> AsyncIterator[Tuple[int, List[BaseMessage]]]:
+    index = 0
+    if hasattr(inputs, "__aiter__"):
+        async for messages in inputs:
+            yield index, messages
+            index += 1
+    else:
+        for messages in inputs:
+            yield index, messages
+            index += 1
+
+
+async def aiter_batch(
+    acall: Callable[[List[BaseMessage]], Awaitable[BaseMessage]],
+    inputs: Union[Iterable[List[BaseMessage]], AsyncIterable[List[BaseMessage]]],
+    max_workers: int = 64,
+    ordered: bool = True,
+) -> AsyncIterator[BatchResult]:
+    """Async version of :func:`iter_batch`, runs up to ``max_workers`` tasks at once"""
+
+    async def run_one(index: int, messages: List[BaseMessage]) -> BatchResult:
+        try:
+            return BatchResult(index, message=await acall(messages))
+        except Exception as error:
+            return BatchResult(index, error=error)
+
+    source = _aenumerate(inputs)
+
+    async def submit() -> Optional["asyncio.Task[BatchResult]"]:
+        try:
+            index, messages = await source.__anext__()
+        except StopAsyncIteration:
+            return None
+        return asyncio.ensure_future(run_one(index, messages))
+
+    pending: Deque["asyncio.Task[BatchResult]"] = deque()
+    try:
+        for _ in range(max_workers):
+            task = await submit()
+            if task is None:
+                break
+            pending.append(task)
+        if ordered:
+            while pending:
+                result = await pending[0]
+                pending.popleft()
+                task = await submit()
+                if task is not None:
+                    pending.append(task)
+                yield result
+        else:
+            while pending:
+                done, running = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending = deque(running)
+                for task in done:
+                    refill = await submit()
+                    if refill is not None:
+                        pending.append(refill)
+                    yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
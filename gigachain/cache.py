@@ -0,0 +1,207 @@
+"""Response cache for GigaChat completions"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Generic, Optional, Tuple, TypeVar, Union
+
+from langchain.callbacks.manager import Callbacks
+from langchain.schema.language_model import BaseLanguageModel
+
+V = TypeVar("V")
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """Canonical hash of a request payload"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def make_body_key(data: bytes) -> str:
+    """Hash of an encoded request body, cheaper than :func:`make_cache_key` when the body is at hand"""
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    size: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LRUCache(Generic[V]):
+    """Thread-safe in-memory LRU cache with optional time-to-live"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[V]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            created, value = item
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: V, created: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.time() if created is None else created, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str) -> Optional[V]:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return None if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResponseCache:
+    """Cache of raw GigaChat responses keyed by :func:`make_body_key` or :func:`make_cache_key`.
+
+    Entries live in an in-memory LRU limited by ``max_size`` and ``ttl``.
+    With ``path`` set they are also written to an SQLite database, which
+    survives restarts and backs the in-memory layer on misses. The database is
+    trimmed to ``max_size`` entries too: expired and then the oldest rows are
+    deleted when it is opened and after every ``max_size // 8`` writes.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._memory: LRUCache[Dict[str, Any]] = LRUCache(max_size, ttl)
+        self._unpurged = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            self._purge()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._memory.get(key)
+        if value is None and self._db is not None:
+            value = self._load(key)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        created = time.time()
+        self._memory.set(key, value, created)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), created))
+                self._unpurged += 1
+                if self._unpurged >= max(1, self.max_size // 8):
+                    self._purge()
+
+    def _purge(self) -> None:
+        """Delete expired rows and the oldest ones beyond ``max_size``, called with the lock held"""
+        self._unpurged = 0
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_size,))
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = json.loads(row[0]), row[1]
+        if self.ttl is not None and time.time() - created > self.ttl:
+            with self._lock:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self._memory.set(key, value, created)
+        return value
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self._hits, misses=self._misses, size=len(self._memory))
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._db is not None:
+            with self._lock:
+                self._db.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+PromptCache = Union[LRUCache, ResponseCache]
+"""Answers by prompt: an :class:`LRUCache` lives as long as the process, a
+:class:`ResponseCache` with a ``path`` also survives restarts"""
+
+
+def make_prompt_key(llm: BaseLanguageModel, prompt: str) -> str:
+    """Hash of ``prompt`` and the parameters of the model answering it"""
+    params = sorted((key, str(value)) for key, value in llm._identifying_params.items())
+    return hashlib.sha256(repr((params, prompt)).encode("utf-8")).hexdigest()
+
+
+def cached_predict(llm: BaseLanguageModel, prompt: str, cache: Optional[PromptCache], callbacks: Callbacks) -> str:
+    """Stripped answer of ``llm`` to ``prompt``, from ``cache`` when it has one"""
+    key = make_prompt_key(llm, prompt) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["text"]
+    text = llm.predict(prompt, callbacks=callbacks).strip()
+    if key is not None:
+        cache.set(key, {"text": text})
+    return text
+
+
+async def acached_predict(
+    llm: BaseLanguageModel, prompt: str, cache: Optional[PromptCache], callbacks: Callbacks
+) -> str:
+    """Async version of :func:`cached_predict`"""
+    key = make_prompt_key(llm, prompt) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["text"]
+    text = (await llm.apredict(prompt, callbacks=callbacks)).strip()
+    if key is not None:
+        cache.set(key, {"text": text})
+    return text
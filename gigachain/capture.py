@@ -0,0 +1,130 @@
+"""Capture of GigaChat traffic for offline replay.
+
+A :class:`TrafficRecorder` passed to models as ``traffic_recorder`` appends
+every chat request with its answer and trace to a gzip-compressed JSON
+lines file. Each open of the file adds a gzip member, so a capture can be
+appended to by several runs and read while it is being written::
+
+    recorder = TrafficRecorder("traffic.jsonl.gz")
+    giga = GigaChatModel(traffic_recorder=recorder)
+
+Replay a capture with ``python -m gigachain.testing.replay traffic.jsonl.gz``.
+"""
+import gzip
+import logging
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from .metrics import RequestTrace
+from .serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CapturedRequest:
+    """One captured chat request"""
+
+    time: float
+    """Unix time the request started"""
+
+    payload: Dict[str, Any]
+    response: Optional[str] = None
+    """Answer text, also the part received of a failed stream"""
+
+    stop: Optional[List[str]] = None
+    api_url: Optional[str] = None
+    trace: Dict[str, Any] = field(default_factory=dict)
+    """:meth:`gigachain.metrics.RequestTrace.as_dict` of the request"""
+
+    @property
+    def streamed(self) -> bool:
+        return bool(self.payload.get("stream") or self.trace.get("streamed"))
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self.trace.get("duration")
+
+
+class TrafficRecorder:
+    """Appends captured requests to ``path``, thread-safe.
+
+    Records are compressed as they are written and flushed every
+    ``flush_every`` records and on :meth:`close`, a crash loses at most those
+    since the last flush. ``sample_rate`` captures only a share of requests.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0, flush_every: int = 64, compresslevel: int = 6):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "ab", compresslevel=compresslevel)
+        self._pending = 0
+        self.records = 0
+
+    def record(
+        self,
+        payload: Dict[str, Any],
+        response: Optional[str],
+        trace: RequestTrace,
+        stop: Optional[List[str]] = None,
+        api_url: Optional[str] = None,
+    ) -> None:
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        line = dumps({
+            "time": time.time() - trace.duration,
+            "payload": payload,
+            "response": response,
+            "stop": stop,
+            "api_url": api_url,
+            "trace": trace.as_dict(),
+        }) + b"\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self.records += 1
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                # A sync flush ends a deflate block, readers can decompress everything before it
+                self._file.flush(zlib.Z_SYNC_FLUSH)
+                self._pending = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush(zlib.Z_SYNC_FLUSH)
+                self._pending = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "TrafficRecorder":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def read_capture(path: str) -> Iterator[CapturedRequest]:
+    """Captured requests of ``path`` in order, stops quietly at a truncated end"""
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # written up to the last flush only
+                record = loads(line)
+                yield CapturedRequest(
+                    time=record["time"], payload=record["payload"], response=record.get("response"),
+                    stop=record.get("stop"), api_url=record.get("api_url"), trace=record.get("trace") or {})
+        except (EOFError, zlib.error) as error:
+            logger.debug("Capture %s ends early: %s", path, error)
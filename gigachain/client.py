@@ -0,0 +1,113 @@
+"""Transport and authorization shared by the GigaChat models"""
+from typing import Any, Dict, Optional, Tuple
+
+from .auth import TokenManager, get_token_manager
+from .errors import AuthenticationError
+from .metrics import timed
+from .transport import (AsyncHTTPTransport, HTTPTransport,
+                        get_async_transport, get_transport)
+
+
+class GigaChatClientMixin:
+    """Transports, access token and authorized requests of a GigaChat model.
+
+    Mixed into pydantic models with the fields ``api_url``, ``token``,
+    ``user``, ``password``, ``token_cache_dir``, ``pool_maxsize``,
+    ``max_concurrency``, ``connect_timeout``, ``read_timeout``,
+    ``transport`` and ``async_transport``. ``api_url`` arguments pick one of
+    several gateways, the first one by default.
+    """
+
+    @property
+    def _primary_url(self) -> str:
+        return self.api_url if isinstance(self.api_url, str) else self.api_url[0]
+
+    def _get_transport(self, api_url: Optional[str] = None) -> HTTPTransport:
+        if api_url is not None and api_url != self._primary_url:
+            return get_transport(api_url, self.pool_maxsize, self.connect_timeout, self.read_timeout)
+        if self.transport is None:
+            self.transport = get_transport(
+                self._primary_url, self.pool_maxsize, self.connect_timeout, self.read_timeout)
+        return self.transport
+
+    def _get_async_transport(self, api_url: Optional[str] = None) -> AsyncHTTPTransport:
+        if api_url is not None and api_url != self._primary_url:
+            return get_async_transport(api_url, self.max_concurrency, self.connect_timeout, self.read_timeout)
+        if self.async_transport is None:
+            self.async_transport = get_async_transport(
+                self._primary_url, self.max_concurrency, self.connect_timeout, self.read_timeout)
+        return self.async_transport
+
+    def _has_credentials(self) -> bool:
+        return self.user is not None and self.password is not None
+
+    def _get_token_manager(self, api_url: Optional[str] = None) -> TokenManager:
+        return get_token_manager(self._get_transport(api_url), self.user, self.password, self.token_cache_dir)
+
+    def _authorize(self, api_url: Optional[str] = None):
+        if not self._has_credentials():
+            raise AuthenticationError("Can't authorize to GigaChat. Please provide GIGA_USER and GIGA_PASSWORD environment variables")
+
+        self.token = self._get_token_manager(api_url).get_token()
+
+    async def _aauthorize(self, api_url: Optional[str] = None):
+        if not self._has_credentials():
+            raise AuthenticationError("Can't authorize to GigaChat. Please provide GIGA_USER and GIGA_PASSWORD environment variables")
+
+        self.token = await self._get_token_manager(api_url).aget_token()
+
+    def _get_token(self, api_url: Optional[str] = None) -> str:
+        # With credentials the shared manager owns the token and keeps it fresh
+        if self.token is None or self.token == "" or self._has_credentials():
+            self._authorize(api_url)
+        return self.token
+
+    async def _aget_token(self, api_url: Optional[str] = None) -> str:
+        if self.token is None or self.token == "" or self._has_credentials():
+            await self._aauthorize(api_url)
+        return self.token
+
+    def _reauthorize(self, token: str, api_url: Optional[str] = None) -> bool:
+        """Drop a token rejected with 401, returns whether the request can be replayed"""
+        if not self._has_credentials():
+            return False
+        self._get_token_manager(api_url).invalidate(token)
+        return True
+
+    @staticmethod
+    def _headers(token: str) -> Dict[str, str]:
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {token}'
+        }
+
+    def _timeout(self, budget: Optional[float] = None) -> Tuple[float, float]:
+        """Connect and read timeouts, shortened to what is left of the retry deadline"""
+        if budget is None:
+            return self.connect_timeout, self.read_timeout
+        return min(self.connect_timeout, budget), min(self.read_timeout, budget)
+
+    def _post(self, path: str, data: bytes, timeout: Tuple[float, float], api_url: Optional[str] = None) -> Any:
+        """POST ``data`` with the access token, once more with a new token after a 401"""
+        transport = self._get_transport(api_url)
+        with timed("auth"):
+            token = self._get_token(api_url)
+        response = transport.post(path, headers=self._headers(token), data=data, timeout=timeout)
+        if response.status_code == 401 and self._reauthorize(token, api_url):
+            with timed("auth"):
+                token = self._get_token(api_url)
+            response = transport.post(path, headers=self._headers(token), data=data, timeout=timeout)
+        return response
+
+    async def _apost(
+        self, path: str, data: bytes, timeout: Tuple[float, float], api_url: Optional[str] = None
+    ) -> Any:
+        transport = self._get_async_transport(api_url)
+        with timed("auth"):
+            token = await self._aget_token(api_url)
+        response = await transport.post(path, headers=self._headers(token), data=data, timeout=timeout)
+        if response.status_code == 401 and self._reauthorize(token, api_url):
+            with timed("auth"):
+                token = await self._aget_token(api_url)
+            response = await transport.post(path, headers=self._headers(token), data=data, timeout=timeout)
+        return response
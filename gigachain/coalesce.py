@@ -0,0 +1,80 @@
+"""Coalescing of identical concurrent requests"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Runs a call once for all callers that ask for the same key at the same time.
+
+    The first caller of a key runs it, callers arriving before it finishes
+    wait and get the same result or the same exception. A call that finished
+    is forgotten, the next caller runs it again, this is not a cache.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[Tuple[int, str], "asyncio.Future[Any]"] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """Result of ``fn`` and whether it was shared with another caller's run"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True  # type: ignore[return-value]
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Async version of :meth:`do`, calls are shared within an event loop"""
+        # Futures belong to one loop, so are the calls
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(loop_key)
+            shared = task is not None
+            if task is None:
+                task = self._tasks[loop_key] = asyncio.ensure_future(fn())
+        if not shared:
+            task.add_done_callback(lambda _: self._forget(loop_key))
+        # A cancelled caller must not cancel the call for the others
+        return await asyncio.shield(task), shared
+
+    def _forget(self, loop_key: Tuple[int, str]) -> None:
+        with self._lock:
+            self._tasks.pop(loop_key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Coalescer shared by all models of the process"""
+    return _single_flight
@@ -0,0 +1,366 @@
+"""Multi-agent dialogues over one shared transcript.
+
+Agents take turns speaking, every utterance is appended once to a
+:class:`Transcript` and each agent reads it through its own
+:class:`TranscriptView`. Every utterance is formatted once, a prompt only
+joins the lines it shows, and agents that see the same lines share the join::
+
+    simulator = DialogueSimulator([storyteller, hero], speculate=True)
+    simulator.inject(storyteller.name, "Однажды...")
+    turns = asyncio.run(simulator.arun(10))
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import (AsyncIterator, Callable, Iterable, Iterator, List,
+                    Optional, Sequence, Tuple)
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import BaseMessage, HumanMessage, SystemMessage
+
+from .memory import TokenBudgetMemory
+
+
+class _Lines:
+    """Rendered lines, joined on demand, the last join is reused until a line is added"""
+
+    def __init__(self) -> None:
+        self._lines: List[str] = []
+        self._joined: Optional[Tuple[int, int, str]] = None
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def append(self, line: str) -> None:
+        self._lines.append(line)
+
+    def text(self, start: int = 0) -> str:
+        """Lines from the ``start``-th one on"""
+        joined = self._joined
+        if joined is not None and joined[:2] == (start, len(self._lines)):
+            return joined[2]
+        text = "".join(self._lines[start:])
+        self._joined = (start, len(self._lines), text)
+        return text
+
+
+@dataclass(frozen=True)
+class Utterance:
+    speaker: str
+    text: str
+
+    def render(self) -> str:
+        return f"{self.speaker}: {self.text}\n"
+
+
+class Transcript:
+    """Append-only record of a dialogue, shared by all of its agents"""
+
+    def __init__(self) -> None:
+        self._utterances: List[Utterance] = []
+        self._lines = _Lines()
+
+    def __len__(self) -> int:
+        return len(self._utterances)
+
+    def __getitem__(self, index: int) -> Utterance:
+        return self._utterances[index]
+
+    def __iter__(self) -> Iterator[Utterance]:
+        return iter(self._utterances)
+
+    def append(self, speaker: str, text: str) -> Utterance:
+        utterance = Utterance(speaker, text)
+        self._utterances.append(utterance)
+        self._lines.append(utterance.render())
+        return utterance
+
+    def text(self, start: int = 0) -> str:
+        """Utterances from the ``start``-th one on, one ``speaker: text`` line each"""
+        return self._lines.text(start)
+
+    def view(
+        self, hears: Optional[Iterable[str]] = None, start: int = 0, window: Optional[int] = None
+    ) -> "TranscriptView":
+        return TranscriptView(self, hears, start, window)
+
+
+class TranscriptView:
+    """Part of a transcript one agent sees.
+
+    Only utterances of the speakers in ``hears`` (everyone with None) from
+    the ``start``-th utterance on, and only the last ``window`` of them when
+    given. A view of everyone shares the rendered text of the transcript,
+    a filtered one renders the utterances it sees as they arrive.
+    """
+
+    def __init__(
+        self,
+        transcript: Transcript,
+        hears: Optional[Iterable[str]] = None,
+        start: int = 0,
+        window: Optional[int] = None,
+    ):
+        self.transcript = transcript
+        self.hears = frozenset(hears) if hears is not None else None
+        self.window = window
+        if self.hears is None:
+            self._lines = transcript._lines
+            self._first = start
+        else:
+            self._lines = _Lines()
+            self._first = 0
+        self._seen = start
+
+    def _sync(self) -> None:
+        if self.hears is None:
+            return
+        utterances = self.transcript._utterances
+        for utterance in utterances[self._seen:]:
+            if utterance.speaker in self.hears:
+                self._lines.append(utterance.render())
+        self._seen = len(utterances)
+
+    def __len__(self) -> int:
+        """Number of utterances seen, changes exactly when :meth:`text` does"""
+        self._sync()
+        return len(self._lines) - self._first
+
+    def hears_from(self, speaker: str) -> bool:
+        return self.hears is None or speaker in self.hears
+
+    def text(self) -> str:
+        self._sync()
+        start = self._first
+        if self.window is not None:
+            start = max(start, len(self._lines) - self.window)
+        return self._lines.text(start)
+
+
+class DialogueAgent:
+    """Participant of a dialogue speaking through ``model``.
+
+    The prompt is ``system_message`` and one human message with ``header``,
+    the agent's view of the transcript and its name as the prefix of the
+    reply. An agent that ``hears`` only some speakers always hears itself.
+
+    With ``memory`` the utterances the agent hears are added to it and the
+    prompt shows the memory instead of the view, e.g. a
+    :class:`~gigachain.memory.TokenBudgetMemory` keeps it within a budget.
+    Joining a transcript clears the memory.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        system_message: SystemMessage,
+        model: BaseChatModel,
+        hears: Optional[Iterable[str]] = None,
+        window: Optional[int] = None,
+        header: str = "Вот разговор:",
+        memory: Optional[TokenBudgetMemory] = None,
+    ) -> None:
+        self.name = name
+        self.system_message = system_message
+        self.model = model
+        self.hears = set(hears) | {name} if hears is not None else None
+        self.window = window
+        self.header = header
+        self.memory = memory
+        self.prefix = f"{name}:"
+        self.view = Transcript().view(self.hears, window=window)
+        self._remembered = 0
+
+    def join(self, transcript: Transcript, start: int = 0) -> None:
+        """Follow ``transcript`` from its ``start``-th utterance on"""
+        self.view = transcript.view(self.hears, start, self.window)
+        self._remembered = start
+        if self.memory is not None:
+            self.memory.clear()
+
+    def _remember(self) -> None:
+        """Add the utterances heard since the last prompt to the memory"""
+        utterances = self.view.transcript._utterances
+        heard = [HumanMessage(content=f"{utterance.speaker}: {utterance.text}")
+                 for utterance in utterances[self._remembered:] if self.view.hears_from(utterance.speaker)]
+        self._remembered = len(utterances)
+        if heard:
+            self.memory.add_messages(heard)
+
+    def messages(self) -> List[BaseMessage]:
+        if self.memory is None:
+            history = self.view.text()
+        else:
+            self._remember()
+            history = "".join(f"{message.content}\n" for message in self.memory.messages)
+        return [
+            self.system_message,
+            HumanMessage(content=f"{self.header}\n{history}{self.prefix}"),
+        ]
+
+    def send(self, stop: Optional[List[str]] = None) -> str:
+        return self.model.predict_messages(self.messages(), stop=stop).content
+
+    async def asend(self, stop: Optional[List[str]] = None) -> str:
+        return (await self.model.apredict_messages(self.messages(), stop=stop)).content
+
+
+def round_robin(step: int, agents: Sequence[DialogueAgent]) -> int:
+    return step % len(agents)
+
+
+@dataclass
+class DialogueStats:
+    turns: int = 0
+    speculated: int = 0
+    """Replies generated ahead of the speaker's turn"""
+
+    speculation_hits: int = 0
+    """Speculative replies that were used"""
+
+    @property
+    def speculation_hit_rate(self) -> float:
+        return self.speculation_hits / self.speculated if self.speculated else 0.0
+
+
+@dataclass
+class _Speculation:
+    agent: DialogueAgent
+    seen: int
+    task: "asyncio.Future[str]"
+
+
+class DialogueSimulator:
+    """Runs a dialogue of ``agents``, ``selection_function(step, agents)`` picks the speaker.
+
+    With ``speculate`` the asynchronous methods start the reply of the next
+    speaker while the current one is still generating, when the current
+    utterance will not be part of its view (e.g. it does not hear the current
+    speaker). The speculative reply is used if the view is still the same
+    when its turn comes, and cancelled otherwise. The selection function is
+    then called for the next step ahead of time, and once per step anyway.
+
+    A reply ends where the agent starts speaking for another agent, at a new
+    line with the name of another speaker.
+
+    An agent takes part in one simulation at a time.
+    """
+
+    def __init__(
+        self,
+        agents: List[DialogueAgent],
+        selection_function: Callable[[int, List[DialogueAgent]], int] = round_robin,
+        speculate: bool = False,
+    ) -> None:
+        self.agents = agents
+        self.select_next_speaker = selection_function
+        self.speculate = speculate
+        self.stats = DialogueStats()
+        self._stop = {agent.name: [f"\n{other.name}:" for other in agents if other is not agent]
+                      for agent in agents}
+        self._speculation: Optional[_Speculation] = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.transcript = Transcript()
+        for agent in self.agents:
+            agent.join(self.transcript)
+        self._step = 0
+        self._planned: Optional[Tuple[int, int]] = None
+        self._drop_speculation()
+
+    def inject(self, name: str, message: str) -> None:
+        """Add a ``message`` from ``name``, e.g. the start of the conversation"""
+        self.transcript.append(name, message)
+        self._step += 1
+
+    def _next_speaker(self) -> DialogueAgent:
+        if self._planned is not None and self._planned[0] == self._step:
+            index = self._planned[1]
+        else:
+            index = self.select_next_speaker(self._step, self.agents)
+        self._planned = None
+        return self.agents[index]
+
+    def _record(self, speaker: DialogueAgent, message: str) -> Tuple[str, str]:
+        self.transcript.append(speaker.name, message)
+        self._step += 1
+        self.stats.turns += 1
+        return speaker.name, message
+
+    def step(self) -> Tuple[str, str]:
+        speaker = self._next_speaker()
+        return self._record(speaker, speaker.send(self._stop[speaker.name]))
+
+    def _start(self, agent: DialogueAgent) -> "asyncio.Future[str]":
+        return asyncio.ensure_future(agent.asend(self._stop[agent.name]))
+
+    def _drop_speculation(self) -> None:
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None:
+            speculation.task.cancel()
+
+    def _take_speculation(self, speaker: DialogueAgent) -> Optional["asyncio.Future[str]"]:
+        speculation = self._speculation
+        if speculation is None:
+            return None
+        self._speculation = None
+        task = speculation.task
+        if speculation.agent is speaker and speculation.seen == len(speaker.view) \
+                and not (task.done() and (task.cancelled() or task.exception() is not None)):
+            self.stats.speculation_hits += 1
+            return task
+        task.cancel()
+        return None
+
+    def _start_speculation(self, speaker: DialogueAgent) -> None:
+        index = self.select_next_speaker(self._step + 1, self.agents)
+        self._planned = (self._step + 1, index)
+        agent = self.agents[index]
+        # The current utterance would make a reply generated now stale
+        if agent is speaker or agent.view.hears_from(speaker.name):
+            return
+        self._speculation = _Speculation(agent, len(agent.view), self._start(agent))
+        self.stats.speculated += 1
+
+    async def _astep(self, speculate: bool) -> Tuple[str, str]:
+        speaker = self._next_speaker()
+        task = self._take_speculation(speaker) or self._start(speaker)
+        if speculate:
+            self._start_speculation(speaker)
+        try:
+            message = await task
+        except BaseException:
+            task.cancel()
+            self._drop_speculation()
+            raise
+        return self._record(speaker, message)
+
+    async def astep(self) -> Tuple[str, str]:
+        return await self._astep(self.speculate)
+
+    async def aiter_turns(self, max_turns: int) -> AsyncIterator[Tuple[str, str]]:
+        """``(speaker, message)`` of the next ``max_turns`` turns as they are made"""
+        try:
+            for turn in range(max_turns):
+                # Nothing to speculate for after the last turn
+                yield await self._astep(self.speculate and turn < max_turns - 1)
+        finally:
+            self._drop_speculation()
+
+    async def arun(self, max_turns: int) -> List[Tuple[str, str]]:
+        return [turn async for turn in self.aiter_turns(max_turns)]
+
+
+async def arun_simulations(
+    simulators: Sequence[DialogueSimulator], max_turns: int, max_concurrency: Optional[int] = None
+) -> List[List[Tuple[str, str]]]:
+    """Run ``max_turns`` turns of every simulator, at most ``max_concurrency`` of them at once"""
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def run(simulator: DialogueSimulator) -> List[Tuple[str, str]]:
+        if semaphore is None:
+            return await simulator.arun(max_turns)
+        async with semaphore:
+            return await simulator.arun(max_turns)
+
+    return list(await asyncio.gather(*(run(simulator) for simulator in simulators)))
@@ -0,0 +1,353 @@
+"""GigaChat embeddings with batching and a persistent cache"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from pydantic import BaseModel, Extra, Field
+
+from .cache import LRUCache
+from .client import GigaChatClientMixin
+from .errors import raise_for_status
+from .retry import (CircuitBreaker, RetryPolicy, acall_with_retries,
+                    call_with_retries)
+from .serialization import dumps, loads
+from .transport import AsyncHTTPTransport, HTTPTransport
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_DIGEST_SIZE = 32
+_WORD = re.compile(r"\w+", re.UNICODE)
+_UNSAFE_PATH = re.compile(r"[^\w.-]")
+
+
+def hash_embedding(text: str, dimensions: int = 256) -> np.ndarray:
+    """Deterministic unit vector of the words and character trigrams of ``text``.
+
+    Texts sharing words get close vectors, which is enough to exercise
+    retrieval without a model.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        padded = f"<{word}>"
+        features = [word] + [padded[i:i + 3] for i in range(len(padded) - 2)]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % dimensions] += 1.0 if h & 0x80000000 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm:
+        vector /= norm
+    return vector
+
+
+DEFAULT_MEMORY_CACHE_SIZE = 16384
+
+
+class EmbeddingCache:
+    """Embeddings by content hash, kept in memory or in files under ``path``.
+
+    In memory the ``max_size`` most recently used vectors are kept. On disk
+    vectors are appended as raw float32 to ``vectors.f32`` and read back
+    through a memory map, keys go to ``keys.bin`` in the same order. The files
+    are shared safely by several processes. All vectors of a directory have
+    the dimensions of the first one stored, see ``meta.json``.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_size: int = DEFAULT_MEMORY_CACHE_SIZE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._dimensions: Optional[int] = None
+        self._memory: LRUCache[np.ndarray] = LRUCache(max_size)
+        self._map: Optional[np.ndarray] = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            with self._file_lock():
+                self._sync()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        with open(self._file("lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self) -> None:
+        """Pick up rows appended by other processes, drop a half-written tail"""
+        if self._dimensions is None:
+            try:
+                with open(self._file("meta.json")) as f:
+                    self._dimensions = json.load(f)["dimensions"]
+            except (OSError, ValueError, KeyError):
+                return
+        row_size = 4 * self._dimensions
+        keys_size = os.path.getsize(self._file("keys.bin")) if os.path.exists(self._file("keys.bin")) else 0
+        vectors_size = os.path.getsize(self._file("vectors.f32")) if os.path.exists(self._file("vectors.f32")) else 0
+        count = min(keys_size // _DIGEST_SIZE, vectors_size // row_size)
+        if keys_size != count * _DIGEST_SIZE:
+            os.truncate(self._file("keys.bin"), count * _DIGEST_SIZE)
+        if vectors_size != count * row_size:
+            os.truncate(self._file("vectors.f32"), count * row_size)
+        known = len(self._rows)
+        if count > known:
+            with open(self._file("keys.bin"), "rb") as f:
+                f.seek(known * _DIGEST_SIZE)
+                data = f.read((count - known) * _DIGEST_SIZE)
+            for row in range(known, count):
+                offset = (row - known) * _DIGEST_SIZE
+                self._rows.setdefault(data[offset:offset + _DIGEST_SIZE], row)
+
+    def _row(self, row: int) -> np.ndarray:
+        if self._map is None or row >= len(self._map):
+            count = os.path.getsize(self._file("vectors.f32")) // (4 * self._dimensions)
+            self._map = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                  shape=(count, self._dimensions))
+        return self._map[row]
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        if self.path is None:
+            return [self._memory.get(key) for key in keys]  # type: ignore[arg-type]
+        with self._lock:
+            rows = [self._rows.get(key) for key in keys]
+            return [None if row is None else self._row(row) for row in rows]
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.path is None:
+            for key, vector in zip(keys, vectors):
+                # A copy, a view would keep the whole batch alive
+                self._memory.set(key, vector.copy())  # type: ignore[arg-type]
+            return
+        with self._lock:
+            with self._file_lock():
+                self._sync()
+                if self._dimensions is None:
+                    self._dimensions = int(vectors.shape[1])
+                    with open(self._file("meta.json"), "w") as f:
+                        json.dump({"dimensions": self._dimensions}, f)
+                elif vectors.shape[1] != self._dimensions:
+                    raise ValueError(f"Embedding cache {self.path} holds {self._dimensions}-dimensional vectors, "
+                                     f"got {vectors.shape[1]}")
+                new = [i for i, key in enumerate(keys) if key not in self._rows]
+                if not new:
+                    return
+                start = len(self._rows)
+                # Vectors first: a crash leaves keys without vectors at worst, trimmed by the next sync
+                with open(self._file("vectors.f32"), "ab") as f:
+                    f.write(vectors[new].tobytes())
+                with open(self._file("keys.bin"), "ab") as f:
+                    f.write(b"".join(keys[i] for i in new))
+                for offset, i in enumerate(new):
+                    self._rows[keys[i]] = start + offset
+
+    def __len__(self) -> int:
+        return len(self._memory) if self.path is None else len(self._rows)
+
+
+_caches: Dict[Tuple[Optional[str], int], EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: Optional[str] = None, max_size: int = DEFAULT_MEMORY_CACHE_SIZE) -> EmbeddingCache:
+    """Return the cache shared by all embedding models using ``path``, or the in-memory one of ``max_size``"""
+    key = (os.path.abspath(path), 0) if path is not None else (None, max_size)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = EmbeddingCache(key[0], max_size)
+            _caches[key] = cache
+        return cache
+
+
+class GigaChatEmbeddings(GigaChatClientMixin, BaseModel, Embeddings):
+    """GigaChat embeddings.
+
+    Texts are deduplicated, looked up in the cache by a hash of the model and
+    the content, and only the missing ones are sent, ``batch_size`` per
+    request and up to ``max_concurrency`` requests at a time. With
+    ``cache_dir`` the cache survives restarts, so a corpus is embedded once.
+    Every model keeps its cache in its own subdirectory of ``cache_dir``.
+    """
+
+    api_url: str = Field(default="https://beta.saluteai.sberdevices.ru")
+
+    model: str = Field(default="Embeddings")
+
+    token: Optional[str] = Field(default = os.environ.get("GIGA_TOKEN", None))
+
+    user: Optional[str] = Field(default = os.environ.get("GIGA_USER", None))
+
+    password: Optional[str] = Field(default = os.environ.get("GIGA_PASSWORD", None))
+
+    token_cache_dir: Optional[str] = Field(default = os.environ.get("GIGA_TOKEN_CACHE_DIR", None))
+
+    cache_dir: Optional[str] = Field(default = os.environ.get("GIGA_EMBEDDINGS_CACHE_DIR", None))
+    """Directory of the persistent cache, the cache is kept in memory without it"""
+
+    memory_cache_size: int = Field(default=DEFAULT_MEMORY_CACHE_SIZE)
+    """Vectors kept in memory without ``cache_dir``, the least recently used ones are dropped"""
+
+    cache_queries: bool = Field(default=False)
+    """Also cache the embeddings of queries, queries are only looked up in the cache by default"""
+
+    batch_size: int = Field(default=64)
+    """Texts per request"""
+
+    max_concurrency: int = Field(default=4)
+    """Requests sent at once"""
+
+    pool_maxsize: int = Field(default=10)
+
+    connect_timeout: float = Field(default=5)
+
+    read_timeout: float = Field(default=600)
+
+    retry_policy: Optional[RetryPolicy] = Field(default_factory=RetryPolicy, exclude=True)
+
+    circuit_breaker: Optional[CircuitBreaker] = Field(default=None, exclude=True)
+
+    transport: Optional[HTTPTransport] = Field(default=None, exclude=True)
+
+    async_transport: Optional[AsyncHTTPTransport] = Field(default=None, exclude=True)
+
+    class Config:
+        extra = Extra.forbid
+        arbitrary_types_allowed = True
+
+    @property
+    def _cache_namespace(self) -> str:
+        return self.model
+
+    @staticmethod
+    def _parse(body: Dict[str, Any]) -> np.ndarray:
+        items = sorted(body["data"], key=lambda item: item["index"])
+        return np.array([item["embedding"] for item in items], dtype=np.float32)
+
+    def _post_embeddings(self, texts: List[str], budget: Optional[float] = None) -> np.ndarray:
+        response = self._post("/v1/embeddings", dumps({"model": self.model, "input": texts}), self._timeout(budget))
+        raise_for_status(response)
+        return self._parse(loads(response.content))
+
+    async def _apost_embeddings(self, texts: List[str], budget: Optional[float] = None) -> np.ndarray:
+        response = await self._apost(
+            "/v1/embeddings", dumps({"model": self.model, "input": texts}), self._timeout(budget))
+        raise_for_status(response)
+        return self._parse(loads(response.content))
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        return call_with_retries(self.retry_policy, self.circuit_breaker, partial(self._post_embeddings, texts))
+
+    async def _aembed_batch(self, texts: List[str]) -> np.ndarray:
+        return await acall_with_retries(
+            self.retry_policy, self.circuit_breaker, partial(self._apost_embeddings, texts))
+
+    def _keys(self, texts: Sequence[str]) -> List[bytes]:
+        prefix = self._cache_namespace.encode("utf-8") + b"\0"
+        return [hashlib.sha256(prefix + text.encode("utf-8")).digest() for text in texts]
+
+    def _cache(self) -> EmbeddingCache:
+        if self.cache_dir is None:
+            return get_embedding_cache(None, self.memory_cache_size)
+        # Models with different dimensions can't share the files of one cache
+        return get_embedding_cache(os.path.join(self.cache_dir, _UNSAFE_PATH.sub("_", self._cache_namespace)))
+
+    def _lookup(
+        self, texts: List[str]
+    ) -> Tuple[List[bytes], Dict[bytes, str], Dict[bytes, np.ndarray], List[List[bytes]]]:
+        """Keys of ``texts``, unique texts and cached vectors by key, and the batches to send for the others"""
+        keys = self._keys(texts)
+        unique: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            unique.setdefault(key, text)
+        found = {key: vector for key, vector in zip(unique, self._cache().get_many(list(unique)))
+                 if vector is not None}
+        missing = [key for key in unique if key not in found]
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        return keys, unique, found, batches
+
+    def _embed(self, texts: List[str], store: bool) -> List[List[float]]:
+        keys, unique, found, batches = self._lookup(texts)
+
+        def embed(batch: List[bytes]) -> None:
+            vectors = self._embed_batch([unique[key] for key in batch])
+            if store:
+                self._cache().put_many(batch, vectors)
+            found.update(zip(batch, vectors))
+
+        if len(batches) == 1:
+            embed(batches[0])
+        elif batches:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                list(executor.map(embed, batches))
+        return [found[key].tolist() for key in keys]
+
+    async def _aembed(self, texts: List[str], store: bool) -> List[List[float]]:
+        keys, unique, found, batches = self._lookup(texts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed(batch: List[bytes]) -> None:
+            async with semaphore:
+                vectors = await self._aembed_batch([unique[key] for key in batch])
+            if store:
+                cache = self._cache()
+                if cache.path is None:
+                    cache.put_many(batch, vectors)
+                else:
+                    # Waits for the file lock and writes, not on the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, cache.put_many, batch, vectors)
+            found.update(zip(batch, vectors))
+
+        await asyncio.gather(*(embed(batch) for batch in batches))
+        return [found[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, store=True)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed(texts, store=True)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], store=self.cache_queries)[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._aembed([text], store=self.cache_queries))[0]
+
+
+class LocalEmbeddings(GigaChatEmbeddings):
+    """Offline stand-in for :class:`GigaChatEmbeddings` built on :func:`hash_embedding`.
+
+    Deterministic across runs and machines, for tests and examples without
+    access to the service. Batching and caching work as with the real model.
+    """
+
+    dimensions: int = Field(default=256)
+
+    @property
+    def _cache_namespace(self) -> str:
+        return f"local-hash-{self.dimensions}"
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        return np.stack([hash_embedding(text, self.dimensions) for text in texts])
+
+    async def _aembed_batch(self, texts: List[str]) -> np.ndarray:
+        return self._embed_batch(texts)
@@ -0,0 +1,84 @@
+"""Exceptions raised by the GigaChat client"""
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Mapping, Optional
+
+
+class GigaChatError(ValueError):
+    """Base class for GigaChat errors.
+
+    Derived from ``ValueError`` because that is what the client has always raised.
+    """
+
+
+class AuthenticationError(GigaChatError):
+    """Credentials are missing or were rejected by the service"""
+
+
+class ResponseError(GigaChatError):
+    """The service answered with an error status"""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"Error raised by the service: {status_code} {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitError(ResponseError):
+    """Request was throttled (HTTP 429)"""
+
+
+class ServiceUnavailableError(ResponseError):
+    """Service is overloaded or down (HTTP 502, 503, 504)"""
+
+
+def _parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    if not headers:
+        return None
+    value = headers.get("Retry-After")
+    if value is None:
+        # Plain dicts keep the spelling of the server
+        value = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_from_status(
+    status_code: int, message: str, headers: Optional[Mapping[str, str]] = None
+) -> GigaChatError:
+    """Build the exception matching an HTTP error status"""
+    message = message[:500]
+    if status_code == 401:
+        return AuthenticationError(f"GigaChat rejected the access token: {message}")
+    retry_after = _parse_retry_after(headers)
+    if status_code == 429:
+        return RateLimitError(status_code, message, retry_after)
+    if status_code in (502, 503, 504):
+        return ServiceUnavailableError(status_code, message, retry_after)
+    return ResponseError(status_code, message, retry_after)
+
+
+def raise_for_status(response: Any) -> None:
+    """Raise a classified error for a failed ``requests``-like response"""
+    if response.status_code >= 400:
+        raise error_from_status(response.status_code, response.text, response.headers)
+
+
+class CircuitOpenError(GigaChatError):
+    """Request was not sent because the circuit breaker is open"""
+
+
+class DeadlineExceededError(GigaChatError):
+    """Request was not sent because its deadline passed while it was waiting"""
+
+
+class RequestCancelledError(GigaChatError):
+    """Request was abandoned by the client, e.g. the slower one of a hedged pair"""
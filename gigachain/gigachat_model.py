@@ -1,23 +1,59 @@
 """GigaChatModel for GigaChat"""
 import os
 import logging
-from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+import random
+import time
+from contextlib import (AsyncExitStack, ExitStack, asynccontextmanager,
+                        contextmanager)
+from functools import partial
+from typing import (Any, AsyncIterable, AsyncIterator, Dict, Iterable,
+                    Iterator, List, Optional, Tuple, Union)
 
-import requests
 from langchain.callbacks.manager import (AsyncCallbackManagerForLLMRun,
                                          CallbackManagerForLLMRun)
 from langchain.chat_models.base import SimpleChatModel
-from langchain.schema.messages import (AIMessage, AIMessageChunk, BaseMessage,
-                                       ChatMessage, FunctionMessage,
-                                       HumanMessage, SystemMessage)
-from langchain.schema.output import ChatGenerationChunk
+from langchain.schema.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain.schema.output import (ChatGeneration, ChatGenerationChunk,
+                                     ChatResult)
 from pydantic import Field
 
+from .balancer import LoadBalancer, get_balancer
+from .batch import BatchResult, aiter_batch, iter_batch
+from .cache import ResponseCache, make_body_key
+from .capture import TrafficRecorder
+from .client import GigaChatClientMixin
+from .coalesce import get_single_flight
+from .errors import GigaChatError, error_from_status, raise_for_status
+from .metrics import (Metrics, RequestTrace, activate, current_trace,
+                      record_phase, timed)
+from .ratelimit import RateLimiter, alimit_request, limit_request
+from .retry import (CircuitBreaker, RetryPolicy, acall_with_retries,
+                    call_with_retries)
+from .scheduler import (INTERACTIVE, RequestScheduler, aschedule_request,
+                        get_default_scheduler, schedule_request)
+from .semantic_cache import SemanticCache, SemanticLookup
+from .serialization import encode_payload, loads, message_to_dict
+from .streaming import (StopSequenceMatcher, StreamMetrics,
+                        aiter_sse_events, iter_sse_events, parse_stream_chunk,
+                        truncate_at_stop)
+from .tokenizer import MESSAGE_OVERHEAD, TokenCounter, get_token_counter
+from .transport import AsyncHTTPTransport, HTTPTransport
 
-class GigaChatModel(SimpleChatModel):
+
+class GigaChatModel(GigaChatClientMixin, SimpleChatModel):
     """GigaChatModel for GigaChat"""
 
-    api_url: Optional[str] = Field(default="https://beta.saluteai.sberdevices.ru")
+    api_url: Optional[Union[str, List[str]]] = Field(default="https://beta.saluteai.sberdevices.ru")
+    """API address, or a list of gateways to balance requests between"""
+
+    routing_policy: str = Field(default="round_robin")
+    """How to choose between several gateways: round_robin, least_outstanding or ewma"""
+
+    balancer: Optional[LoadBalancer] = Field(default=None, exclude=True)
+    """Load balancer for several gateways, pass one explicitly to enable hedging"""
+
+    health_check_interval: Optional[float] = Field(default=None)
+    """Seconds between probes of every gateway, failing ones are ejected; None disables the probes"""
 
     model: Optional[str] = Field(default="GigaChat:v1.13.0")
 
@@ -26,13 +62,82 @@ class GigaChatModel(SimpleChatModel):
     temperature: Optional[float] = Field(default=0)
 
     token: Optional[str] = Field(default = os.environ.get("GIGA_TOKEN", None))
+    """Static access token, used when no user and password are given"""
 
     user: Optional[str] = Field(default = os.environ.get("GIGA_USER", None))
 
     password: Optional[str] = Field(default = os.environ.get("GIGA_PASSWORD", None))
 
+    token_cache_dir: Optional[str] = Field(default = os.environ.get("GIGA_TOKEN_CACHE_DIR", None))
+    """Directory for a token file shared by worker processes of the same user"""
+
     verbose: Optional[bool] = Field(default=False)
 
+    streaming: bool = Field(default=False)
+    """Whether to stream the response token by token"""
+
+    pool_maxsize: int = Field(default=10)
+    """Maximum number of keep-alive connections to the API"""
+
+    connect_timeout: float = Field(default=5)
+
+    read_timeout: float = Field(default=600)
+
+    transport: Optional[HTTPTransport] = Field(default=None, exclude=True)
+    """HTTP transport, shared between models with the same api_url by default"""
+
+    max_concurrency: int = Field(default=64)
+    """Maximum number of in-flight async requests"""
+
+    async_transport: Optional[AsyncHTTPTransport] = Field(default=None, exclude=True)
+
+    response_cache: Optional[ResponseCache] = Field(default=None, exclude=True)
+    """Cache of responses keyed by the request payload, used only at temperature 0"""
+
+    semantic_cache: Optional[SemanticCache] = Field(default=None, exclude=True)
+    """Cache of responses to requests of the same meaning, consulted after ``response_cache``"""
+
+    coalesce_requests: bool = Field(default=True)
+    """Send identical concurrent requests once, only at temperature 0"""
+
+    rate_limiter: Optional[RateLimiter] = Field(default=None, exclude=True)
+    """Client-side limiter, share one instance between models using the same quota"""
+
+    scheduler: Optional[RequestScheduler] = Field(default=None, exclude=True)
+    """Priority queue in front of the API, the process default set with ``set_default_scheduler`` if None"""
+
+    priority: int = Field(default=INTERACTIVE)
+    """Scheduling priority of the requests, lower numbers are sent first"""
+
+    tenant: Optional[str] = Field(default=None)
+    """Scheduling tenant, tenants of a priority get turns"""
+
+    retry_policy: Optional[RetryPolicy] = Field(default_factory=RetryPolicy, exclude=True)
+    """Retries of transient failures, None to send every request once.
+
+    Its ``deadline`` is also the deadline of the request in the scheduler."""
+
+    circuit_breaker: Optional[CircuitBreaker] = Field(default=None, exclude=True)
+    """Fails fast while the API is down, share one instance between models of an endpoint"""
+
+    metrics: Optional[Metrics] = Field(default=None, exclude=True)
+    """Receives the trace of every request, share one instance between models"""
+
+    log_sample_rate: float = Field(default=1.0)
+    """Share of requests logged, at INFO level with verbose and at DEBUG otherwise"""
+
+    traffic_recorder: Optional[TrafficRecorder] = Field(default=None, exclude=True)
+    """Captures every request with its answer and trace for replay, see :mod:`gigachain.capture`"""
+
+    tokenizer_path: Optional[str] = Field(default = os.environ.get("GIGA_TOKENIZER_PATH", None))
+    """GigaChat vocabulary in the HuggingFace ``tokenizer.json`` format, counts are estimated without it"""
+
+    approximate_token_count: bool = Field(default=False)
+    """Estimate token counts even with a vocabulary, several times faster"""
+
+    message_token_overhead: int = Field(default=MESSAGE_OVERHEAD)
+    """Tokens counted for the markup of every message by ``get_num_tokens_from_messages``"""
+
     logger = logging.getLogger(__name__)
 
     @property
@@ -41,46 +146,399 @@ class GigaChatModel(SimpleChatModel):
 
     @classmethod
     def transform_output(cls, response: Any) -> str:
-        return response.json()["choices"][0]['message']['content']
+        return loads(response.content)["choices"][0]['message']['content']
 
     @classmethod
     def convert_message_to_dict(cls, message: BaseMessage) -> dict:
-        message_dict: Dict[str, Any]
-        if isinstance(message, ChatMessage):
-            message_dict = {"role": message.role, "content": message.content}
-        elif isinstance(message, HumanMessage):
-            message_dict = {"role": "user", "content": message.content}
-        elif isinstance(message, AIMessage):
-            message_dict = {"role": "assistant", "content": message.content}
-            if "function_call" in message.additional_kwargs:
-                message_dict["function_call"] = message.additional_kwargs["function_call"]
-                # If function call only, content is None not empty string
-                if message_dict["content"] == "":
-                    message_dict["content"] = None
-        elif isinstance(message, SystemMessage):
-            message_dict = {"role": "system", "content": message.content}
-        elif isinstance(message, FunctionMessage):
-            message_dict = {
-                "role": "function",
-                "content": message.content,
-                "name": message.name,
-            }
+        return message_to_dict(message)
+
+    def _get_balancer(self) -> Optional[LoadBalancer]:
+        if self.balancer is None and not isinstance(self.api_url, str) and len(self.api_url) > 1:
+            self.balancer = get_balancer(
+                self.api_url, self.routing_policy, self.pool_maxsize, self.max_concurrency,
+                self.connect_timeout, self.read_timeout, self.health_check_interval)
+        return self.balancer
+
+    def _get_scheduler(self) -> Optional[RequestScheduler]:
+        return self.scheduler if self.scheduler is not None else get_default_scheduler()
+
+    def _build_payload(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        message_dicts = [message_to_dict(m) for m in messages]
+        return {"model": self.model,
+                "profanity_check": self.profanity,
+                "temperature": self.temperature,
+                "messages": message_dicts}
+
+    @staticmethod
+    def _start_attempt() -> Optional[RequestTrace]:
+        trace = current_trace()
+        if trace is not None:
+            trace.attempts += 1
+        return trace
+
+    def _post_chat(
+        self,
+        payload: Dict[str, Any],
+        budget: Optional[float] = None,
+        api_url: Optional[str] = None,
+        data: Optional[bytes] = None,
+    ) -> Dict[str, Any]:
+        """Send ``payload`` (already encoded as ``data`` if given) to one endpoint once and return the body"""
+        timeout = self._timeout(budget)
+        trace = self._start_attempt()
+        if data is None:
+            with timed("encode"):
+                data = encode_payload(payload)
+        queued = time.perf_counter()
+        with schedule_request(self._get_scheduler(), self.priority, self.tenant, budget), \
+                limit_request(self.rate_limiter, payload) as permit:
+            record_phase("queue", time.perf_counter() - queued)
+            response = self._post("/v1/chat/completions", data, timeout, api_url)
+            permit.status_code = response.status_code
+            if trace is not None:
+                trace.status_code = response.status_code
+            raise_for_status(response)
+            with timed("decode"):
+                body = loads(response.content)
+            permit.tokens = (body.get("usage") or {}).get("total_tokens")
+        return body
+
+    async def _apost_chat(
+        self,
+        payload: Dict[str, Any],
+        budget: Optional[float] = None,
+        api_url: Optional[str] = None,
+        data: Optional[bytes] = None,
+    ) -> Dict[str, Any]:
+        timeout = self._timeout(budget)
+        trace = self._start_attempt()
+        if data is None:
+            with timed("encode"):
+                data = encode_payload(payload)
+        queued = time.perf_counter()
+        async with aschedule_request(self._get_scheduler(), self.priority, self.tenant, budget), \
+                alimit_request(self.rate_limiter, payload) as permit:
+            record_phase("queue", time.perf_counter() - queued)
+            response = await self._apost("/v1/chat/completions", data, timeout, api_url)
+            permit.status_code = response.status_code
+            if trace is not None:
+                trace.status_code = response.status_code
+            raise_for_status(response)
+            with timed("decode"):
+                body = loads(response.content)
+            permit.tokens = (body.get("usage") or {}).get("total_tokens")
+        return body
+
+    @contextmanager
+    def _open_chat_stream(
+        self, payload: Dict[str, Any], budget: Optional[float] = None, api_url: Optional[str] = None
+    ) -> Iterator[Any]:
+        transport = self._get_transport(api_url)
+        timeout = self._timeout(budget)
+        trace = self._start_attempt()
+        with timed("encode"):
+            data = encode_payload(payload)
+        queued = time.perf_counter()
+        with schedule_request(self._get_scheduler(), self.priority, self.tenant, budget), \
+                limit_request(self.rate_limiter, payload) as permit:
+            record_phase("queue", time.perf_counter() - queued)
+            with timed("auth"):
+                token = self._get_token(api_url)
+            with transport.stream(
+                "POST", "/v1/chat/completions", headers=self._headers(token), data=data, timeout=timeout
+            ) as response:
+                if response.status_code != 401 or not self._reauthorize(token, api_url):
+                    permit.status_code = response.status_code
+                    if trace is not None:
+                        trace.status_code = response.status_code
+                    raise_for_status(response)
+                    permit.first_byte()
+                    yield response
+                    return
+            with timed("auth"):
+                token = self._get_token(api_url)
+            with transport.stream(
+                "POST", "/v1/chat/completions", headers=self._headers(token), data=data, timeout=timeout
+            ) as response:
+                permit.status_code = response.status_code
+                if trace is not None:
+                    trace.status_code = response.status_code
+                raise_for_status(response)
+                permit.first_byte()
+                yield response
+
+    @asynccontextmanager
+    async def _aopen_chat_stream(
+        self, payload: Dict[str, Any], budget: Optional[float] = None, api_url: Optional[str] = None
+    ) -> AsyncIterator[Any]:
+        transport = self._get_async_transport(api_url)
+        timeout = self._timeout(budget)
+        trace = self._start_attempt()
+        with timed("encode"):
+            data = encode_payload(payload)
+        queued = time.perf_counter()
+        async with aschedule_request(self._get_scheduler(), self.priority, self.tenant, budget), \
+                alimit_request(self.rate_limiter, payload) as permit:
+            record_phase("queue", time.perf_counter() - queued)
+            with timed("auth"):
+                token = await self._aget_token(api_url)
+            async with transport.stream(
+                "POST", "/v1/chat/completions", headers=self._headers(token), data=data, timeout=timeout
+            ) as response:
+                if response.status != 401 or not self._reauthorize(token, api_url):
+                    permit.status_code = response.status
+                    if trace is not None:
+                        trace.status_code = response.status
+                    if response.status >= 400:
+                        raise error_from_status(response.status, await response.text(), response.headers)
+                    permit.first_byte()
+                    yield response
+                    return
+            with timed("auth"):
+                token = await self._aget_token(api_url)
+            async with transport.stream(
+                "POST", "/v1/chat/completions", headers=self._headers(token), data=data, timeout=timeout
+            ) as response:
+                permit.status_code = response.status
+                if trace is not None:
+                    trace.status_code = response.status
+                if response.status >= 400:
+                    raise error_from_status(response.status, await response.text(), response.headers)
+                permit.first_byte()
+                yield response
+
+    def _send_chat(
+        self, payload: Dict[str, Any], budget: Optional[float] = None, data: Optional[bytes] = None
+    ) -> Dict[str, Any]:
+        """Send ``payload`` once, choosing the endpoint when there are several"""
+        balancer = self._get_balancer()
+        if balancer is None:
+            return self._post_chat(payload, budget, data=data)
+        return balancer.call(lambda endpoint: self._post_chat(payload, budget, endpoint.api_url, data))
+
+    async def _asend_chat(
+        self, payload: Dict[str, Any], budget: Optional[float] = None, data: Optional[bytes] = None
+    ) -> Dict[str, Any]:
+        balancer = self._get_balancer()
+        if balancer is None:
+            return await self._apost_chat(payload, budget, data=data)
+        return await balancer.acall(lambda endpoint: self._apost_chat(payload, budget, endpoint.api_url, data))
+
+    @contextmanager
+    def _open_routed_stream(self, payload: Dict[str, Any], budget: Optional[float] = None) -> Iterator[Any]:
+        balancer = self._get_balancer()
+        if balancer is None:
+            with self._open_chat_stream(payload, budget) as response:
+                yield response
+            return
+        with balancer.track(balancer.choose()) as endpoint:
+            with self._open_chat_stream(payload, budget, endpoint.api_url) as response:
+                yield response
+
+    @asynccontextmanager
+    async def _aopen_routed_stream(
+        self, payload: Dict[str, Any], budget: Optional[float] = None
+    ) -> AsyncIterator[Any]:
+        balancer = self._get_balancer()
+        if balancer is None:
+            async with self._aopen_chat_stream(payload, budget) as response:
+                yield response
+            return
+        with balancer.track(balancer.choose()) as endpoint:
+            async with self._aopen_chat_stream(payload, budget, endpoint.api_url) as response:
+                yield response
+
+    def _coalesces(self) -> bool:
+        # At other temperatures identical requests are expected to get different answers
+        return self.coalesce_requests and self.temperature == 0
+
+    def _get_response_cache(self) -> Optional[ResponseCache]:
+        # A cached sample would be returned for every later request, sampled answers are expected to differ
+        return self.response_cache if self.temperature == 0 else None
+
+    def _encode_keyed(self, payload: Dict[str, Any]) -> Tuple[Optional[bytes], Optional[str]]:
+        """Request body and its hash when the response cache or coalescing needs a key.
+
+        The body is encoded from the memoized message fragments and sent as
+        it is, so the key costs one hash of the body and no second encoding.
+        """
+        if self._get_response_cache() is None and not self._coalesces():
+            return None, None
+        with timed("encode"):
+            data = encode_payload(payload)
+        return data, make_body_key(data)
+
+    def _flight_key(self, key: str) -> str:
+        return f"{self.api_url}\n{key}"
+
+    @staticmethod
+    def _mark_coalesced() -> None:
+        trace = current_trace()
+        if trace is not None:
+            trace.coalesced = True
+
+    # The semantic cache embeds every request, an embedding outage makes it miss instead of failing the chat
+    def _semantic_lookup(self, payload: Dict[str, Any]) -> Optional[SemanticLookup]:
+        if self.semantic_cache is None:
+            return None
+        try:
+            return self.semantic_cache.lookup(payload)
+        except Exception:
+            self.logger.warning("Semantic cache lookup failed, sending the request", exc_info=True)
+            return None
+
+    async def _asemantic_lookup(self, payload: Dict[str, Any]) -> Optional[SemanticLookup]:
+        if self.semantic_cache is None:
+            return None
+        try:
+            return await self.semantic_cache.alookup(payload)
+        except Exception:
+            self.logger.warning("Semantic cache lookup failed, sending the request", exc_info=True)
+            return None
+
+    def _semantic_update(self, lookup: SemanticLookup, body: Dict[str, Any]) -> None:
+        try:
+            self.semantic_cache.update(lookup, body)
+        except Exception:
+            self.logger.warning("Semantic cache update failed", exc_info=True)
+
+    def _chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the response body for ``payload``, from the cache when possible"""
+        cache = self._get_response_cache()
+        data, key = self._encode_keyed(payload)
+        if cache is not None:
+            body = cache.get(key)
+            if body is not None:
+                trace = current_trace()
+                if trace is not None:
+                    trace.cache_hit = True
+                return body
+        lookup = self._semantic_lookup(payload)
+        if lookup is not None and lookup.body is not None:
+            trace = current_trace()
+            if trace is not None:
+                trace.cache_hit = True
+            return lookup.body
+        attempt = partial(self._send_chat, payload, data=data)
+        send = partial(call_with_retries, self.retry_policy, self.circuit_breaker, attempt)
+        if not self._coalesces():
+            body = send()
         else:
-            raise TypeError(f"Got unknown type {message}")
-        if "name" in message.additional_kwargs:
-            message_dict["name"] = message.additional_kwargs["name"]
-        return message_dict
-    
-    def _authorize(self):
-        if self.user is None or self.password is None:
-            raise ValueError("Can't authorize to GigaChat. Please provide GIGA_USER and GIGA_PASSWORD environment variables")
-        
-        response = requests.request("POST", self.api_url + "/v1/token", auth=(self.user, self.password), data=[], timeout=3)
-        if not response.ok:
-            raise ValueError("Can't authorize to GigaChat. Error code: " + str(response.status_code))
-        
-        self.token = response.json()["tok"]
+            body, shared = get_single_flight().do(self._flight_key(key), send)
+            if shared:
+                self._mark_coalesced()
+                return body
+        if cache is not None:
+            cache.set(key, body)
+        if lookup is not None:
+            self._semantic_update(lookup, body)
+        return body
+
+    async def _achat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        cache = self._get_response_cache()
+        data, key = self._encode_keyed(payload)
+        if cache is not None:
+            body = cache.get(key)
+            if body is not None:
+                trace = current_trace()
+                if trace is not None:
+                    trace.cache_hit = True
+                return body
+        lookup = await self._asemantic_lookup(payload)
+        if lookup is not None and lookup.body is not None:
+            trace = current_trace()
+            if trace is not None:
+                trace.cache_hit = True
+            return lookup.body
+        attempt = partial(self._asend_chat, payload, data=data)
+        send = partial(acall_with_retries, self.retry_policy, self.circuit_breaker, attempt)
+        if not self._coalesces():
+            body = await send()
+        else:
+            body, shared = await get_single_flight().ado(self._flight_key(key), send)
+            if shared:
+                self._mark_coalesced()
+                return body
+        if cache is not None:
+            cache.set(key, body)
+        if lookup is not None:
+            self._semantic_update(lookup, body)
+        return body
+
+    def _end_trace(
+        self,
+        trace: RequestTrace,
+        started: float,
+        payload: Dict[str, Any],
+        answer: Optional[str] = None,
+        error: Optional[BaseException] = None,
+        stop: Optional[List[str]] = None,
+    ) -> None:
+        trace.duration = time.perf_counter() - started
+        if error is not None:
+            trace.error = type(error).__name__
+        if self.metrics is not None:
+            self.metrics.observe(trace)
+        if self.traffic_recorder is not None:
+            self.traffic_recorder.record(payload, answer, trace, stop, self._primary_url)
+        self._log_request(trace, payload, answer)
 
+    def _log_request(self, trace: RequestTrace, payload: Dict[str, Any], answer: Optional[str]) -> None:
+        # Arguments are only formatted when a record is emitted, a disabled logger costs two checks
+        level = logging.INFO if self.verbose else logging.DEBUG
+        if not self.logger.isEnabledFor(level):
+            return
+        if self.log_sample_rate < 1 and random.random() >= self.log_sample_rate:
+            return
+        self.logger.log(level, "Giga request: %s, response: %r, trace: %s", payload, answer, trace)
+
+    def _create_chat_result(
+        self, body: Dict[str, Any], trace: RequestTrace, stop: Optional[List[str]] = None
+    ) -> ChatResult:
+        choice = body["choices"][0]
+        # Cached bodies are kept whole, they may be requested with other stop sequences
+        generation = ChatGeneration(
+            message=AIMessage(content=truncate_at_stop(choice["message"]["content"], stop)),
+            generation_info={"finish_reason": choice.get("finish_reason")},
+        )
+        trace.set_usage(body.get("usage"))
+        llm_output = {"token_usage": body.get("usage") or {}, "model_name": self.model}
+        return ChatResult(generations=[generation], llm_output=llm_output)
+
+    def _complete(self, messages: List[BaseMessage], stop: Optional[List[str]] = None) -> ChatResult:
+        """Answer ``messages`` with a single completion, instrumented"""
+        payload = self._build_payload(messages)
+        trace = RequestTrace()
+        started = time.perf_counter()
+        try:
+            with activate(trace):
+                body = self._chat(payload)
+            result = self._create_chat_result(body, trace, stop)
+        except Exception as error:
+            self._end_trace(trace, started, payload, error=error, stop=stop)
+            if isinstance(error, GigaChatError):
+                raise
+            raise ValueError(f"Error raised by the service: {error}")
+        self._end_trace(trace, started, payload, result.generations[0].text, stop=stop)
+        result.llm_output["trace"] = trace.as_dict()
+        return result
+
+    async def _acomplete(self, messages: List[BaseMessage], stop: Optional[List[str]] = None) -> ChatResult:
+        payload = self._build_payload(messages)
+        trace = RequestTrace()
+        started = time.perf_counter()
+        try:
+            with activate(trace):
+                body = await self._achat(payload)
+            result = self._create_chat_result(body, trace, stop)
+        except Exception as error:
+            self._end_trace(trace, started, payload, error=error, stop=stop)
+            if isinstance(error, GigaChatError):
+                raise
+            raise ValueError(f"Error raised by the service: {error}")
+        self._end_trace(trace, started, payload, result.generations[0].text, stop=stop)
+        result.llm_output["trace"] = trace.as_dict()
+        return result
 
     def _call(
         self,
@@ -89,39 +547,83 @@ class GigaChatModel(SimpleChatModel):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> str:
-        if self.token is None or self.token == "":
-            self._authorize()
+        return self._complete(messages, stop).generations[0].text
 
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.token}'
-        }
+    async def _acall(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return (await self._acomplete(messages, stop)).generations[0].text
 
-        message_dicts = [self.convert_message_to_dict(m) for m in messages]
-        payload = {"model": self.model,
-                   "profanity_check": self.profanity,
-                   "messages": message_dicts}
-        try:
-            if self.verbose:
-                print(f"Giga request (p): {payload}")
-                self.logger.info(f"Giga request: {payload}")
-
-            response = requests.post(
-                self.api_url + "/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=600
-            )
-            text = self.transform_output(response)
-            
-            if self.verbose:
-                print(f"Giga response (p): {text}")
-                self.logger.info(f"Giga response: {text}")
+    @staticmethod
+    def _stream_result(generation: ChatGenerationChunk) -> ChatResult:
+        info = generation.generation_info or {}
+        llm_output = {"token_usage": info.get("token_usage") or {}, "model_name": info.get("model_name"),
+                      "trace": info.get("trace")}
+        return ChatResult(generations=[generation], llm_output=llm_output)
 
-        except Exception as error:
-            raise ValueError(f"Error raised by the service: {error}")
-        return text
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            generation: Optional[ChatGenerationChunk] = None
+            for chunk in self._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                generation = chunk if generation is None else generation + chunk
+            assert generation is not None
+            return self._stream_result(generation)
+        return self._complete(messages, stop)
 
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            generation: Optional[ChatGenerationChunk] = None
+            async for chunk in self._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                generation = chunk if generation is None else generation + chunk
+            assert generation is not None
+            return self._stream_result(generation)
+        return await self._acomplete(messages, stop)
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        token_usage: Dict[str, int] = {}
+        traces = []
+        for output in llm_outputs:
+            if output is None:
+                continue
+            for key, value in (output.get("token_usage") or {}).items():
+                if isinstance(value, int):
+                    token_usage[key] = token_usage.get(key, 0) + value
+            traces.append(output.get("trace"))
+        return {"token_usage": token_usage, "model_name": self.model, "traces": traces}
+
+    def _final_stream_chunk(
+        self,
+        metrics: StreamMetrics,
+        trace: RequestTrace,
+        payload: Dict[str, Any],
+        usage: Optional[Dict[str, Any]],
+        received: Optional[List[str]] = None,
+        stop: Optional[List[str]] = None,
+    ) -> ChatGenerationChunk:
+        """Finish the trace of a stream and build the empty last chunk carrying metrics and usage"""
+        trace.time_to_first_token = metrics.time_to_first_token
+        trace.set_usage(usage)
+        self._end_trace(trace, metrics.started, payload, "".join(received) if received is not None else None,
+                        stop=stop)
+        info = {**metrics.as_dict(), "token_usage": usage or {}, "model_name": self.model,
+                "trace": trace.as_dict()}
+        return ChatGenerationChunk(message=AIMessageChunk(content=""), generation_info=info)
 
     def _stream(
         self,
@@ -130,8 +632,58 @@ class GigaChatModel(SimpleChatModel):
         run_manager: Union[CallbackManagerForLLMRun, None] = None,
         **kwargs: Any,
     ) -> Iterator[ChatGenerationChunk]:
-        yield ChatGenerationChunk(message=AIMessageChunk(content="Async is not supported yet"))
-
+        payload = self._build_payload(messages)
+        payload["stream"] = True
+        metrics = StreamMetrics()
+        trace = RequestTrace(streamed=True)
+        usage = None
+        matcher = StopSequenceMatcher(stop) if stop else None
+        # The answer is only kept for the traffic capture
+        received: Optional[List[str]] = [] if self.traffic_recorder is not None else None
+        try:
+            with ExitStack() as stack:
+                # Only opening the stream is retried, a broken stream can't be resumed.
+                # The trace is active just for that, a context variable must not span a yield
+                with activate(trace):
+                    response = call_with_retries(
+                        self.retry_policy, self.circuit_breaker,
+                        lambda budget: stack.enter_context(self._open_routed_stream(payload, budget)))
+                chunks = response.iter_content(chunk_size=None)
+                stopped = False
+                for event in iter_sse_events(chunks):
+                    content, event_usage = parse_stream_chunk(event)
+                    usage = event_usage or usage
+                    if matcher is not None and content:
+                        content, stopped = matcher.feed(content)
+                    if content:
+                        metrics.on_token()
+                        if received is not None:
+                            received.append(content)
+                        if run_manager:
+                            run_manager.on_llm_new_token(content)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=content))
+                    if stopped:
+                        # Abort the generation, the rest of the answer would be thrown away
+                        response.close()
+                        break
+                else:
+                    tail = matcher.flush() if matcher is not None else ""
+                    if tail:
+                        metrics.on_token()
+                        if received is not None:
+                            received.append(tail)
+                        if run_manager:
+                            run_manager.on_llm_new_token(tail)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=tail))
+                    # Read the end of the body after [DONE], otherwise the connection is dropped instead of reused
+                    for _ in chunks:
+                        pass
+        except Exception as error:
+            trace.time_to_first_token = metrics.time_to_first_token
+            self._end_trace(trace, metrics.started, payload, "".join(received) if received is not None else None,
+                            error, stop)
+            raise
+        yield self._final_stream_chunk(metrics, trace, payload, usage, received, stop)
 
     async def _astream(
         self,
@@ -140,8 +692,97 @@ class GigaChatModel(SimpleChatModel):
         run_manager: Union[AsyncCallbackManagerForLLMRun, None] = None,
         **kwargs: Any,
     ) -> AsyncIterator[ChatGenerationChunk]:
-        yield ChatGenerationChunk(message=AIMessageChunk(content="Async is not supported yet"))
+        payload = self._build_payload(messages)
+        payload["stream"] = True
+        metrics = StreamMetrics()
+        trace = RequestTrace(streamed=True)
+        usage = None
+        matcher = StopSequenceMatcher(stop) if stop else None
+        # The answer is only kept for the traffic capture
+        received: Optional[List[str]] = [] if self.traffic_recorder is not None else None
+        try:
+            async with AsyncExitStack() as stack:
+                with activate(trace):
+                    response = await acall_with_retries(
+                        self.retry_policy, self.circuit_breaker,
+                        lambda budget: stack.enter_async_context(self._aopen_routed_stream(payload, budget)))
+                stopped = False
+                async for event in aiter_sse_events(response.content.iter_any()):
+                    content, event_usage = parse_stream_chunk(event)
+                    usage = event_usage or usage
+                    if matcher is not None and content:
+                        content, stopped = matcher.feed(content)
+                    if content:
+                        metrics.on_token()
+                        if received is not None:
+                            received.append(content)
+                        if run_manager:
+                            await run_manager.on_llm_new_token(content)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=content))
+                    if stopped:
+                        response.close()
+                        break
+                else:
+                    tail = matcher.flush() if matcher is not None else ""
+                    if tail:
+                        metrics.on_token()
+                        if received is not None:
+                            received.append(tail)
+                        if run_manager:
+                            await run_manager.on_llm_new_token(tail)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=tail))
+                    await response.read()
+        except Exception as error:
+            trace.time_to_first_token = metrics.time_to_first_token
+            self._end_trace(trace, metrics.started, payload, "".join(received) if received is not None else None,
+                            error, stop)
+            raise
+        yield self._final_stream_chunk(metrics, trace, payload, usage, received, stop)
+
+    def batch_chat(
+        self,
+        inputs: Iterable[List[BaseMessage]],
+        max_workers: int = 8,
+        ordered: bool = True,
+    ) -> Iterator[BatchResult]:
+        """Answer many conversations in a thread pool, see :func:`gigachain.batch.iter_batch`"""
+        return iter_batch(self, inputs, max_workers=max_workers, ordered=ordered)
+
+    def abatch_chat(
+        self,
+        inputs: Union[Iterable[List[BaseMessage]], AsyncIterable[List[BaseMessage]]],
+        max_workers: int = 64,
+        ordered: bool = True,
+    ) -> AsyncIterator[BatchResult]:
+        """Answer many conversations on the event loop, see :func:`gigachain.batch.aiter_batch`"""
+        return aiter_batch(self.apredict_messages, inputs, max_workers=max_workers, ordered=ordered)
+
+    def _get_token_counter(self) -> TokenCounter:
+        return get_token_counter(self.tokenizer_path, self.approximate_token_count)
+
+    def get_token_ids(self, text: str) -> List[int]:
+        """GigaChat token ids with a vocabulary, the GPT-2 ids of the base implementation otherwise"""
+        counter = self._get_token_counter()
+        if not counter.has_vocabulary:
+            return super().get_token_ids(text)
+        return counter.encode(text)
+
+    def get_num_tokens(self, text: str) -> int:
+        return self._get_token_counter().count(text)
+
+    def get_num_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Token counts of many strings at once"""
+        return self._get_token_counter().count_batch(texts)
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
+        counts = self.get_num_tokens_batch([message.content for message in messages])
+        return sum(counts) + self.message_token_overhead * len(messages)
 
     @property
     def _identifying_params(self) -> Dict[str, Any]:
-        return {}
+        return {
+            "api_url": self.api_url,
+            "model": self.model,
+            "profanity": self.profanity,
+            "temperature": self.temperature,
+        }
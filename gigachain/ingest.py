@@ -0,0 +1,227 @@
+"""Streaming ingestion of large text corpora into a vector store.
+
+Files are read in blocks cut at paragraph boundaries, blocks are split into
+token-sized chunks in a process pool, and chunks are embedded and indexed in
+batches by a writer thread. Every stage holds a bounded number of items, so
+memory does not grow with the corpus, only the index does::
+
+    store = NumpyVectorStore(GigaChatEmbeddings(cache_dir="embeddings"))
+    stats = IngestionPipeline(store, chunk_tokens=500).run(["corpus/"])
+"""
+import glob
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores.base import VectorStore
+
+from .tokenizer import get_token_counter
+
+
+def iter_files(paths: Iterable[str], pattern: str = "**/*.txt") -> Iterator[str]:
+    """Files of ``paths``, directories are searched recursively for ``pattern``"""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.iglob(os.path.join(path, pattern), recursive=True))
+        else:
+            yield path
+
+
+def iter_blocks(path: str, block_chars: int = 1 << 20, encoding: str = "utf-8") -> Iterator[str]:
+    """Read ``path`` in blocks of about ``block_chars`` characters ending at a paragraph boundary"""
+    tail = ""
+    with open(path, encoding=encoding, errors="replace") as f:
+        while True:
+            data = f.read(block_chars)
+            if not data:
+                break
+            text = tail + data
+            cut = text.rfind("\n\n")
+            if cut <= 0:
+                cut = text.rfind("\n")
+            if cut <= 0:
+                # No line breaks at all, cut anywhere rather than hold the whole file
+                if len(text) < 4 * block_chars:
+                    tail = text
+                    continue
+                cut = len(text)
+            yield text[:cut]
+            tail = text[cut:]
+    if tail.strip():
+        yield tail
+
+
+def split_block(
+    text: str,
+    chunk_tokens: int,
+    chunk_overlap: int = 0,
+    tokenizer_path: Optional[str] = None,
+    approximate: bool = False,
+) -> List[str]:
+    """Split ``text`` into chunks of at most ``chunk_tokens`` GigaChat tokens, runs in worker processes"""
+    counter = get_token_counter(tokenizer_path, approximate)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens, chunk_overlap=chunk_overlap, length_function=counter.count)
+    return splitter.split_text(text)
+
+
+class _InlineExecutor(Executor):
+    """Runs submitted calls right away, for ``workers=0``"""
+
+    def submit(self, fn, *args, **kwargs):  # type: ignore[override]
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+        return future
+
+
+@dataclass
+class IngestionStats:
+    files: int = 0
+    blocks: int = 0
+    chunks: int = 0
+    characters: int = 0
+    duration: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.duration if self.duration else 0.0
+
+
+class IngestionPipeline:
+    """Reads, splits, embeds and indexes text files with bounded memory.
+
+    Splitting runs in ``workers`` processes (in the calling process with 0),
+    at most ``max_pending_blocks`` blocks of ``block_chars`` characters ahead
+    of the consumer. Chunks are added to ``vectorstore`` with
+    ``add_documents`` in batches of ``batch_size`` by a writer thread, while
+    the next batches are being split. When embedding is the bottleneck, at
+    most ``max_pending_batches`` batches wait for it and reading stops.
+
+    Token counts use the GigaChat vocabulary at ``tokenizer_path`` when given,
+    an estimate otherwise, see :class:`gigachain.tokenizer.TokenCounter`.
+    """
+
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        chunk_tokens: int = 500,
+        chunk_overlap: int = 0,
+        tokenizer_path: Optional[str] = None,
+        approximate_tokens: bool = False,
+        workers: Optional[int] = None,
+        block_chars: int = 1 << 20,
+        batch_size: int = 256,
+        max_pending_blocks: Optional[int] = None,
+        max_pending_batches: int = 2,
+        encoding: str = "utf-8",
+    ):
+        self.vectorstore = vectorstore
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.tokenizer_path = tokenizer_path
+        self.approximate_tokens = approximate_tokens
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.block_chars = block_chars
+        self.batch_size = batch_size
+        self.max_pending_blocks = max_pending_blocks or 2 * max(1, self.workers)
+        self.max_pending_batches = max_pending_batches
+        self.encoding = encoding
+
+    def _executor(self) -> Executor:
+        if self.workers <= 0:
+            return _InlineExecutor()
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    def iter_documents(self, paths: Iterable[str], stats: Optional[IngestionStats] = None) -> Iterator[Document]:
+        """Chunks of the files in ``paths`` as documents, in file order"""
+        stats = stats if stats is not None else IngestionStats()
+        executor = self._executor()
+
+        def blocks() -> Iterator[Tuple[str, str]]:
+            for path in iter_files(paths):
+                stats.files += 1
+                for block in iter_blocks(path, self.block_chars, self.encoding):
+                    stats.blocks += 1
+                    stats.characters += len(block)
+                    yield path, block
+
+        source = blocks()
+        pending: Deque[Tuple[str, Future]] = deque()
+
+        def submit() -> bool:
+            item = next(source, None)
+            if item is None:
+                return False
+            path, block = item
+            pending.append((path, executor.submit(
+                split_block, block, self.chunk_tokens, self.chunk_overlap,
+                self.tokenizer_path, self.approximate_tokens)))
+            return True
+
+        counters: Dict[str, int] = {}
+        try:
+            while len(pending) < self.max_pending_blocks and submit():
+                pass
+            while pending:
+                path, future = pending.popleft()
+                chunks = future.result()
+                submit()
+                for chunk in chunks:
+                    index = counters.get(path, 0)
+                    counters[path] = index + 1
+                    stats.chunks += 1
+                    yield Document(page_content=chunk, metadata={"source": path, "chunk": index})
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def run(self, paths: Iterable[str]) -> IngestionStats:
+        """Index every file of ``paths``, see :func:`iter_files`"""
+        stats = IngestionStats()
+        started = time.perf_counter()
+        batches: "queue.Queue[Optional[List[Document]]]" = queue.Queue(self.max_pending_batches)
+        errors: List[BaseException] = []
+
+        def write() -> None:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                if errors:
+                    continue  # drain, so the reader never blocks on a dead writer
+                try:
+                    self.vectorstore.add_documents(batch)
+                except BaseException as error:
+                    errors.append(error)
+
+        writer = threading.Thread(target=write, name="gigachain-ingest-writer", daemon=True)
+        writer.start()
+        try:
+            batch: List[Document] = []
+            for document in self.iter_documents(paths, stats):
+                batch.append(document)
+                if len(batch) >= self.batch_size:
+                    batches.put(batch)
+                    batch = []
+                    if errors:
+                        break
+            if batch and not errors:
+                batches.put(batch)
+        finally:
+            batches.put(None)
+            writer.join()
+        if errors:
+            raise errors[0]
+        stats.duration = time.perf_counter() - started
+        return stats
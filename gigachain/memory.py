@@ -0,0 +1,186 @@
+"""Conversation memory that keeps requests within a token budget"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import (Any, Callable, Deque, Dict, List, Optional, Sequence,
+                    Tuple, Type)
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.schema import BaseMessage, BasePromptTemplate, SystemMessage
+from langchain.schema.language_model import BaseLanguageModel
+from langchain.schema.messages import get_buffer_string
+from pydantic import PrivateAttr
+
+from .prompts import SUMMARY_STUFF_PROMPT
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBudgetMemory(BaseChatMemory):
+    """Keeps recent turns verbatim and folds older ones into a rolling summary.
+
+    Messages are kept as they are while they fit into ``max_token_limit``
+    tokens. Older ones are evicted and summarized by ``llm`` with
+    ``summary_prompt`` together with the previous summary. Token counts are
+    computed once per message and kept as a running total.
+
+    Summarization runs in a background thread, evicted messages are returned
+    verbatim until their summary is ready. A turn only waits for it when
+    evicted messages pile up beyond another ``max_token_limit`` tokens, so the
+    size of the history stays bounded even if the summarizer is slow. When
+    the summarizer fails, the oldest evicted messages beyond that budget are
+    dropped without a summary.
+
+    Works with the in-memory message history, messages are evicted from the
+    front of ``chat_memory.messages``.
+    """
+
+    llm: BaseLanguageModel
+    """Model writing the summary, may be a cheaper one than the chat model"""
+
+    summary_prompt: BasePromptTemplate = SUMMARY_STUFF_PROMPT
+    """Prompt with a ``text`` variable: the previous summary and the evicted turns"""
+
+    max_token_limit: int = 2000
+    """Budget of the verbatim part of the history"""
+
+    token_counter: Optional[Callable[[str], int]] = None
+    """Counts tokens of a message, ``llm.get_num_tokens`` by default"""
+
+    memory_key: str = "history"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    summary: str = ""
+    summary_message_cls: Type[BaseMessage] = SystemMessage
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _counts: Deque[int] = PrivateAttr(default_factory=deque)
+    _buffer_tokens: int = PrivateAttr(default=0)
+    _pending: List[Tuple[BaseMessage, int]] = PrivateAttr(default_factory=list)
+    _pending_tokens: int = PrivateAttr(default=0)
+    _future: Optional[Future] = PrivateAttr(default=None)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def buffer_tokens(self) -> int:
+        """Tokens of the messages kept verbatim"""
+        return self._buffer_tokens
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """History to send: the summary, messages being summarized and recent messages"""
+        with self._lock:
+            messages: List[BaseMessage] = []
+            if self.summary:
+                messages.append(self.summary_message_cls(content=self.summary))
+            messages.extend(message for message, _ in self._pending)
+            messages.extend(self.chat_memory.messages)
+        return messages
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self.messages
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(
+            messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self.prune()
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Append messages outside of a chain"""
+        for message in messages:
+            self.chat_memory.add_message(message)
+        self.prune()
+
+    def _count_tokens(self, message: BaseMessage) -> int:
+        counter = self.token_counter or self.llm.get_num_tokens
+        return counter(message.content)
+
+    def prune(self) -> None:
+        """Evict messages beyond the budget and schedule their summarization"""
+        with self._lock:
+            messages = self.chat_memory.messages
+            for message in messages[len(self._counts):]:
+                tokens = self._count_tokens(message)
+                self._counts.append(tokens)
+                self._buffer_tokens += tokens
+            # Keep at least the last exchange verbatim
+            while self._buffer_tokens > self.max_token_limit and len(messages) > 2:
+                tokens = self._counts.popleft()
+                self._pending.append((messages.pop(0), tokens))
+                self._buffer_tokens -= tokens
+                self._pending_tokens += tokens
+            backlog = self._future if self._pending_tokens > self.max_token_limit else None
+        if backlog is not None:
+            wait_futures([backlog])
+        self._schedule()
+
+    def _schedule(self) -> None:
+        with self._lock:
+            self._schedule_locked()
+
+    def _schedule_locked(self) -> None:
+        if self._future is not None or not self._pending:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gigachat-memory")
+        batch = list(self._pending)
+        self._future = self._executor.submit(self._compact, batch, self.summary)
+
+    def _compact(self, batch: List[Tuple[BaseMessage, int]], summary: str) -> None:
+        text = get_buffer_string(
+            [message for message, _ in batch], human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        if summary:
+            text = summary + "\n" + text
+        try:
+            new_summary = self.llm.predict(self.summary_prompt.format(text=text))
+        except Exception as error:
+            # The turns stay verbatim, the next prune tries again
+            logger.warning("Failed to summarize conversation history: %s", error)
+            with self._lock:
+                self._future = None
+                self._truncate_pending_locked()
+            return
+        with self._lock:
+            self.summary = new_summary.strip()
+            del self._pending[:len(batch)]
+            self._pending_tokens -= sum(tokens for _, tokens in batch)
+            self._future = None
+            # Turns evicted meanwhile go into the next summary
+            self._schedule_locked()
+
+    def _truncate_pending_locked(self) -> None:
+        dropped = 0
+        while self._pending_tokens > self.max_token_limit:
+            _, tokens = self._pending.pop(0)
+            self._pending_tokens -= tokens
+            dropped += 1
+        if dropped:
+            logger.warning("Dropped %d oldest messages of the history without a summary", dropped)
+
+    def wait(self) -> None:
+        """Block until every evicted message is summarized"""
+        while True:
+            with self._lock:
+                future = self._future
+            if future is None:
+                return
+            wait_futures([future])
+
+    def clear(self) -> None:
+        self.wait()
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self._counts.clear()
+            self._buffer_tokens = 0
+            self._pending.clear()
+            self._pending_tokens = 0
@@ -0,0 +1,303 @@
+"""Per-request instrumentation of GigaChat calls.
+
+Every chat request gets a :class:`RequestTrace` that the transports and the
+model fill in: time per phase, attempts, cache hits and token usage. The trace
+ends up in ``llm_output`` and, with a :class:`Metrics` hook, in
+Prometheus-style counters and histograms.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+PHASES = ("encode", "queue", "pool_wait", "auth", "connect", "time_to_first_byte", "body_read", "decode")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class RequestTrace:
+    """What happened during one chat request, over all of its attempts"""
+
+    timings: Dict[str, float] = field(default_factory=dict)
+    """Seconds spent per phase, see :data:`PHASES`"""
+
+    duration: float = 0.0
+    attempts: int = 0
+    cache_hit: bool = False
+    coalesced: bool = False
+    """Answered by an identical request of another caller"""
+
+    streamed: bool = False
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    time_to_first_token: Optional[float] = None
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.attempts - 1)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def set_usage(self, usage: Optional[Mapping[str, Any]]) -> None:
+        if not usage:
+            return
+        self.prompt_tokens = usage.get("prompt_tokens")
+        self.completion_tokens = usage.get("completion_tokens")
+        self.total_tokens = usage.get("total_tokens")
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = asdict(self)
+        result["retries"] = self.retries
+        return result
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("gigachat_request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """Trace of the request being sent in this thread or task, if any"""
+    return _current.get()
+
+
+@contextmanager
+def activate(trace: RequestTrace) -> Iterator[RequestTrace]:
+    """Make ``trace`` current for the block, must not span a ``yield`` of a generator"""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def untraced() -> Iterator[None]:
+    """Hide the current trace for the block"""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+
+def phase_total(phase: str) -> float:
+    trace = _current.get()
+    return trace.timings.get(phase, 0.0) if trace is not None else 0.0
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Add the time spent in the block to ``phase`` of the current trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Mapping[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self) -> Dict[str, float]:
+        return {_format_labels(key) or "total": value for key, value in self._values.items()}
+
+
+class Gauge:
+    """Value that goes up and down, with labels"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[_label_key(labels)] = value
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self) -> Dict[str, float]:
+        return {_format_labels(key) or "total": value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Histogram with fixed cumulative buckets and labels"""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: counts per bucket (the last one is +Inf), sum
+        self._values: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(_label_key(labels))
+        return sum(entry[0]) if entry is not None else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            _format_labels(key) or "total": {"count": sum(counts), "sum": total[0]}
+            for key, (counts, total) in self._values.items()
+        }
+
+
+class Metrics:
+    """Prometheus-style counters and histograms fed with finished request traces.
+
+    Share one instance between models and expose :meth:`render` on a
+    ``/metrics`` endpoint, or subclass it and override :meth:`observe` to
+    forward traces to another metrics system.
+    """
+
+    def __init__(self, namespace: str = "gigachat", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.requests = Counter(f"{namespace}_requests_total", "Chat requests by outcome")
+        self.retries = Counter(f"{namespace}_retries_total", "Repeated attempts of chat requests")
+        self.cache_hits = Counter(f"{namespace}_cache_hits_total", "Chat requests answered from the cache")
+        self.coalesced = Counter(
+            f"{namespace}_coalesced_total", "Chat requests answered by an identical request in flight")
+        self.tokens = Counter(f"{namespace}_tokens_total", "Tokens reported by the service")
+        self.duration = Histogram(
+            f"{namespace}_request_duration_seconds", "Chat request duration including retries", buckets)
+        self.phases = Histogram(
+            f"{namespace}_phase_duration_seconds", "Time spent per phase of a chat request", buckets)
+        self.first_token = Histogram(
+            f"{namespace}_time_to_first_token_seconds", "Time to the first streamed token", buckets)
+        self.queue_depth = Gauge(f"{namespace}_scheduler_queue_depth", "Requests waiting in the scheduler")
+        self.queue_wait = Histogram(
+            f"{namespace}_scheduler_wait_seconds", "Time requests waited in the scheduler", buckets)
+        self.expired = Counter(
+            f"{namespace}_scheduler_expired_total", "Requests dropped at their deadline before being sent")
+
+    def observe(self, trace: RequestTrace) -> None:
+        if trace.cache_hit:
+            outcome = "cache"
+        elif trace.coalesced:
+            outcome = "coalesced"
+        elif trace.error is not None:
+            outcome = trace.error
+        else:
+            outcome = str(trace.status_code)
+        stream = "true" if trace.streamed else "false"
+        with self._lock:
+            self.requests.inc(outcome=outcome, stream=stream)
+            self.duration.observe(trace.duration, stream=stream)
+            if trace.cache_hit:
+                self.cache_hits.inc()
+                return
+            if trace.coalesced:
+                # The tokens and phases were spent by the request it shared
+                self.coalesced.inc()
+                return
+            if trace.retries:
+                self.retries.inc(trace.retries)
+            for phase, seconds in trace.timings.items():
+                self.phases.observe(seconds, phase=phase)
+            if trace.prompt_tokens:
+                self.tokens.inc(trace.prompt_tokens, kind="prompt")
+            if trace.completion_tokens:
+                self.tokens.inc(trace.completion_tokens, kind="completion")
+            if trace.time_to_first_token is not None:
+                self.first_token.observe(trace.time_to_first_token)
+
+    def set_queue_depth(self, depth: int, priority: int) -> None:
+        with self._lock:
+            self.queue_depth.set(depth, priority=priority)
+
+    def observe_queue_wait(self, seconds: float, priority: int, expired: bool = False) -> None:
+        """Time a request waited in the scheduler until it was sent or dropped"""
+        with self._lock:
+            self.queue_wait.observe(seconds, priority=priority)
+            if expired:
+                self.expired.inc(priority=priority)
+
+    def _metrics(self) -> Tuple[Any, ...]:
+        return (self.requests, self.retries, self.cache_hits, self.coalesced, self.tokens,
+                self.duration, self.phases, self.first_token, self.queue_depth, self.queue_wait, self.expired)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines: List[str] = []
+            for metric in self._metrics():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {metric.name: metric.snapshot() for metric in self._metrics()}
@@ -13,3 +13,23 @@ QA_PROMPT = ChatPromptTemplate.from_messages([
 
 SUMMARY_STUFF_PROMPT = PromptTemplate(
     template="""Напиши краткое (не более 100 слов) содержимое следующего текста: "{text}". Теперь перескажи тот текст очень кратко.""", input_variables=["text"])
+
+CHECKER_DRAFT_ANSWER_PROMPT = PromptTemplate(
+    template="""{question}\n\n""", input_variables=["question"])
+
+CHECKER_LIST_ASSERTIONS_PROMPT = PromptTemplate(
+    template="""Прочти утверждение:
+{statement}
+Составь список аргументов, которые подтверждают приведенное выше утверждение. Каждый аргумент пиши с новой строки.\n\n""",
+    input_variables=["statement"])
+
+CHECKER_CHECK_ASSERTION_PROMPT = PromptTemplate(
+    template="""Вот предположение:
+{assertion}
+Определи, верно оно или нет. Если нет - объясни почему.\n\n""", input_variables=["assertion"])
+
+CHECKER_REVISED_ANSWER_PROMPT = PromptTemplate(
+    template="""{checked_assertions}
+
+В свете приведенных выше утверждений и проверок, как бы Вы ответили на вопрос {question}""",
+    input_variables=["checked_assertions", "question"])
@@ -0,0 +1,255 @@
+"""Client-side rate limiting and adaptive concurrency control"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """Rough prompt size in tokens, used to charge the tokens-per-minute bucket up front"""
+    chars = sum(len(message.get("content") or "") for message in payload.get("messages", ()))
+    return chars // 3 + 1
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` units per second.
+
+    Callers reserve units and sleep for the returned delay, so the bucket may go
+    into debt and waiting callers are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Take ``amount`` units and return how long to wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or additionally charge (negative) units after the fact"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def acquire(self, amount: float = 1) -> None:
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, amount: float = 1) -> None:
+        delay = self.reserve(amount)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the number of requests in flight.
+
+    Each healthy response raises the limit by ``increase / limit`` (about
+    ``increase`` per round of requests). A throttled response or a latency
+    above ``latency_tolerance`` times the running baseline multiplies it by
+    ``decrease_factor``, at most once per observed round trip. Sync and async
+    callers can share one limiter.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        increase: float = 1.0,
+        decrease_factor: float = 0.7,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._throttled = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._in_flight < int(self._limit):
+                    self._in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        """Return a slot and feed the outcome of the request into the limit"""
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            spike = (latency is not None and self._baseline is not None
+                     and latency > self._baseline * self.latency_tolerance)
+            if overloaded or spike:
+                if overloaded:
+                    self._throttled += 1
+                cooldown = self._baseline or 0.1
+                if now - self._last_decrease > cooldown:
+                    self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif latency is not None:
+                self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+            if latency is not None and not overloaded:
+                self._baseline = latency if self._baseline is None else 0.95 * self._baseline + 0.05 * latency
+
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "baseline_latency": self._baseline,
+                "throttled": self._throttled,
+            }
+
+
+def _wake(waiter: "asyncio.Future[None]") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+@dataclass
+class Permit:
+    """Outcome of a limited request, filled in by the caller"""
+
+    estimated_tokens: int
+    status_code: Optional[int] = None
+    tokens: Optional[int] = None
+    """Actual token usage reported by the service"""
+
+    started: float = field(default_factory=time.perf_counter)
+
+    latency: Optional[float] = None
+    """Latency reported to the concurrency limiter, the time the permit is held by default"""
+
+    def first_byte(self) -> None:
+        """Take the latency now, for a stream whose length depends on the answer and not on the load"""
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.started
+
+
+class RateLimiter:
+    """Shared client-side limiter for the GigaChat request path.
+
+    Combines a requests-per-second bucket, a tokens-per-minute bucket and an
+    adaptive concurrency limit. Any of them can be disabled. Pass the same
+    instance to every model that uses one quota.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        concurrency: Optional[AdaptiveConcurrencyLimiter] = None,
+        adaptive: bool = True,
+    ):
+        self.requests = TokenBucket(requests_per_second) if requests_per_second else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        if concurrency is None and adaptive:
+            concurrency = AdaptiveConcurrencyLimiter()
+        self.concurrency = concurrency
+
+    def _finish(self, permit: Permit, failed: bool) -> None:
+        if self.tokens is not None and permit.tokens is not None:
+            self.tokens.adjust(permit.estimated_tokens - permit.tokens)
+        if self.concurrency is not None:
+            overloaded = permit.status_code in OVERLOAD_STATUS_CODES
+            # Transport failures say nothing about latency, only release the slot
+            latency = None
+            if not failed or overloaded:
+                latency = permit.latency if permit.latency is not None else time.perf_counter() - permit.started
+            self.concurrency.release(latency, overloaded)
+
+    @contextmanager
+    def limit(self, estimated_tokens: int = 0) -> Iterator[Permit]:
+        if self.requests is not None:
+            self.requests.acquire()
+        if self.tokens is not None and estimated_tokens:
+            self.tokens.acquire(estimated_tokens)
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+        permit = Permit(estimated_tokens)
+        failed = True
+        try:
+            yield permit
+            failed = False
+        finally:
+            self._finish(permit, failed)
+
+    @asynccontextmanager
+    async def alimit(self, estimated_tokens: int = 0) -> AsyncIterator[Permit]:
+        if self.requests is not None:
+            await self.requests.aacquire()
+        if self.tokens is not None and estimated_tokens:
+            await self.tokens.aacquire(estimated_tokens)
+        if self.concurrency is not None:
+            await self.concurrency.aacquire()
+        permit = Permit(estimated_tokens)
+        failed = True
+        try:
+            yield permit
+            failed = False
+        finally:
+            self._finish(permit, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.concurrency.stats() if self.concurrency is not None else {}
+
+
+@contextmanager
+def limit_request(limiter: Optional[RateLimiter], payload: Dict[str, Any]) -> Iterator[Permit]:
+    """Hold ``limiter`` for one chat request, a no-op without a limiter"""
+    if limiter is None:
+        yield Permit(0)
+        return
+    with limiter.limit(estimate_tokens(payload)) as permit:
+        yield permit
+
+
+@asynccontextmanager
+async def alimit_request(limiter: Optional[RateLimiter], payload: Dict[str, Any]) -> AsyncIterator[Permit]:
+    if limiter is None:
+        yield Permit(0)
+        return
+    async with limiter.alimit(estimate_tokens(payload)) as permit:
+        yield permit
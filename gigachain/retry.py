@@ -0,0 +1,223 @@
+"""Retries with exponential backoff and a circuit breaker for GigaChat requests"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+import aiohttp
+import requests
+
+from .errors import CircuitOpenError, GigaChatError, ResponseError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+TRANSIENT_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class RetryPolicy:
+    """When and how long to wait before repeating a failed request.
+
+    Only transient failures are retried: connection errors, timeouts and the
+    statuses in ``retry_statuses``. Chat completions have no side effects, so
+    repeating them is safe. The delay grows exponentially from ``backoff_base``
+    up to ``backoff_max`` with full jitter, a ``Retry-After`` header overrides
+    it. ``deadline`` bounds the total time of all attempts including waits.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30,
+        jitter: bool = True,
+        deadline: Optional[float] = None,
+        retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504),
+        respect_retry_after: bool = True,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retry_statuses = retry_statuses
+        self.respect_retry_after = respect_retry_after
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, ResponseError):
+            return error.status_code in self.retry_statuses
+        if isinstance(error, GigaChatError):
+            return False
+        return isinstance(error, TRANSIENT_EXCEPTIONS)
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Delay before attempt number ``attempt + 1``"""
+        retry_after = getattr(error, "retry_after", None)
+        if self.respect_retry_after and retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class CircuitBreaker:
+    """Fails fast while the endpoint is down.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    requests are rejected with :class:`CircuitOpenError` for
+    ``recovery_timeout`` seconds. Then a single probe request is let through,
+    its success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return "half-open"
+            return "open"
+
+    @staticmethod
+    def is_failure(error: BaseException) -> bool:
+        """Whether ``error`` says the endpoint is unhealthy"""
+        if isinstance(error, ResponseError):
+            return error.status_code >= 500
+        return isinstance(error, TRANSIENT_EXCEPTIONS)
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.recovery_timeout or self._probing:
+                raise CircuitOpenError("GigaChat circuit breaker is open, the endpoint is failing")
+            self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning("Opening GigaChat circuit breaker after %d failures", self._failures)
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def record_neutral(self) -> None:
+        """Finish a request whose outcome says nothing about endpoint health"""
+        with self._lock:
+            self._probing = False
+
+
+def _remaining(policy: Optional[RetryPolicy], started: float) -> Optional[float]:
+    if policy is None or policy.deadline is None:
+        return None
+    return policy.deadline - (time.monotonic() - started)
+
+
+def _on_error(
+    policy: Optional[RetryPolicy],
+    breaker: Optional[CircuitBreaker],
+    error: BaseException,
+    attempt: int,
+    started: float,
+) -> Optional[float]:
+    """Account a failed attempt, return the delay before the next one or None to give up"""
+    if breaker is not None:
+        if CircuitBreaker.is_failure(error):
+            breaker.record_failure()
+        else:
+            breaker.record_neutral()
+    if policy is None or attempt >= policy.max_attempts or not policy.is_retryable(error):
+        return None
+    delay = policy.backoff(attempt, error)
+    remaining = _remaining(policy, started)
+    if remaining is not None and delay >= remaining:
+        return None
+    logger.debug("GigaChat request failed (%s), retry %d in %.2fs", error, attempt, delay)
+    return delay
+
+
+def call_with_retries(
+    policy: Optional[RetryPolicy],
+    breaker: Optional[CircuitBreaker],
+    fn: Callable[[Optional[float]], T],
+) -> T:
+    """Call ``fn(time_budget)`` until it succeeds or ``policy`` gives up.
+
+    ``time_budget`` is what is left of the policy deadline, ``fn`` should not
+    wait for the service longer than that.
+    """
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = fn(_remaining(policy, started))
+        except Exception as error:
+            delay = _on_error(policy, breaker, error, attempt, started)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        except BaseException:
+            # A cancelled attempt says nothing about the endpoint, it must not leave the probe taken
+            if breaker is not None:
+                breaker.record_neutral()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def acall_with_retries(
+    policy: Optional[RetryPolicy],
+    breaker: Optional[CircuitBreaker],
+    fn: Callable[[Optional[float]], Awaitable[T]],
+) -> T:
+    """Async version of :func:`call_with_retries`"""
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await fn(_remaining(policy, started))
+        except Exception as error:
+            delay = _on_error(policy, breaker, error, attempt, started)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # A cancelled attempt says nothing about the endpoint, it must not leave the probe taken
+            if breaker is not None:
+                breaker.record_neutral()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
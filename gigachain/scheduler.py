@@ -0,0 +1,300 @@
+"""Priority and fair-share scheduling of GigaChat requests.
+
+All models of a process can send through one :class:`RequestScheduler`
+that caps the number of requests in flight. Waiting requests are served by
+priority, and within a priority round-robin by tenant, so a tenant with a
+thousand queued batch requests does not delay the others::
+
+    set_default_scheduler(RequestScheduler(max_concurrency=16))
+    chat = GigaChatModel(priority=INTERACTIVE, tenant="chat")
+    jobs = GigaChatModel(priority=BATCH, tenant="summaries")
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Deque, Dict, Iterator, Optional
+
+from .errors import DeadlineExceededError
+from .ratelimit import _wake
+
+if TYPE_CHECKING:
+    from .metrics import Metrics
+
+INTERACTIVE = 0
+BATCH = 10
+
+DEFAULT_TENANT = "default"
+
+
+class _Waiter:
+    __slots__ = ("priority", "tenant", "deadline", "enqueued", "granted", "expired", "event", "loop", "future")
+
+    def __init__(self, priority: int, tenant: str, deadline: Optional[float]):
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.expired = False
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: "Optional[asyncio.Future[None]]" = None
+
+
+@dataclass
+class SchedulerStats:
+    max_concurrency: int
+    in_flight: int
+    queued: Dict[int, int] = field(default_factory=dict)
+    """Waiting requests per priority"""
+
+    queued_by_tenant: Dict[str, int] = field(default_factory=dict)
+    dispatched: Dict[int, int] = field(default_factory=dict)
+    expired: Dict[int, int] = field(default_factory=dict)
+    """Requests dropped at their deadline before being sent, per priority"""
+
+    wait_time: Dict[int, float] = field(default_factory=dict)
+    """Total seconds dispatched requests waited, per priority"""
+
+    max_wait_time: Dict[int, float] = field(default_factory=dict)
+
+    def mean_wait_time(self, priority: int) -> float:
+        count = self.dispatched.get(priority, 0)
+        return self.wait_time.get(priority, 0.0) / count if count else 0.0
+
+
+class RequestScheduler:
+    """Admits at most ``max_concurrency`` requests at a time, the others wait.
+
+    A free slot goes to the waiting request of the lowest ``priority``
+    number. Within a priority tenants take turns, one request each, and the
+    requests of a tenant keep their order. Lower priorities wait as long as
+    higher ones are queued.
+
+    A request still waiting at its ``deadline`` (a :func:`time.monotonic`
+    value) is dropped with :class:`DeadlineExceededError` instead of being
+    sent. Sync and async callers can share one scheduler.
+    """
+
+    def __init__(self, max_concurrency: int = 8, metrics: Optional["Metrics"] = None):
+        self.max_concurrency = max_concurrency
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        self._in_flight = 0
+        self._stats = SchedulerStats(max_concurrency, 0)
+
+    # --- queues, called with the lock held ---
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        tenants = self._queues.setdefault(waiter.priority, OrderedDict())
+        tenants.setdefault(waiter.tenant, deque()).append(waiter)
+        self._count_queued(waiter, 1)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        tenants = self._queues[waiter.priority]
+        queue = tenants[waiter.tenant]
+        queue.remove(waiter)
+        if not queue:
+            del tenants[waiter.tenant]
+            if not tenants:
+                del self._queues[waiter.priority]
+        self._count_queued(waiter, -1)
+
+    def _pop(self) -> Optional[_Waiter]:
+        if not self._queues:
+            return None
+        priority = min(self._queues)
+        tenants = self._queues[priority]
+        tenant, queue = next(iter(tenants.items()))
+        waiter = queue.popleft()
+        if queue:
+            tenants.move_to_end(tenant)
+        else:
+            del tenants[tenant]
+            if not tenants:
+                del self._queues[priority]
+        self._count_queued(waiter, -1)
+        return waiter
+
+    def _count_queued(self, waiter: _Waiter, delta: int) -> None:
+        stats = self._stats
+        depth = stats.queued.get(waiter.priority, 0) + delta
+        stats.queued[waiter.priority] = depth
+        stats.queued_by_tenant[waiter.tenant] = stats.queued_by_tenant.get(waiter.tenant, 0) + delta
+        if not stats.queued_by_tenant[waiter.tenant]:
+            del stats.queued_by_tenant[waiter.tenant]
+        if self.metrics is not None:
+            self.metrics.set_queue_depth(depth, waiter.priority)
+
+    def _grant(self, waiter: _Waiter) -> None:
+        waiter.granted = True
+        self._in_flight += 1
+        waited = time.monotonic() - waiter.enqueued
+        stats = self._stats
+        stats.dispatched[waiter.priority] = stats.dispatched.get(waiter.priority, 0) + 1
+        stats.wait_time[waiter.priority] = stats.wait_time.get(waiter.priority, 0.0) + waited
+        stats.max_wait_time[waiter.priority] = max(stats.max_wait_time.get(waiter.priority, 0.0), waited)
+        if self.metrics is not None:
+            self.metrics.observe_queue_wait(waited, waiter.priority)
+
+    def _expire(self, waiter: _Waiter) -> None:
+        waiter.expired = True
+        self._stats.expired[waiter.priority] = self._stats.expired.get(waiter.priority, 0) + 1
+        if self.metrics is not None:
+            self.metrics.observe_queue_wait(time.monotonic() - waiter.enqueued, waiter.priority, expired=True)
+
+    @staticmethod
+    def _notify(waiter: _Waiter) -> None:
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        while self._in_flight < self.max_concurrency:
+            waiter = self._pop()
+            if waiter is None:
+                return
+            if waiter.deadline is not None and waiter.deadline <= now:
+                self._expire(waiter)
+            else:
+                self._grant(waiter)
+            self._notify(waiter)
+
+    def _try_grant(self, waiter: _Waiter) -> bool:
+        """Grant right away when nothing is queued and a slot is free, queue ``waiter`` otherwise"""
+        if self._in_flight < self.max_concurrency and not self._queues:
+            self._grant(waiter)
+            return True
+        self._enqueue(waiter)
+        return False
+
+    # --- public API ---
+
+    def acquire(self, priority: int = INTERACTIVE, tenant: str = DEFAULT_TENANT,
+                deadline: Optional[float] = None) -> None:
+        """Wait for a slot, raises :class:`DeadlineExceededError` when ``deadline`` passes first"""
+        waiter = _Waiter(priority, tenant, deadline)
+        waiter.event = threading.Event()
+        with self._lock:
+            if self._try_grant(waiter):
+                return
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted and not waiter.expired:
+                    self._remove(waiter)
+                    self._expire(waiter)
+        if waiter.expired:
+            raise DeadlineExceededError(f"Request waited {time.monotonic() - waiter.enqueued:.3f}s "
+                                        f"in the scheduler and missed its deadline")
+
+    async def aacquire(self, priority: int = INTERACTIVE, tenant: str = DEFAULT_TENANT,
+                       deadline: Optional[float] = None) -> None:
+        waiter = _Waiter(priority, tenant, deadline)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        with self._lock:
+            if self._try_grant(waiter):
+                return
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not waiter.granted and not waiter.expired:
+                    self._remove(waiter)
+                    self._expire(waiter)
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._release_locked()
+                elif not waiter.expired:
+                    self._remove(waiter)
+            raise
+        if waiter.expired:
+            raise DeadlineExceededError(f"Request waited {time.monotonic() - waiter.enqueued:.3f}s "
+                                        f"in the scheduler and missed its deadline")
+
+    def _release_locked(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    def release(self) -> None:
+        with self._lock:
+            self._release_locked()
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE, tenant: str = DEFAULT_TENANT,
+             deadline: Optional[float] = None) -> Iterator[None]:
+        self.acquire(priority, tenant, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = INTERACTIVE, tenant: str = DEFAULT_TENANT,
+                    deadline: Optional[float] = None) -> AsyncIterator[None]:
+        await self.aacquire(priority, tenant, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> SchedulerStats:
+        with self._lock:
+            stats = self._stats
+            return SchedulerStats(
+                max_concurrency=self.max_concurrency, in_flight=self._in_flight,
+                queued={p: n for p, n in stats.queued.items() if n}, queued_by_tenant=dict(stats.queued_by_tenant),
+                dispatched=dict(stats.dispatched), expired=dict(stats.expired), wait_time=dict(stats.wait_time),
+                max_wait_time=dict(stats.max_wait_time))
+
+
+_default_scheduler: Optional[RequestScheduler] = None
+
+
+def set_default_scheduler(scheduler: Optional[RequestScheduler]) -> None:
+    """Send the requests of every model without its own scheduler through ``scheduler``"""
+    global _default_scheduler
+    _default_scheduler = scheduler
+
+
+def get_default_scheduler() -> Optional[RequestScheduler]:
+    return _default_scheduler
+
+
+def _deadline(budget: Optional[float]) -> Optional[float]:
+    return None if budget is None else time.monotonic() + budget
+
+
+@contextmanager
+def schedule_request(
+    scheduler: Optional[RequestScheduler], priority: int, tenant: Optional[str], budget: Optional[float]
+) -> Iterator[None]:
+    """Hold a slot of ``scheduler`` for one attempt, waiting at most ``budget`` seconds for it.
+
+    The wait is part of the ``queue`` phase of the request trace.
+    """
+    if scheduler is None:
+        yield
+        return
+    with scheduler.slot(priority, tenant or DEFAULT_TENANT, _deadline(budget)):
+        yield
+
+
+@asynccontextmanager
+async def aschedule_request(
+    scheduler: Optional[RequestScheduler], priority: int, tenant: Optional[str], budget: Optional[float]
+) -> AsyncIterator[None]:
+    if scheduler is None:
+        yield
+        return
+    async with scheduler.aslot(priority, tenant or DEFAULT_TENANT, _deadline(budget)):
+        yield
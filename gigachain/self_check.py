@@ -0,0 +1,195 @@
+"""Question answering with self-verification of the draft answer"""
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import (Any, AsyncIterator, Dict, Iterator, List, Optional,
+                    Tuple)
+
+from langchain.callbacks.manager import (AsyncCallbackManagerForChainRun,
+                                         CallbackManagerForChainRun, Callbacks)
+from langchain.chains.base import Chain
+from langchain.schema import BasePromptTemplate
+from langchain.schema.language_model import BaseLanguageModel
+from pydantic import Field
+
+from .cache import LRUCache, PromptCache, acached_predict, cached_predict
+from .prompts import (CHECKER_CHECK_ASSERTION_PROMPT,
+                      CHECKER_DRAFT_ANSWER_PROMPT,
+                      CHECKER_LIST_ASSERTIONS_PROMPT,
+                      CHECKER_REVISED_ANSWER_PROMPT)
+
+_BULLET = re.compile(r"^\s*(?:[-*•–—]|\d+[.)])\s*")
+
+
+def parse_assertions(text: str) -> List[str]:
+    """Items of a bulleted or numbered list, one per line, without repeats"""
+    assertions: List[str] = []
+    seen = set()
+    for line in text.splitlines():
+        assertion = _BULLET.sub("", line).strip()
+        if assertion and assertion not in seen:
+            seen.add(assertion)
+            assertions.append(assertion)
+    return assertions
+
+
+@dataclass
+class SelfCheckStep:
+    """Result of one stage of :class:`SelfCheckChain`"""
+
+    kind: str
+    """``draft``, ``assertions``, ``check`` or ``answer``"""
+
+    text: str
+
+    index: Optional[int] = None
+    """Position of the checked assertion, for checks"""
+
+    assertion: Optional[str] = None
+
+
+class SelfCheckChain(Chain):
+    """Answers a question, verifies the assumptions of the answer and revises it.
+
+    The draft answer is split into assertions with ``list_assertions_prompt``
+    and every assertion is checked on its own with ``check_assertion_prompt``,
+    up to ``max_concurrency`` at a time, so the checks take about as long as
+    the slowest one. The revised answer is requested as soon as the last
+    check is done. :meth:`stream_steps` yields every stage as it completes.
+
+    Checks are cached by their prompt in ``check_cache``, an assertion checked
+    before in the same process, or in an earlier one with a file-backed cache,
+    is not checked again. A drop-in replacement for ``LLMCheckerChain``.
+    """
+
+    llm: BaseLanguageModel
+
+    create_draft_answer_prompt: BasePromptTemplate = CHECKER_DRAFT_ANSWER_PROMPT
+    """With a ``question`` variable"""
+
+    list_assertions_prompt: BasePromptTemplate = CHECKER_LIST_ASSERTIONS_PROMPT
+    """With a ``statement`` variable, the answer should have one assertion per line"""
+
+    check_assertion_prompt: BasePromptTemplate = CHECKER_CHECK_ASSERTION_PROMPT
+    """With an ``assertion`` variable"""
+
+    revised_answer_prompt: BasePromptTemplate = CHECKER_REVISED_ANSWER_PROMPT
+    """With ``checked_assertions`` and ``question`` variables"""
+
+    max_concurrency: int = 8
+
+    max_assertions: Optional[int] = 20
+    """Assertions checked at most, the first ones of the list"""
+
+    check_cache: Optional[PromptCache] = Field(default_factory=lambda: LRUCache(4096), exclude=True)
+    """Checks by prompt, None to disable. The default is kept in memory for the
+    life of the process, a :class:`~gigachain.cache.ResponseCache` with a ``path``
+    keeps them across restarts"""
+
+    input_key: str = "query"  #: :meta private:
+    output_key: str = "result"  #: :meta private:
+
+    @property
+    def input_keys(self) -> List[str]:
+        return [self.input_key]
+
+    @property
+    def output_keys(self) -> List[str]:
+        return [self.output_key]
+
+    @property
+    def _chain_type(self) -> str:
+        return "gigachain_self_check_chain"
+
+    def _assertions(self, text: str) -> List[str]:
+        assertions = parse_assertions(text)
+        return assertions[:self.max_assertions] if self.max_assertions is not None else assertions
+
+    def _check(self, assertion: str, callbacks: Callbacks) -> str:
+        return cached_predict(
+            self.llm, self.check_assertion_prompt.format(assertion=assertion), self.check_cache, callbacks)
+
+    async def _acheck(self, assertion: str, callbacks: Callbacks) -> str:
+        return await acached_predict(
+            self.llm, self.check_assertion_prompt.format(assertion=assertion), self.check_cache, callbacks)
+
+    @staticmethod
+    def _checked(assertions: List[str], verdicts: List[str]) -> str:
+        return "\n\n".join(f"{assertion}\n{verdict}" for assertion, verdict in zip(assertions, verdicts))
+
+    def stream_steps(self, question: str, callbacks: Callbacks = None) -> Iterator[SelfCheckStep]:
+        """Yield the draft, the assertions, every check as it completes and the revised answer"""
+        draft = self.llm.predict(self.create_draft_answer_prompt.format(question=question), callbacks=callbacks)
+        yield SelfCheckStep("draft", draft)
+        listed = self.llm.predict(self.list_assertions_prompt.format(statement=draft), callbacks=callbacks)
+        yield SelfCheckStep("assertions", listed)
+
+        assertions = self._assertions(listed)
+        verdicts: List[str] = [""] * len(assertions)
+        if assertions:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = {executor.submit(self._check, assertion, callbacks): index
+                           for index, assertion in enumerate(assertions)}
+                try:
+                    for future in as_completed(futures):
+                        index = futures[future]
+                        verdicts[index] = future.result()
+                        yield SelfCheckStep("check", verdicts[index], index, assertions[index])
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+        answer = self.llm.predict(self.revised_answer_prompt.format(
+            checked_assertions=self._checked(assertions, verdicts), question=question), callbacks=callbacks)
+        yield SelfCheckStep("answer", answer)
+
+    async def astream_steps(self, question: str, callbacks: Callbacks = None) -> AsyncIterator[SelfCheckStep]:
+        """Async version of :meth:`stream_steps`"""
+        draft = await self.llm.apredict(
+            self.create_draft_answer_prompt.format(question=question), callbacks=callbacks)
+        yield SelfCheckStep("draft", draft)
+        listed = await self.llm.apredict(self.list_assertions_prompt.format(statement=draft), callbacks=callbacks)
+        yield SelfCheckStep("assertions", listed)
+
+        assertions = self._assertions(listed)
+        verdicts: List[str] = [""] * len(assertions)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def check(index: int, assertion: str) -> Tuple[int, str]:
+            async with semaphore:
+                return index, await self._acheck(assertion, callbacks)
+
+        tasks = [asyncio.ensure_future(check(index, assertion)) for index, assertion in enumerate(assertions)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                index, verdict = await task
+                verdicts[index] = verdict
+                yield SelfCheckStep("check", verdict, index, assertions[index])
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        answer = await self.llm.apredict(self.revised_answer_prompt.format(
+            checked_assertions=self._checked(assertions, verdicts), question=question), callbacks=callbacks)
+        yield SelfCheckStep("answer", answer)
+
+    def _call(
+        self, inputs: Dict[str, Any], run_manager: Optional[CallbackManagerForChainRun] = None
+    ) -> Dict[str, str]:
+        callbacks = run_manager.get_child() if run_manager else None
+        answer = ""
+        for step in self.stream_steps(inputs[self.input_key], callbacks):
+            if step.kind == "answer":
+                answer = step.text
+        return {self.output_key: answer}
+
+    async def _acall(
+        self, inputs: Dict[str, Any], run_manager: Optional[AsyncCallbackManagerForChainRun] = None
+    ) -> Dict[str, str]:
+        callbacks = run_manager.get_child() if run_manager else None
+        answer = ""
+        async for step in self.astream_steps(inputs[self.input_key], callbacks):
+            if step.kind == "answer":
+                answer = step.text
+        return {self.output_key: answer}
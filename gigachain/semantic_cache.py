@@ -0,0 +1,187 @@
+"""Cache of GigaChat responses matched by meaning rather than by exact text"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from itertools import islice
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.embeddings.base import Embeddings
+
+from .vectorstore import NumpyVectorStore
+
+SIMILARITY_LEVELS = (0.8, 0.85, 0.9, 0.93, 0.95, 0.97, 0.99)
+
+
+@dataclass
+class SemanticCacheStats:
+    hits: int
+    misses: int
+    size: int
+    evictions: int
+    expirations: int
+    best_matches: Dict[float, int] = field(default_factory=dict)
+    """Lookups whose closest entry was at least as similar as the key, per level of :data:`SIMILARITY_LEVELS`"""
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def hit_rate_at(self, threshold: float) -> float:
+        """Hit rate the cache would have had with ``threshold``, one of :data:`SIMILARITY_LEVELS`"""
+        total = self.hits + self.misses
+        return self.best_matches.get(threshold, 0) / total if total else 0.0
+
+
+@dataclass
+class SemanticLookup:
+    """Outcome of :meth:`SemanticCache.lookup`, pass it to :meth:`SemanticCache.update` on a miss"""
+
+    scope: str
+    text: str
+    vector: List[float]
+    body: Optional[Dict[str, Any]] = None
+    similarity: Optional[float] = None
+
+
+@dataclass
+class _Entry:
+    scope: str
+    body: Dict[str, Any]
+    created: float
+
+
+def _split_payload(payload: Dict[str, Any]) -> Tuple[str, str]:
+    """Scope of a chat payload and the text compared within it"""
+    messages = payload.get("messages") or []
+    system = [m.get("content") or "" for m in messages if m.get("role") == "system"]
+    dialog = [f"{m.get('role')}: {m.get('content') or ''}" for m in messages if m.get("role") != "system"]
+    scope = repr((payload.get("model"), payload.get("temperature"), payload.get("profanity_check"), system))
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest(), "\n".join(dialog)
+
+
+class SemanticCache:
+    """Answers a request with the response to an earlier request of the same meaning.
+
+    The conversation without system messages is embedded and compared with
+    earlier ones by cosine similarity, a match of at least ``threshold`` is
+    a hit. Only requests with the same model, temperature, profanity check
+    and system messages are compared, so a cached answer never crosses
+    prompts. Entries expire after ``ttl`` seconds, the least recently used
+    ones are evicted beyond ``max_size``.
+
+    Start with a high threshold and lower it while watching
+    :meth:`SemanticCacheStats.hit_rate_at` and the answers it would return.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        threshold: float = 0.95,
+        max_size: int = 10000,
+        ttl: Optional[float] = None,
+    ):
+        self.embedding = embedding
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, NumpyVectorStore] = {}
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._best_matches = {level: 0 for level in SIMILARITY_LEVELS}
+
+    def _remove(self, ids: Sequence[str]) -> None:
+        by_scope: Dict[str, List[str]] = {}
+        for id_ in ids:
+            entry = self._entries.pop(id_)
+            by_scope.setdefault(entry.scope, []).append(id_)
+        for scope, scope_ids in by_scope.items():
+            index = self._indexes[scope]
+            index.delete(scope_ids)
+            if not len(index):
+                del self._indexes[scope]
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl is not None and now - entry.created > self.ttl
+
+    def _search(self, scope: str, vector: List[float]) -> Optional[Tuple[str, float]]:
+        index = self._indexes.get(scope)
+        if index is None:
+            return None
+        found = index.similarity_search_with_score_by_vector(vector, k=1)
+        if not found:
+            return None
+        document, similarity = found[0]
+        return document.metadata["id"], similarity
+
+    def _match(self, scope: str, vector: List[float]) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+        with self._lock:
+            found = self._search(scope, vector)
+            now = time.time()
+            if found is not None and self._expired(self._entries[found[0]], now):
+                expired = [id_ for id_, entry in self._entries.items() if self._expired(entry, now)]
+                self._expirations += len(expired)
+                self._remove(expired)
+                found = self._search(scope, vector)
+            if found is None:
+                return None, None
+            id_, similarity = found
+            for level in SIMILARITY_LEVELS:
+                if similarity >= level:
+                    self._best_matches[level] += 1
+            if similarity < self.threshold:
+                return None, similarity
+            self._entries.move_to_end(id_)
+            return self._entries[id_].body, similarity
+
+    def _record(self, lookup: SemanticLookup) -> SemanticLookup:
+        with self._lock:
+            if lookup.body is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return lookup
+
+    def lookup(self, payload: Dict[str, Any]) -> SemanticLookup:
+        scope, text = _split_payload(payload)
+        vector = self.embedding.embed_query(text)
+        body, similarity = self._match(scope, vector)
+        return self._record(SemanticLookup(scope, text, vector, body, similarity))
+
+    async def alookup(self, payload: Dict[str, Any]) -> SemanticLookup:
+        scope, text = _split_payload(payload)
+        vector = await self.embedding.aembed_query(text)
+        body, similarity = self._match(scope, vector)
+        return self._record(SemanticLookup(scope, text, vector, body, similarity))
+
+    def update(self, lookup: SemanticLookup, body: Dict[str, Any]) -> None:
+        """Remember ``body`` as the answer to the request of a missed ``lookup``"""
+        id_ = uuid.uuid4().hex
+        with self._lock:
+            index = self._indexes.get(lookup.scope)
+            if index is None:
+                index = self._indexes[lookup.scope] = NumpyVectorStore(self.embedding)
+            index.add_embeddings([lookup.text], [lookup.vector], [{"id": id_}], [id_])
+            self._entries[id_] = _Entry(lookup.scope, body, time.time())
+            overflow = len(self._entries) - self.max_size
+            if overflow > 0:
+                self._evictions += overflow
+                self._remove(list(islice(self._entries, overflow)))
+
+    def stats(self) -> SemanticCacheStats:
+        with self._lock:
+            return SemanticCacheStats(
+                hits=self._hits, misses=self._misses, size=len(self._entries), evictions=self._evictions,
+                expirations=self._expirations, best_matches=dict(self._best_matches))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
@@ -0,0 +1,134 @@
+"""Fast encoding of chat payloads and decoding of GigaChat responses.
+
+``orjson`` is used when installed (``pip install orjson``), the standard
+``json`` module otherwise. Messages are converted through a table keyed by
+message type, and the encoded bytes of every message are memoized, so
+resending a growing conversation only encodes the messages added since the
+previous turn.
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from langchain.schema.messages import (AIMessage, BaseMessage, ChatMessage,
+                                       FunctionMessage, HumanMessage,
+                                       SystemMessage)
+
+from .cache import LRUCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _chat_message(message: ChatMessage) -> Dict[str, Any]:
+    return {"role": message.role, "content": message.content}
+
+
+def _human_message(message: HumanMessage) -> Dict[str, Any]:
+    return {"role": "user", "content": message.content}
+
+
+def _ai_message(message: AIMessage) -> Dict[str, Any]:
+    message_dict = {"role": "assistant", "content": message.content}
+    if "function_call" in message.additional_kwargs:
+        message_dict["function_call"] = message.additional_kwargs["function_call"]
+        # If function call only, content is None not empty string
+        if message_dict["content"] == "":
+            message_dict["content"] = None
+    return message_dict
+
+
+def _system_message(message: SystemMessage) -> Dict[str, Any]:
+    return {"role": "system", "content": message.content}
+
+
+def _function_message(message: FunctionMessage) -> Dict[str, Any]:
+    return {"role": "function", "content": message.content, "name": message.name}
+
+
+MESSAGE_CONVERTERS: Dict[Type[BaseMessage], Callable[[Any], Dict[str, Any]]] = {
+    ChatMessage: _chat_message,
+    HumanMessage: _human_message,
+    AIMessage: _ai_message,
+    SystemMessage: _system_message,
+    FunctionMessage: _function_message,
+}
+"""GigaChat message dict builders by message type"""
+
+
+def _find_converter(cls: Type[BaseMessage]) -> Optional[Callable[[Any], Dict[str, Any]]]:
+    for base in cls.__mro__:
+        converter = MESSAGE_CONVERTERS.get(base)
+        if converter is not None:
+            # Remember subclasses too, so the next lookup is a single dict access
+            MESSAGE_CONVERTERS[cls] = converter
+            return converter
+    return None
+
+
+def message_to_dict(message: BaseMessage) -> Dict[str, Any]:
+    """Convert a LangChain message to the GigaChat API format"""
+    converter = MESSAGE_CONVERTERS.get(type(message)) or _find_converter(type(message))
+    if converter is None:
+        raise TypeError(f"Got unknown type {message}")
+    message_dict = converter(message)
+    if "name" in message.additional_kwargs:
+        message_dict["name"] = message.additional_kwargs["name"]
+    return message_dict
+
+
+class PayloadEncoder:
+    """Encodes chat payloads, reusing the bytes of messages seen before.
+
+    Fragments are keyed by role and content. Python caches the hash of a
+    string, so looking up a message that is resent with the same content
+    object costs no more than a dict access, whatever its length.
+    """
+
+    def __init__(self, max_fragments: int = 4096):
+        self._fragments: LRUCache[bytes] = LRUCache(max_fragments)
+
+    def encode_message(self, message_dict: Dict[str, Any]) -> bytes:
+        if len(message_dict) != 2:
+            # Function calls and named messages are rare, not worth a key of their own
+            return dumps(message_dict)
+        key: Tuple[Any, Any] = (message_dict["role"], message_dict["content"])
+        fragment = self._fragments.get(key)  # type: ignore[arg-type]
+        if fragment is None:
+            fragment = dumps(message_dict)
+            self._fragments.set(key, fragment)  # type: ignore[arg-type]
+        return fragment
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        """Same JSON as ``dumps(payload)``, with ``messages`` built from cached fragments"""
+        messages: List[Dict[str, Any]] = payload.get("messages") or []
+        head = {key: value for key, value in payload.items() if key != "messages"}
+        body = b'"messages":[' + b",".join(self.encode_message(m) for m in messages) + b"]}"
+        if not head:
+            return b"{" + body
+        return dumps(head)[:-1] + b"," + body
+
+    def clear(self) -> None:
+        self._fragments.clear()
+
+
+_encoder = PayloadEncoder()
+
+
+def encode_payload(payload: Dict[str, Any]) -> bytes:
+    """Encode a chat payload with the shared :class:`PayloadEncoder`"""
+    return _encoder.encode(payload)
@@ -0,0 +1,229 @@
+"""Incremental server-sent events parsing, stop sequences and streaming latency metrics"""
+import time
+from collections import deque
+from typing import (Any, AsyncIterable, AsyncIterator, Dict, Iterable,
+                    Iterator, List, Optional, Sequence, Tuple)
+
+from .serialization import loads
+
+
+class SSEParser:
+    """Incremental parser of a ``text/event-stream`` body.
+
+    Raw byte chunks are fed as they arrive and the ``data`` payload of every
+    complete event is returned as soon as its terminating blank line is seen.
+    Unfinished lines stay in a single reusable buffer, so chunk boundaries
+    (even inside a multibyte character) cost no extra copies.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[str]:
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            if end > start and buffer[end - 1] == 0x0D:  # \r\n line ending
+                line = bytes(buffer[start:end - 1])
+            else:
+                line = bytes(buffer[start:end])
+            start = end + 1
+            self._process_line(line, events)
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self) -> List[str]:
+        """Return the last event if the stream ended without a blank line"""
+        events: List[str] = []
+        if self._buffer:
+            self._process_line(bytes(self._buffer), events)
+            self._buffer.clear()
+        self._process_line(b"", events)
+        return events
+
+    def _process_line(self, line: bytes, events: List[str]) -> None:
+        if not line:
+            if self._data:
+                events.append(b"\n".join(self._data).decode("utf-8"))
+                self._data = []
+        elif line.startswith(b"data:"):
+            value = line[5:]
+            self._data.append(value[1:] if value.startswith(b" ") else value)
+        # comments and the event/id/retry fields are not used by GigaChat
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Yield event payloads from raw body chunks until ``[DONE]``"""
+    parser = SSEParser()
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event == "[DONE]":
+                return
+            yield event
+    for event in parser.flush():
+        if event != "[DONE]":
+            yield event
+
+
+async def aiter_sse_events(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Async version of :func:`iter_sse_events`"""
+    parser = SSEParser()
+    async for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event == "[DONE]":
+                return
+            yield event
+    for event in parser.flush():
+        if event != "[DONE]":
+            yield event
+
+
+def parse_stream_chunk(data: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Return the content delta and the token usage, if any, of a streamed completion event"""
+    event = loads(data)
+    choices = event.get("choices") or [{}]
+    delta = choices[0].get("delta") or choices[0].get("message") or {}
+    return delta.get("content"), event.get("usage")
+
+
+class StopSequenceMatcher:
+    """Incremental matcher of stop sequences in streamed text.
+
+    All sequences are matched at once by an Aho-Corasick automaton, text is
+    fed chunk by chunk and every character is looked at once, so a sequence
+    split between chunks is found too. :meth:`feed` returns the text that
+    can be emitted: the end of a chunk that may be the beginning of a stop
+    sequence is held back until the next chunk tells. The output stops
+    before the first stop sequence to be completed.
+    """
+
+    def __init__(self, stop: Sequence[str]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail = [0]
+        self._depth = [0]
+        self._match = [0]
+        for sequence in stop:
+            if sequence:
+                self._insert(sequence)
+        self._build()
+        self._state = 0
+        self._held = ""
+        self.stopped = False
+
+    def _insert(self, sequence: str) -> None:
+        state = 0
+        for char in sequence:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = self._goto[state][char] = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._depth.append(self._depth[state] + 1)
+                self._match.append(0)
+            state = following
+        self._match[state] = len(sequence)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(char, 0)
+                # A state completes its own sequence or one that is a suffix of it
+                self._match[following] = self._match[following] or self._match[self._fail[following]]
+                queue.append(following)
+
+    def feed(self, text: str) -> Tuple[str, bool]:
+        """Text to emit and whether a stop sequence was found"""
+        if self.stopped:
+            return "", True
+        goto, fail, match = self._goto, self._fail, self._match
+        state = self._state
+        held = len(self._held)
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if match[state]:
+                self.stopped = True
+                emitted = (self._held + text[:position + 1])[:held + position + 1 - match[state]]
+                self._held = ""
+                return emitted, True
+        self._state = state
+        buffered = self._held + text
+        keep = self._depth[state]
+        self._held = buffered[len(buffered) - keep:] if keep else ""
+        return buffered[:len(buffered) - keep], False
+
+    def flush(self) -> str:
+        """Held back text, once the stream ended without a stop sequence"""
+        held, self._held = self._held, ""
+        self._state = 0
+        return held
+
+
+def truncate_at_stop(text: str, stop: Optional[Sequence[str]]) -> str:
+    """``text`` up to the first stop sequence to be completed, see :class:`StopSequenceMatcher`"""
+    if not stop:
+        return text
+    matcher = StopSequenceMatcher(stop)
+    emitted, stopped = matcher.feed(text)
+    return emitted if stopped else emitted + matcher.flush()
+
+
+class StreamMetrics:
+    """Time-to-first-token and inter-token latency of one streamed response.
+
+    Only running sums are kept, so tracking a long stream allocates nothing.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.tokens = 0
+        self._gap_sum = 0.0
+        self._gap_max = 0.0
+
+    def on_token(self) -> None:
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            gap = now - self.last_token_at
+            self._gap_sum += gap
+            self._gap_max = max(self._gap_max, gap)
+        self.last_token_at = now
+        self.tokens += 1
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+
+    @property
+    def inter_token_latency(self) -> Optional[float]:
+        """Mean delay between consecutive chunks"""
+        if self.tokens < 2:
+            return None
+        return self._gap_sum / (self.tokens - 1)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "inter_token_latency": self.inter_token_latency,
+            "max_inter_token_latency": self._gap_max if self.tokens > 1 else None,
+            "stream_chunks": self.tokens,
+            "stream_duration": (self.last_token_at or time.perf_counter()) - self.started,
+        }
@@ -0,0 +1,226 @@
+"""Summarization of documents of any size"""
+import asyncio
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import (Any, AsyncIterator, Dict, Iterator, List, Optional,
+                    Sequence, Set, Tuple)
+
+from langchain.callbacks.manager import Callbacks
+from langchain.chains.combine_documents.base import BaseCombineDocumentsChain
+from langchain.schema import BasePromptTemplate, Document
+from langchain.schema.language_model import BaseLanguageModel
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from pydantic import Field
+
+from .cache import LRUCache, PromptCache, acached_predict, cached_predict
+from .prompts import SUMMARY_STUFF_PROMPT
+
+
+@dataclass
+class PartialSummary:
+    """Summary of one node of the reduction tree"""
+
+    level: int
+    """0 for chunks of the documents, 1 for summaries of chunk summaries and so on"""
+
+    index: int
+    """Position of the node within its level"""
+
+    text: str
+
+    final: bool = False
+
+
+class MapReduceSummarizer(BaseCombineDocumentsChain):
+    """Summarizes documents bigger than the context window.
+
+    Documents are split into chunks of at most ``chunk_tokens`` tokens and
+    the chunks are summarized with ``prompt``, up to ``max_concurrency`` at
+    a time. Summaries are then grouped into ``chunk_tokens`` again and
+    summarized with ``combine_prompt`` level by level, the groups of a level
+    in parallel, until one summary is left. :meth:`stream_summaries` yields
+    every node of that tree as soon as it is ready.
+
+    Chunk boundaries are anchored to the content, not only to the offset, and
+    every summary is cached by its prompt. After an edit only the chunks
+    around it and their path to the root are sent to the model again, as long
+    as ``summary_cache`` still holds the earlier summaries.
+    """
+
+    llm: BaseLanguageModel
+
+    prompt: BasePromptTemplate = SUMMARY_STUFF_PROMPT
+    """Summary of a chunk, with a ``text`` variable"""
+
+    combine_prompt: BasePromptTemplate = SUMMARY_STUFF_PROMPT
+    """Summary of joined summaries, with a ``text`` variable"""
+
+    chunk_tokens: int = 1500
+    """Budget of the text sent in one request"""
+
+    max_concurrency: int = 8
+
+    summary_cache: Optional[PromptCache] = Field(default_factory=lambda: LRUCache(4096), exclude=True)
+    """Summaries by prompt, None to disable. The default is kept in memory for the
+    life of the process, a :class:`~gigachain.cache.ResponseCache` with a ``path``
+    keeps them across restarts"""
+
+    @property
+    def _chain_type(self) -> str:
+        return "gigachain_map_reduce_summarizer"
+
+    def _count_tokens(self, texts: Sequence[str]) -> List[int]:
+        count_batch = getattr(self.llm, "get_num_tokens_batch", None)
+        if count_batch is not None:
+            return count_batch(list(texts))
+        return [self.llm.get_num_tokens(text) for text in texts]
+
+    def split_text(self, text: str) -> List[str]:
+        """Split ``text`` into chunks of at most ``chunk_tokens`` tokens at paragraph boundaries.
+
+        A chunk that is at least half full also ends at a paragraph whose hash
+        is divisible by four. An edit therefore shifts the boundaries only
+        until the next such paragraph, not to the end of the text.
+        """
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_tokens, chunk_overlap=0, length_function=self.llm.get_num_tokens)
+        paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+        counts = self._count_tokens(paragraphs)
+        pieces: List[Tuple[str, int]] = []
+        for paragraph, count in zip(paragraphs, counts):
+            if count <= self.chunk_tokens:
+                pieces.append((paragraph, count))
+            else:
+                parts = splitter.split_text(paragraph)
+                pieces.extend(zip(parts, self._count_tokens(parts)))
+
+        chunks: List[str] = []
+        current: List[str] = []
+        size = 0
+        for piece, count in pieces:
+            if current and size + count > self.chunk_tokens:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += count
+            if size >= self.chunk_tokens // 2 and zlib.crc32(piece.encode("utf-8")) % 4 == 0:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        """Group summaries of a level into requests of at most ``chunk_tokens``, two at least"""
+        groups: List[List[str]] = []
+        current: List[str] = []
+        size = 0
+        for summary, count in zip(summaries, self._count_tokens(summaries)):
+            if len(current) >= 2 and size + count > self.chunk_tokens:
+                groups.append(current)
+                current, size = [], 0
+            current.append(summary)
+            size += count
+        if current:
+            groups.append(current)
+        return groups
+
+    def _summarize(self, prompt: BasePromptTemplate, text: str, callbacks: Callbacks) -> str:
+        return cached_predict(self.llm, prompt.format(text=text), self.summary_cache, callbacks)
+
+    async def _asummarize(self, prompt: BasePromptTemplate, text: str, callbacks: Callbacks) -> str:
+        return await acached_predict(self.llm, prompt.format(text=text), self.summary_cache, callbacks)
+
+    def _chunks(self, docs: List[Document]) -> List[str]:
+        return [chunk for doc in docs for chunk in self.split_text(doc.page_content)]
+
+    def stream_summaries(self, docs: List[Document], callbacks: Callbacks = None) -> Iterator[PartialSummary]:
+        """Yield summaries of chunks and of their groups as they complete, the final summary last"""
+        texts = self._chunks(docs)
+        if not texts:
+            return
+        prompt = self.prompt
+        level = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while True:
+                # Single summaries are carried to the next level as they are
+                groups = [[text] for text in texts] if level == 0 else self._group(texts)
+                results: List[Optional[str]] = [None] * len(groups)
+                running: Dict[Future, int] = {}
+                for index, group in enumerate(groups):
+                    if level > 0 and len(group) == 1:
+                        results[index] = group[0]
+                    else:
+                        future = executor.submit(self._summarize, prompt, "\n\n".join(group), callbacks)
+                        running[future] = index
+                final = len(groups) == 1
+                pending: Set[Future] = set(running)
+                try:
+                    while pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            index = running[future]
+                            results[index] = future.result()
+                            yield PartialSummary(level, index, results[index], final)
+                finally:
+                    for future in pending:
+                        future.cancel()
+                if final:
+                    return
+                texts = results  # type: ignore[assignment]
+                prompt = self.combine_prompt
+                level += 1
+
+    async def astream_summaries(self, docs: List[Document], callbacks: Callbacks = None) -> AsyncIterator[PartialSummary]:
+        """Async version of :meth:`stream_summaries`"""
+        texts = self._chunks(docs)
+        if not texts:
+            return
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        prompt = self.prompt
+        level = 0
+
+        async def summarize(index: int, text: str) -> Tuple[int, str]:
+            async with semaphore:
+                return index, await self._asummarize(prompt, text, callbacks)
+
+        while True:
+            groups = [[text] for text in texts] if level == 0 else self._group(texts)
+            results: List[Optional[str]] = [None] * len(groups)
+            tasks = []
+            for index, group in enumerate(groups):
+                if level > 0 and len(group) == 1:
+                    results[index] = group[0]
+                else:
+                    tasks.append(asyncio.ensure_future(summarize(index, "\n\n".join(group))))
+            final = len(groups) == 1
+            try:
+                for task in asyncio.as_completed(tasks):
+                    index, summary = await task
+                    results[index] = summary
+                    yield PartialSummary(level, index, summary, final)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            if final:
+                return
+            texts = results  # type: ignore[assignment]
+            prompt = self.combine_prompt
+            level += 1
+
+    def combine_docs(self, docs: List[Document], callbacks: Callbacks = None, **kwargs: Any) -> Tuple[str, dict]:
+        summary = ""
+        for partial in self.stream_summaries(docs, callbacks):
+            if partial.final:
+                summary = partial.text
+        return summary, {}
+
+    async def acombine_docs(
+        self, docs: List[Document], callbacks: Callbacks = None, **kwargs: Any
+    ) -> Tuple[str, dict]:
+        summary = ""
+        async for partial in self.astream_summaries(docs, callbacks):
+            if partial.final:
+                summary = partial.text
+        return summary, {}
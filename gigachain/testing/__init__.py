@@ -0,0 +1,2 @@
+"""Tools for testing and benchmarking code that talks to GigaChat"""
+from .stub_server import StubConfig, StubServer, StubStats
@@ -0,0 +1,287 @@
+"""Benchmarks of the GigaChat client against the local stub server.
+
+Measures throughput, latency percentiles, memory and connection counts of the
+sync, async, batch and streaming paths at several concurrency levels and
+writes them as JSON, so results of two releases can be compared::
+
+    python -m gigachain.testing.benchmark --requests 500 --concurrency 1 8 64 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema.messages import BaseMessage, HumanMessage
+from langchain.schema.output import LLMResult
+
+from ..gigachat_model import GigaChatModel
+from ..retry import RetryPolicy
+from .stub_server import LATENCY_DISTRIBUTIONS, StubConfig, StubServer
+
+PATHS = ("sync", "async", "batch", "stream")
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """``q``-th percentile (0 to 100) by the nearest rank method"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class LatencyRecorder(BaseCallbackHandler):
+    """Callback that times every chat run and its first streamed token"""
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._started: Dict[UUID, float] = {}
+        self._streamed: Set[UUID] = set()
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.errors = 0
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]],
+                            *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            started = self._started.get(run_id)
+            if started is not None and run_id not in self._streamed:
+                self._streamed.add(run_id)
+                self.first_token.append(now - started)
+
+    def _finish(self, run_id: UUID, failed: bool) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            self._streamed.discard(run_id)
+            if started is None:
+                return
+            if failed:
+                self.errors += 1
+            else:
+                self.latencies.append(now - started)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, failed=False)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, failed=True)
+
+
+@dataclass
+class BenchmarkResult:
+    """Measurements of one path at one concurrency level"""
+
+    path: str
+    concurrency: int
+    requests: int
+    errors: int
+    duration: float
+    throughput: float
+    """Successful requests per second"""
+
+    latency_p50: Optional[float]
+    latency_p99: Optional[float]
+    latency_max: Optional[float]
+    first_token_p50: Optional[float] = None
+    first_token_p99: Optional[float] = None
+    server_connections: int = 0
+    """Connections the stub accepted, fewer means better reuse"""
+
+    server_max_in_flight: int = 0
+    token_requests: int = 0
+    memory_peak: Optional[int] = None
+    """Peak bytes allocated by Python during the run, with ``--trace-memory``"""
+
+    max_rss: int = 0
+    """Peak resident set size of the process so far, KiB"""
+
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+
+def _prompts(count: int) -> List[List[BaseMessage]]:
+    return [[HumanMessage(content=f"Benchmark prompt number {i}")] for i in range(count)]
+
+
+def _run_sync(model: GigaChatModel, prompts: List[List[BaseMessage]], concurrency: int) -> None:
+    def call(messages: List[BaseMessage]) -> None:
+        try:
+            model(messages)
+        except Exception:
+            pass  # counted by the recorder
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, prompts))
+
+
+def _run_async(model: GigaChatModel, prompts: List[List[BaseMessage]], concurrency: int) -> None:
+    async def main() -> None:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(messages: List[BaseMessage]) -> None:
+            async with semaphore:
+                try:
+                    await model.apredict_messages(messages)
+                except Exception:
+                    pass
+        await asyncio.gather(*(call(messages) for messages in prompts))
+        await model._get_async_transport().aclose()
+    asyncio.run(main())
+
+
+def _run_batch(model: GigaChatModel, prompts: List[List[BaseMessage]], concurrency: int) -> None:
+    for _ in model.batch_chat(prompts, max_workers=concurrency, ordered=False):
+        pass
+
+
+def _run_stream(model: GigaChatModel, prompts: List[List[BaseMessage]], concurrency: int) -> None:
+    def call(messages: List[BaseMessage]) -> None:
+        try:
+            for _ in model.stream(messages):
+                pass
+        except Exception:
+            pass
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, prompts))
+
+
+RUNNERS: Dict[str, Callable[[GigaChatModel, List[List[BaseMessage]], int], None]] = {
+    "sync": _run_sync,
+    "async": _run_async,
+    "batch": _run_batch,
+    "stream": _run_stream,
+}
+
+
+def run_benchmark(
+    server: StubServer,
+    path: str,
+    concurrency: int,
+    requests: int,
+    trace_memory: bool = False,
+    **model_kwargs: Any,
+) -> BenchmarkResult:
+    """Send ``requests`` chat requests to ``server`` through one client path"""
+    recorder = LatencyRecorder()
+    model_kwargs.setdefault("retry_policy", RetryPolicy(max_attempts=1))
+    model = GigaChatModel(
+        api_url=server.url, user="benchmark", password="benchmark", callbacks=[recorder],
+        pool_maxsize=concurrency, max_concurrency=concurrency, **model_kwargs)
+    prompts = _prompts(requests)
+
+    server.reset_stats()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        RUNNERS[path](model, prompts, concurrency)
+        duration = time.perf_counter() - started
+        memory_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        # Start the next run with a cold pool, so connection counts are comparable
+        model._get_transport().close()
+    stats = server.stats()
+
+    latencies = recorder.latencies
+    return BenchmarkResult(
+        path=path,
+        concurrency=concurrency,
+        requests=requests,
+        errors=recorder.errors,
+        duration=duration,
+        throughput=len(latencies) / duration if duration else 0.0,
+        latency_p50=percentile(latencies, 50),
+        latency_p99=percentile(latencies, 99),
+        latency_max=max(latencies) if latencies else None,
+        first_token_p50=percentile(recorder.first_token, 50),
+        first_token_p99=percentile(recorder.first_token, 99),
+        server_connections=stats.connections,
+        server_max_in_flight=stats.max_in_flight,
+        token_requests=stats.token_requests,
+        memory_peak=memory_peak,
+        max_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        statuses=stats.statuses,
+    )
+
+
+def run_suite(
+    config: StubConfig,
+    paths: Sequence[str] = PATHS,
+    concurrency: Sequence[int] = (1, 8, 64),
+    requests: int = 200,
+    trace_memory: bool = False,
+) -> Dict[str, Any]:
+    """Run every path at every concurrency level against one stub server"""
+    results = []
+    with StubServer(config) as server:
+        for path in paths:
+            for level in concurrency:
+                result = run_benchmark(server, path, level, requests, trace_memory)
+                results.append(asdict(result))
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "stub": asdict(config),
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the GigaChat client against a local stub")
+    parser.add_argument("--paths", nargs="+", default=list(PATHS), choices=PATHS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 64])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--latency-distribution", default="lognormal", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--completion-words", type=int, default=20)
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.0)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="measure peak Python allocations, slows the client down")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=None,
+        completion_words=args.completion_words,
+        stream_chunk_delay=args.stream_chunk_delay,
+        seed=args.seed,
+    )
+    report = run_suite(config, args.paths, args.concurrency, args.requests, args.trace_memory)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Replay of captured GigaChat traffic, see :mod:`gigachain.capture`.
+
+Requests of a capture are sent again through the current client to any
+endpoint, at their original pace, faster, or at a fixed rate, and the
+throughput and latency percentiles are reported as JSON. Replaying the
+same capture with two client versions compares them on real traffic::
+
+    python -m gigachain.testing.replay traffic.jsonl.gz --stub --speed 10 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema.messages import (AIMessage, BaseMessage, HumanMessage,
+                                       SystemMessage)
+
+from ..capture import CapturedRequest, read_capture
+from ..gigachat_model import GigaChatModel
+from ..retry import RetryPolicy
+from .benchmark import percentile
+from .stub_server import StubConfig, StubServer
+
+_MESSAGE_TYPES = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+
+
+def payload_messages(payload: Dict[str, Any]) -> List[BaseMessage]:
+    """Messages of a captured payload"""
+    return [_MESSAGE_TYPES.get(message.get("role"), HumanMessage)(content=message.get("content") or "")
+            for message in payload.get("messages") or []]
+
+
+@dataclass
+class ReplayResult:
+    requests: int
+    errors: int
+    duration: float
+    throughput: float
+    """Successful requests per second"""
+
+    latency_p50: Optional[float]
+    latency_p90: Optional[float]
+    latency_p99: Optional[float]
+    latency_max: Optional[float]
+    first_token_p50: Optional[float] = None
+    first_token_p99: Optional[float] = None
+    lag_p50: Optional[float] = None
+    """Delay of sending behind the schedule, grows when ``concurrency`` is the bottleneck"""
+
+    lag_p99: Optional[float] = None
+    captured_latency_p50: Optional[float] = None
+    """Latencies of the same requests when they were captured"""
+
+    captured_latency_p99: Optional[float] = None
+    error_types: Dict[str, int] = field(default_factory=dict)
+
+
+class _Replayer:
+    def __init__(self, api_url: str, concurrency: int, model_kwargs: Dict[str, Any]):
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.model_kwargs = model_kwargs
+        self.models: Dict[Tuple[Any, ...], GigaChatModel] = {}
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.lags: List[float] = []
+        self.captured: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def _model(self, payload: Dict[str, Any]) -> GigaChatModel:
+        key = (payload.get("model"), payload.get("temperature"), payload.get("profanity_check"))
+        model = self.models.get(key)
+        if model is None:
+            model = self.models[key] = GigaChatModel(
+                api_url=self.api_url, model=key[0], temperature=key[1], profanity=key[2],
+                max_concurrency=self.concurrency, pool_maxsize=self.concurrency, **self.model_kwargs)
+        return model
+
+    async def send(self, request: CapturedRequest) -> None:
+        model = self._model(request.payload)
+        messages = payload_messages(request.payload)
+        started = time.perf_counter()
+        try:
+            if request.streamed:
+                first: Optional[float] = None
+                async for _ in model.astream(messages, stop=request.stop):
+                    if first is None:
+                        first = time.perf_counter() - started
+                if first is not None:
+                    self.first_token.append(first)
+            else:
+                await model.apredict_messages(messages, stop=request.stop)
+        except Exception as error:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return
+        self.latencies.append(time.perf_counter() - started)
+        if request.duration is not None:
+            self.captured.append(request.duration)
+
+    async def close(self) -> None:
+        for model in self.models.values():
+            await model._get_async_transport().aclose()
+
+
+async def areplay(
+    requests: Iterable[CapturedRequest],
+    api_url: str,
+    speed: Optional[float] = 1.0,
+    rate: Optional[float] = None,
+    concurrency: int = 64,
+    **model_kwargs: Any,
+) -> ReplayResult:
+    """Send ``requests`` to ``api_url`` and measure them.
+
+    Requests are sent at their captured offsets divided by ``speed``, or
+    ``rate`` per second when given, or all at once when both are None. At
+    most ``concurrency`` are in flight, the capture is read as it is sent.
+    """
+    model_kwargs.setdefault("retry_policy", RetryPolicy(max_attempts=1))
+    replayer = _Replayer(api_url, concurrency, model_kwargs)
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def send(request: CapturedRequest) -> None:
+        try:
+            await replayer.send(request)
+        finally:
+            semaphore.release()
+
+    count = 0
+    first_time: Optional[float] = None
+    started = time.perf_counter()
+    for index, request in enumerate(requests):
+        if first_time is None:
+            first_time = request.time
+        if rate:
+            offset: Optional[float] = index / rate
+        elif speed:
+            offset = max(0.0, request.time - first_time) / speed
+        else:
+            offset = None
+        if offset is not None:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await semaphore.acquire()
+        if offset is not None:
+            replayer.lags.append(max(0.0, time.perf_counter() - started - offset))
+        task = asyncio.ensure_future(send(request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        count += 1
+    if tasks:
+        await asyncio.gather(*tasks)
+    duration = time.perf_counter() - started
+    await replayer.close()
+
+    latencies = replayer.latencies
+    return ReplayResult(
+        requests=count,
+        errors=sum(replayer.errors.values()),
+        duration=duration,
+        throughput=len(latencies) / duration if duration else 0.0,
+        latency_p50=percentile(latencies, 50),
+        latency_p90=percentile(latencies, 90),
+        latency_p99=percentile(latencies, 99),
+        latency_max=max(latencies) if latencies else None,
+        first_token_p50=percentile(replayer.first_token, 50),
+        first_token_p99=percentile(replayer.first_token, 99),
+        lag_p50=percentile(replayer.lags, 50),
+        lag_p99=percentile(replayer.lags, 99),
+        captured_latency_p50=percentile(replayer.captured, 50),
+        captured_latency_p99=percentile(replayer.captured, 99),
+        error_types=replayer.errors,
+    )
+
+
+def replay(requests: Iterable[CapturedRequest], api_url: str, **kwargs: Any) -> ReplayResult:
+    """Sync entry point of :func:`areplay`"""
+    return asyncio.run(areplay(requests, api_url, **kwargs))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay captured GigaChat traffic")
+    parser.add_argument("capture", help="file written by gigachain.capture.TrafficRecorder")
+    parser.add_argument("--api-url", help="endpoint to replay against, the captured one by default")
+    parser.add_argument("--stub", action="store_true", help="replay against a local stub server")
+    parser.add_argument("--stub-latency", type=float, default=0.02)
+    parser.add_argument("--user", default=os.environ.get("GIGA_USER"))
+    parser.add_argument("--password", default=os.environ.get("GIGA_PASSWORD"))
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--speed", type=float, default=1.0, help="1 is the original pace, 10 ten times faster")
+    pacing.add_argument("--rate", type=float, help="fixed requests per second instead of the captured pace")
+    pacing.add_argument("--burst", action="store_true", help="send as fast as the concurrency allows")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--limit", type=int, help="replay only the first requests")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    def requests() -> Iterable[CapturedRequest]:
+        for index, request in enumerate(read_capture(args.capture)):
+            if args.limit is not None and index >= args.limit:
+                return
+            yield request
+
+    pacing_kwargs = {"speed": None if args.burst else args.speed, "rate": args.rate}
+    started = time.time()
+    if args.stub:
+        with StubServer(StubConfig(latency=args.stub_latency, latency_distribution="lognormal")) as server:
+            result = replay(requests(), server.url, concurrency=args.concurrency, user="replay",
+                            password="replay", **pacing_kwargs)
+    else:
+        api_url = args.api_url or next(iter(read_capture(args.capture))).api_url
+        result = replay(requests(), api_url, concurrency=args.concurrency, user=args.user,
+                        password=args.password, **pacing_kwargs)
+    report = {
+        "meta": {"timestamp": started, "capture": args.capture, "concurrency": args.concurrency, **pacing_kwargs},
+        "result": asdict(result),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""Local stand-in for the GigaChat API, for load tests and benchmarks.
+
+Implements ``/v1/token``, ``/v1/chat/completions`` (plain and streaming),
+``/v1/embeddings`` and ``/v1/models``. Latency, error and throttling behaviour is configurable, so
+the client can be measured without the real service::
+
+    with StubServer(StubConfig(latency=0.05, throttle_rate=0.1)) as server:
+        chat = GigaChatModel(api_url=server.url, user="user", password="password")
+
+Also runnable on its own: ``python -m gigachain.testing.stub_server --port 8080``.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from ..embeddings import hash_embedding
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+@dataclass
+class StubConfig:
+    """Behaviour of :class:`StubServer`"""
+
+    latency: float = 0.0
+    """Mean time before the answer (or the first stream chunk), seconds"""
+
+    latency_distribution: str = "fixed"
+    """One of ``fixed``, ``uniform`` (0 to 2 x mean), ``exponential`` or ``lognormal``"""
+
+    latency_sigma: float = 0.5
+    """Shape of the lognormal distribution, larger means a heavier tail"""
+
+    error_rate: float = 0.0
+    """Share of chat requests answered with ``error_status``"""
+
+    error_status: int = 503
+
+    throttle_rate: float = 0.0
+    """Share of chat requests answered with 429"""
+
+    retry_after: Optional[float] = 1.0
+    """``Retry-After`` sent with 429 and 503, None to omit it"""
+
+    completion_words: int = 20
+    """Length of the answer"""
+
+    stream_chunk_delay: float = 0.0
+    """Pause between stream chunks, seconds"""
+
+    token_ttl: float = 1800
+    """Lifetime of issued access tokens, seconds"""
+
+    check_token: bool = True
+    """Answer 401 to chat requests without a valid issued token"""
+
+    seed: Optional[int] = None
+
+
+@dataclass
+class StubStats:
+    """Counters of a running :class:`StubServer`"""
+
+    connections: int = 0
+    token_requests: int = 0
+    chat_requests: int = 0
+    stream_requests: int = 0
+    aborted_streams: int = 0
+    """Streams the client closed before the end"""
+
+    embedding_requests: int = 0
+    embedded_texts: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once, the default backlog of 5 resets them
+    request_queue_size = 1024
+
+    def __init__(self, address: Any, stub: "StubServer"):
+        self.stub = stub
+        super().__init__(address, _Handler)
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        self.stub._count_connection()
+        super().process_request(request, client_address)
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients dropping idle keep-alive connections are not errors
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without this delayed ACKs add 40ms per request
+    disable_nagle_algorithm = True
+    server: _Server
+
+    _POST_ROUTES = {"/v1/chat/completions": "_chat", "/v1/embeddings": "_embeddings"}
+    """Handlers of authorized endpoints"""
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.stub._count_status(status)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_GET(self) -> None:
+        if self.path == "/v1/models":
+            self._send_json(200, {"data": [{"id": "GigaChat:latest", "object": "model"}]})
+        else:
+            self._send_json(404, {"message": "not found"})
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        stub = self.server.stub
+        if self.path == "/v1/token":
+            self._send_json(200, stub._issue_token())
+            return
+        handler = self._POST_ROUTES.get(self.path)
+        if handler is None:
+            self._send_json(404, {"message": "not found"})
+            return
+
+        auth = self.headers.get("Authorization", "")
+        if stub.config.check_token and not stub._is_valid_token(auth[len("Bearer "):]):
+            self._send_json(401, {"message": "invalid token"})
+            return
+
+        stub._enter()
+        try:
+            getattr(self, handler)(json.loads(body or b"{}"))
+        finally:
+            stub._leave()
+
+    def _chat(self, payload: Dict[str, Any]) -> None:
+        stub = self.server.stub
+        stub._count_chat()
+        config = stub.config
+        retry_headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+        roll = stub._random()
+        if roll < config.throttle_rate:
+            self._send_json(429, {"message": "too many requests"}, retry_headers)
+            return
+        if roll < config.throttle_rate + config.error_rate:
+            self._send_json(config.error_status, {"message": "injected error"},
+                            retry_headers if config.error_status == 503 else None)
+            return
+
+        time.sleep(stub._sample_latency())
+        messages = payload.get("messages") or [{"content": ""}]
+        prompt = messages[-1].get("content") or ""
+        words = (["echo:" + prompt[:64]] + ["word"] * config.completion_words)[:max(1, config.completion_words)]
+        usage = {
+            "prompt_tokens": sum(len(m.get("content") or "") for m in messages) // 3 + 1,
+            "completion_tokens": len(words),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if payload.get("stream"):
+            stub._count_stream()
+            self._stream(words, usage)
+            return
+        self._send_json(200, {
+            "id": uuid.uuid4().hex,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _embeddings(self, payload: Dict[str, Any]) -> None:
+        stub = self.server.stub
+        texts = payload.get("input") or []
+        stub._count_embeddings(len(texts))
+        time.sleep(stub._sample_latency())
+        self._send_json(200, {
+            "object": "list",
+            "model": payload.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": hash_embedding(text).tolist()}
+                     for i, text in enumerate(texts)],
+        })
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream(self, words: Any, usage: Dict[str, int]) -> None:
+        stub = self.server.stub
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, word in enumerate(words):
+                if i and stub.config.stream_chunk_delay:
+                    time.sleep(stub.config.stream_chunk_delay)
+                event = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+                if i == len(words) - 1:
+                    event["choices"][0]["finish_reason"] = "stop"
+                    event["usage"] = usage
+                self._write_chunk(b"data: " + json.dumps(event, ensure_ascii=False).encode() + b"\n\n")
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            stub._count_aborted_stream()
+            self.close_connection = True
+            return
+        stub._count_status(200)
+
+
+class StubServer:
+    """GigaChat API stand-in served from a background thread.
+
+    Binds to a free port unless one is given, see :attr:`url`. Usable as a
+    context manager that starts and stops it.
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig()
+        if self.config.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {self.config.latency_distribution}, "
+                             f"expected one of {LATENCY_DISTRIBUTIONS}")
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._tokens: Dict[str, float] = {}
+        self._stats = StubStats()
+        self._server = _Server((host, port), self)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True,
+                                            name="gigachat-stub-server")
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def stats(self) -> StubStats:
+        with self._lock:
+            return StubStats(**{**asdict(self._stats), "statuses": dict(self._stats.statuses)})
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = StubStats()
+
+    # --- called from handler threads ---
+
+    def _random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _sample_latency(self) -> float:
+        config = self.config
+        if config.latency <= 0:
+            return 0.0
+        with self._lock:
+            if config.latency_distribution == "uniform":
+                return self._rng.uniform(0, 2 * config.latency)
+            if config.latency_distribution == "exponential":
+                return self._rng.expovariate(1 / config.latency)
+            if config.latency_distribution == "lognormal":
+                # Pick mu so that the mean of the distribution is ``latency``
+                mu = math.log(config.latency) - config.latency_sigma ** 2 / 2
+                return self._rng.lognormvariate(mu, config.latency_sigma)
+        return config.latency
+
+    def _issue_token(self) -> Dict[str, Any]:
+        token = uuid.uuid4().hex
+        expires_at = time.time() + self.config.token_ttl
+        with self._lock:
+            self._tokens[token] = expires_at
+            self._stats.token_requests += 1
+        return {"tok": token, "exp": int(expires_at * 1000)}
+
+    def _is_valid_token(self, token: str) -> bool:
+        with self._lock:
+            return self._tokens.get(token, 0) > time.time()
+
+    def _count_connection(self) -> None:
+        with self._lock:
+            self._stats.connections += 1
+
+    def _count_status(self, status: int) -> None:
+        with self._lock:
+            self._stats.statuses[status] = self._stats.statuses.get(status, 0) + 1
+
+    def _count_stream(self) -> None:
+        with self._lock:
+            self._stats.stream_requests += 1
+
+    def _count_aborted_stream(self) -> None:
+        with self._lock:
+            self._stats.aborted_streams += 1
+
+    def _count_chat(self) -> None:
+        with self._lock:
+            self._stats.chat_requests += 1
+
+    def _count_embeddings(self, texts: int) -> None:
+        with self._lock:
+            self._stats.embedding_requests += 1
+            self._stats.embedded_texts += texts
+
+    def _enter(self) -> None:
+        with self._lock:
+            self._stats.in_flight += 1
+            self._stats.max_in_flight = max(self._stats.max_in_flight, self._stats.in_flight)
+
+    def _leave(self) -> None:
+        with self._lock:
+            self._stats.in_flight -= 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local GigaChat API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-distribution", default="fixed", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--completion-words", type=int, default=20)
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.0)
+    parser.add_argument("--no-check-token", dest="check_token", action="store_false")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        throttle_rate=args.throttle_rate,
+        completion_words=args.completion_words,
+        stream_chunk_delay=args.stream_chunk_delay,
+        check_token=args.check_token,
+    )
+    server = StubServer(config, args.host, args.port)
+    print(f"GigaChat stub listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
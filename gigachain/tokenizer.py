@@ -0,0 +1,131 @@
+"""Local token counting for GigaChat.
+
+Exact counts need the GigaChat vocabulary as a HuggingFace ``tokenizer.json``
+file and the ``tokenizers`` package (``pip install tokenizers``). The file is
+loaded on the first count and shared by every model pointing at it. Without a
+vocabulary, or in the approximate mode, tokens are estimated from word
+lengths in a single regex pass. Estimates are good enough for budgets and
+chunk sizes, not for billing.
+"""
+import logging
+import math
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .cache import LRUCache
+
+try:
+    import tokenizers
+except ImportError:
+    tokenizers = None
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD = 3
+"""Default tokens added per chat message for the role markup around it.
+
+GigaChat does not publish its chat template. This is the per-message
+overhead of the OpenAI chat format (``<|start|>role<|message|>...<|end|>``),
+an estimate that is not measured against GigaChat, see the
+``message_token_overhead`` field of the model to change it.
+"""
+
+_WORD = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_CYRILLIC = re.compile(r"[Ѐ-ӿ]")
+
+
+def approximate_num_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Estimate tokens of ``text``: a token per punctuation mark, words split every ``chars_per_token`` chars.
+
+    Cyrillic words are split every ``chars_per_token - 1`` chars, BPE
+    vocabularies spend more tokens on them.
+    """
+    count = 0
+    for word in _WORD.findall(text):
+        size = len(word)
+        if size <= 3:
+            count += 1
+            continue
+        step = chars_per_token - 1 if _CYRILLIC.match(word) else chars_per_token
+        count += math.ceil(size / step)
+    return count
+
+
+class TokenCounter:
+    """Counts GigaChat tokens locally.
+
+    With ``approximate=True`` or without ``vocab_path`` counts are estimated
+    by :func:`approximate_num_tokens`. Otherwise the vocabulary is loaded on
+    first use and exact counts of recent strings are memoized, text splitters
+    measure the same chunks several times. Token ids always come from the
+    vocabulary, also in the approximate mode.
+    """
+
+    def __init__(self, vocab_path: Optional[str] = None, approximate: bool = False, cache_size: int = 4096):
+        if vocab_path is not None and not approximate and tokenizers is None:
+            raise ImportError(
+                "Exact GigaChat token counts need the tokenizers package, "
+                "install it with `pip install tokenizers` or use the approximate mode")
+        self.vocab_path = vocab_path
+        self.approximate = approximate or vocab_path is None
+        self._tokenizer: Any = None
+        self._lock = threading.Lock()
+        self._counts: LRUCache[int] = LRUCache(cache_size)
+
+    @property
+    def has_vocabulary(self) -> bool:
+        """Whether :meth:`encode` can return GigaChat token ids"""
+        return self.vocab_path is not None and tokenizers is not None
+
+    def _get_tokenizer(self) -> Any:
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    logger.debug("Loading GigaChat vocabulary from %s", self.vocab_path)
+                    self._tokenizer = tokenizers.Tokenizer.from_file(self.vocab_path)
+        return self._tokenizer
+
+    def encode(self, text: str) -> List[int]:
+        """Token ids of ``text``, raises :class:`ValueError` without a vocabulary"""
+        if not self.has_vocabulary:
+            raise ValueError("Token ids need a GigaChat vocabulary and the tokenizers package")
+        return self._get_tokenizer().encode(text, add_special_tokens=False).ids
+
+    def count(self, text: str) -> int:
+        if self.approximate:
+            return approximate_num_tokens(text)
+        count = self._counts.get(text)
+        if count is None:
+            count = len(self.encode(text))
+            self._counts.set(text, count)
+        return count
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        """Counts of many strings, the vocabulary encodes the uncached ones in parallel"""
+        if self.approximate:
+            return [approximate_num_tokens(text) for text in texts]
+        counts: List[Optional[int]] = [self._counts.get(text) for text in texts]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            encodings = self._get_tokenizer().encode_batch(
+                [texts[i] for i in missing], add_special_tokens=False)
+            for i, encoding in zip(missing, encodings):
+                counts[i] = len(encoding.ids)
+                self._counts.set(texts[i], counts[i])
+        return counts  # type: ignore[return-value]
+
+
+_counters: Dict[Tuple[Optional[str], bool], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(vocab_path: Optional[str] = None, approximate: bool = False) -> TokenCounter:
+    """Return a counter shared by all models using the same vocabulary"""
+    key = (vocab_path, approximate or vocab_path is None)
+    with _counters_lock:
+        counter = _counters.get(key)
+        if counter is None:
+            counter = TokenCounter(vocab_path, approximate)
+            _counters[key] = counter
+        return counter
@@ -0,0 +1,501 @@
+"""Pooled keep-alive HTTP transports for GigaChat"""
+import asyncio
+import contextvars
+import socket
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import (Any, AsyncIterator, Dict, Iterator, Mapping, Optional,
+                    Tuple, Union)
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .errors import RequestCancelledError
+from .metrics import phase_total, record_phase
+from .serialization import loads
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+@dataclass
+class TransportStats:
+    """Snapshot of connection pool statistics"""
+
+    requests: int
+    connections: int
+    in_flight: int
+    wait_time: float
+    max_wait_time: float
+
+    @property
+    def reuse_rate(self) -> float:
+        """Share of requests served over an already open connection"""
+        if self.requests == 0:
+            return 0.0
+        return max(0.0, 1.0 - self.connections / self.requests)
+
+    @property
+    def avg_wait_time(self) -> float:
+        """Average time in seconds a request waited for a free connection"""
+        if self.requests == 0:
+            return 0.0
+        return self.wait_time / self.requests
+
+
+class _PoolCounters:
+    """Thread-safe request and connection counters shared by both transports"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._connections = 0
+        self._in_flight = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def _on_new_connection(self) -> None:
+        with self._lock:
+            self._connections += 1
+
+    def _on_request_start(self, waited: float) -> None:
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+            self._wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+
+    def _on_request_end(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self) -> TransportStats:
+        with self._lock:
+            return TransportStats(
+                requests=self._requests,
+                connections=self._connections,
+                in_flight=self._in_flight,
+                wait_time=self._wait_time,
+                max_wait_time=self._max_wait_time,
+            )
+
+
+class CancelScope:
+    """Lets another thread abort the requests sent in this scope, see :func:`cancel_scope`.
+
+    :meth:`cancel` shuts down the sockets of requests in flight, the blocked
+    calls fail with a connection error, and later requests of the scope fail
+    with :class:`RequestCancelledError` before being sent. Their pool slots
+    and permits are released as the errors unwind.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._connections: set = set()
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            sock = getattr(conn, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _attach(self, conn: Any) -> None:
+        with self._lock:
+            if self.cancelled:
+                raise RequestCancelledError("Request was cancelled before it was sent")
+            self._connections.add(conn)
+
+    def _detach(self, conn: Any) -> None:
+        # Before the connection goes back to the pool, a cancel must not reach its next user
+        with self._lock:
+            self._connections.discard(conn)
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._connections.clear()
+
+    def _check(self) -> None:
+        # A socket connected after cancel() is not shut down by it
+        with self._lock:
+            if self.cancelled:
+                raise RequestCancelledError("Request was cancelled while connecting")
+
+
+_cancel_scope: "contextvars.ContextVar[Optional[CancelScope]]" = contextvars.ContextVar(
+    "gigachain_cancel_scope", default=None)
+
+
+@contextmanager
+def cancel_scope(scope: CancelScope) -> Iterator[CancelScope]:
+    """Make sync requests sent by this thread inside the block cancellable through ``scope``"""
+    token = _cancel_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _cancel_scope.reset(token)
+
+
+def _check_cancelled() -> None:
+    scope = _cancel_scope.get()
+    if scope is not None:
+        scope._check()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self) -> None:
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            record_phase("connect", time.perf_counter() - started)
+        _check_cancelled()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self) -> None:
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            record_phase("connect", time.perf_counter() - started)
+        _check_cancelled()
+
+
+class _CancellablePool:
+    """Connection pool mixin registering connections in use with the current :class:`CancelScope`"""
+
+    def _make_request(self, conn: Any, *args: Any, **kwargs: Any) -> Any:
+        scope = _cancel_scope.get()
+        if scope is not None:
+            scope._attach(conn)
+        return super()._make_request(conn, *args, **kwargs)
+
+    def _put_conn(self, conn: Any) -> None:
+        scope = _cancel_scope.get()
+        if scope is not None and conn is not None:
+            scope._detach(conn)
+        super()._put_conn(conn)
+
+
+class _PoolAdapter(HTTPAdapter):
+    """HTTPAdapter that reports every newly opened connection to the transport
+    and the time spent connecting to the current request trace"""
+
+    def __init__(self, transport: "HTTPTransport", **kwargs: Any):
+        self._transport = transport
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        transport = self._transport
+
+        class _HTTPPool(_CancellablePool, HTTPConnectionPool):
+            ConnectionCls = _TimedHTTPConnection
+
+            def _new_conn(self):
+                transport._on_new_connection()
+                return super()._new_conn()
+
+        class _HTTPSPool(_CancellablePool, HTTPSConnectionPool):
+            ConnectionCls = _TimedHTTPSConnection
+
+            def _new_conn(self):
+                transport._on_new_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPPool, "https": _HTTPSPool}
+
+
+class HTTPTransport(_PoolCounters):
+    """Thread-safe keep-alive connection pool for a single GigaChat endpoint.
+
+    At most ``pool_maxsize`` requests are in flight at once, extra callers wait
+    for a free connection instead of opening new sockets.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        pool_maxsize: int = 10,
+        connect_timeout: float = 5,
+        read_timeout: float = 600,
+    ):
+        super().__init__()
+        self.api_url = api_url.rstrip("/")
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._session = requests.Session()
+        adapter = _PoolAdapter(self, pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(pool_maxsize)
+
+    @contextmanager
+    def _slot(self) -> Iterator[None]:
+        started = time.perf_counter()
+        self._slots.acquire()
+        waited = time.perf_counter() - started
+        self._on_request_start(waited)
+        record_phase("pool_wait", waited)
+        try:
+            yield
+        finally:
+            scope = _cancel_scope.get()
+            if scope is not None:
+                # Connections still attached were closed or discarded
+                scope._clear()
+            self._on_request_end()
+            self._slots.release()
+
+    def request(
+        self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs: Any
+    ) -> requests.Response:
+        """Send a request to ``api_url + path`` over a pooled connection"""
+        with self._slot():
+            response = self._send(method, path, timeout, **kwargs)
+            received = time.perf_counter()
+            response.content  # read the body and release the connection
+            record_phase("body_read", time.perf_counter() - received)
+            return response
+
+    def _send(self, method: str, path: str, timeout: Optional[Timeout], **kwargs: Any) -> requests.Response:
+        """Send a request and return once the response headers are received"""
+        connected = phase_total("connect")
+        started = time.perf_counter()
+        response = self._session.request(
+            method, self.api_url + path, timeout=timeout or self.timeout, stream=True, **kwargs
+        )
+        record_phase("time_to_first_byte", time.perf_counter() - started - (phase_total("connect") - connected))
+        return response
+
+    def post(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    @contextmanager
+    def stream(
+        self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs: Any
+    ) -> Iterator[requests.Response]:
+        """Send a request and keep its connection until the body is consumed.
+
+        Leaving the context closes the response, which aborts an unfinished
+        download instead of draining it.
+        """
+        with self._slot():
+            with self._send(method, path, timeout, **kwargs) as response:
+                yield response
+
+    def close(self) -> None:
+        self._session.close()
+
+
+_transports: Dict[Tuple[str, int, float, float], HTTPTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(
+    api_url: str,
+    pool_maxsize: int = 10,
+    connect_timeout: float = 5,
+    read_timeout: float = 600,
+) -> HTTPTransport:
+    """Return a transport shared by all models with the same ``api_url``, pool and timeouts"""
+    key = (api_url.rstrip("/"), pool_maxsize, connect_timeout, read_timeout)
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = HTTPTransport(api_url, pool_maxsize, connect_timeout, read_timeout)
+            _transports[key] = transport
+        return transport
+
+
+@dataclass
+class AsyncResponse:
+    """Fully read response of the async transport, mimics ``requests.Response``"""
+
+    status_code: int
+    content: bytes
+    headers: Mapping[str, str] = field(default_factory=CaseInsensitiveDict)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return loads(self.content)
+
+
+class _LoopState:
+    """aiohttp session and concurrency semaphore bound to one event loop.
+
+    The session is closed when the loop shuts down: :func:`asyncio.run`
+    finalizes the async generators of its loop before closing it, and the
+    state keeps one suspended until then.
+    """
+
+    def __init__(self, transport: "AsyncHTTPTransport"):
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            transport._on_new_connection()
+            record_phase("connect", time.perf_counter() - context.connect_started)
+
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        connector = aiohttp.TCPConnector(limit=transport.max_concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+        self.semaphore = asyncio.Semaphore(transport.max_concurrency)
+        self._shutdown_hook: Optional[AsyncIterator[None]] = None
+
+    async def start(self, transport: "AsyncHTTPTransport", loop: asyncio.AbstractEventLoop) -> None:
+        self._shutdown_hook = self._close_at_shutdown(transport, loop)
+        await self._shutdown_hook.__anext__()
+
+    async def _close_at_shutdown(
+        self, transport: "AsyncHTTPTransport", loop: asyncio.AbstractEventLoop
+    ) -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            # The session refers to the loop, the entry would keep the loop alive otherwise
+            transport._forget(loop, self)
+            await self.session.close()
+
+    async def close(self) -> None:
+        await self._shutdown_hook.aclose()
+
+
+class AsyncHTTPTransport(_PoolCounters):
+    """Non-blocking keep-alive connection pool for a single GigaChat endpoint.
+
+    A semaphore caps the number of in-flight requests at ``max_concurrency``,
+    so one event loop can safely drive hundreds of concurrent calls.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        max_concurrency: int = 64,
+        connect_timeout: float = 5,
+        read_timeout: float = 600,
+    ):
+        super().__init__()
+        self.api_url = api_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = (connect_timeout, read_timeout)
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = (
+            weakref.WeakKeyDictionary())
+
+    async def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._states.get(loop)
+            if state is not None:
+                return state
+            # Loops closed without finalizing their async generators, nothing can close their sessions now
+            for closed in [other for other in self._states if other.is_closed()]:
+                del self._states[closed]
+            state = self._states[loop] = _LoopState(self)
+        await state.start(self, loop)
+        return state
+
+    def _forget(self, loop: asyncio.AbstractEventLoop, state: _LoopState) -> None:
+        with self._lock:
+            if self._states.get(loop) is state:
+                del self._states[loop]
+
+    @staticmethod
+    def _client_timeout(timeout: Timeout) -> aiohttp.ClientTimeout:
+        if isinstance(timeout, tuple):
+            return aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        return aiohttp.ClientTimeout(total=timeout)
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs: Any
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Send a request and yield the response before its body is read"""
+        auth = kwargs.pop("auth", None)
+        if isinstance(auth, tuple):
+            kwargs["auth"] = aiohttp.BasicAuth(*auth)
+        state = await self._state()
+
+        started = time.perf_counter()
+        async with state.semaphore:
+            waited = time.perf_counter() - started
+            self._on_request_start(waited)
+            record_phase("pool_wait", waited)
+            try:
+                connected = phase_total("connect")
+                started = time.perf_counter()
+                async with state.session.request(
+                    method,
+                    self.api_url + path,
+                    timeout=self._client_timeout(timeout or self.timeout),
+                    **kwargs,
+                ) as response:
+                    record_phase("time_to_first_byte",
+                                 time.perf_counter() - started - (phase_total("connect") - connected))
+                    yield response
+            finally:
+                self._on_request_end()
+
+    async def request(
+        self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs: Any
+    ) -> AsyncResponse:
+        """Send a request to ``api_url + path`` and read the whole body"""
+        async with self.stream(method, path, timeout=timeout, **kwargs) as response:
+            received = time.perf_counter()
+            content = await response.read()
+            record_phase("body_read", time.perf_counter() - received)
+            return AsyncResponse(response.status, content, CaseInsensitiveDict(response.headers))
+
+    async def post(self, path: str, **kwargs: Any) -> AsyncResponse:
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self) -> None:
+        """Close the session bound to the running event loop"""
+        with self._lock:
+            state = self._states.get(asyncio.get_running_loop())
+        if state is not None:
+            await state.close()
+
+
+_async_transports: Dict[Tuple[str, int, float, float], AsyncHTTPTransport] = {}
+
+
+def get_async_transport(
+    api_url: str,
+    max_concurrency: int = 64,
+    connect_timeout: float = 5,
+    read_timeout: float = 600,
+) -> AsyncHTTPTransport:
+    """Return an async transport shared by all models with the same ``api_url``, limit and timeouts"""
+    key = (api_url.rstrip("/"), max_concurrency, connect_timeout, read_timeout)
+    with _transports_lock:
+        transport = _async_transports.get(key)
+        if transport is None:
+            transport = AsyncHTTPTransport(api_url, max_concurrency, connect_timeout, read_timeout)
+            _async_transports[key] = transport
+        return transport
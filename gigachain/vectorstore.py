@@ -0,0 +1,311 @@
+"""In-process vector index on a NumPy matrix"""
+import json
+import os
+import tempfile
+import threading
+import uuid
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Tuple, Type)
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+from langchain.vectorstores.utils import maximal_marginal_relevance
+
+_VECTORS = "vectors.npy"
+_INDEX = "index.json"
+
+
+def _atomic_write(path: str, write: Callable[[Any], None]) -> None:
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".gigachain-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class NumpyVectorStore(VectorStore):
+    """Vector store keeping all embeddings in one contiguous float32 matrix.
+
+    A query is a single matrix-vector product and ``argpartition``, many
+    queries at once are a matrix product, see :meth:`similarity_search_batch`.
+    Scores are cosine similarities with ``normalize`` (the default), inner
+    products otherwise.
+
+    :meth:`save` writes the matrix as ``.npy`` and :meth:`load` maps it back
+    into memory without reading it, so startup does not depend on the corpus
+    size. Texts can be added and deleted afterwards, the first change copies
+    the matrix into memory.
+    """
+
+    def __init__(self, embedding: Embeddings, normalize: bool = True):
+        self.embedding = embedding
+        self.normalize = normalize
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _prepare(self, vectors: Any) -> np.ndarray:
+        vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            vectors /= norms
+        return vectors
+
+    def _reserve(self, count: int, dimensions: int) -> None:
+        """Make room for ``count`` more rows in a writable in-memory matrix"""
+        matrix = self._matrix
+        needed = self._size + count
+        if matrix is not None and matrix.shape[1] != dimensions:
+            raise ValueError(f"Embeddings have {dimensions} dimensions, the index has {matrix.shape[1]}")
+        # A loaded matrix may be a read-only memory map or have no spare rows
+        if matrix is not None and matrix.flags.writeable and not isinstance(matrix, np.memmap) \
+                and len(matrix) >= needed:
+            return
+        capacity = max(needed, 2 * len(matrix) if matrix is not None else 0, 64)
+        grown = np.empty((capacity, dimensions), dtype=np.float32)
+        if matrix is not None:
+            grown[:self._size] = matrix[:self._size]
+        self._matrix = grown
+
+    def add_embeddings(
+        self,
+        texts: Sequence[str],
+        embeddings: Any,
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+        ids: Optional[Sequence[str]] = None,
+    ) -> List[str]:
+        """Add texts with precomputed embeddings, texts with an existing id replace it"""
+        vectors = self._prepare(embeddings)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(texts)} texts and {len(vectors)} embeddings")
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        with self._lock:
+            self._reserve(len(texts), vectors.shape[1])
+            for id_, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                row = self._rows.get(id_)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._rows[id_] = row
+                    self._ids.append(id_)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                else:
+                    self._texts[row] = text
+                    self._metadatas[row] = metadata
+                self._matrix[row] = vector
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, await self.embedding.aembed_documents(texts), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete by id, the last row takes the place of a deleted one"""
+        if ids is None:
+            return False
+        with self._lock:
+            # Once per row, a repeated id would otherwise delete the row moved into its place
+            rows = {self._rows[id_] for id_ in ids if id_ in self._rows}
+            if not rows:
+                return False
+            self._reserve(0, self._matrix.shape[1])
+            # From the bottom up, so a moved row is never one still to be deleted
+            for row in sorted(rows, reverse=True):
+                last = self._size - 1
+                del self._rows[self._ids[row]]
+                if row != last:
+                    self._matrix[row] = self._matrix[last]
+                    self._ids[row] = self._ids[last]
+                    self._texts[row] = self._texts[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                self._texts.pop()
+                self._metadatas.pop()
+                self._size = last
+        return True
+
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self._texts[row], metadata=self._metadatas[row])
+
+    def _mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        return np.array([all(metadata.get(key) == value for key, value in filter.items())
+                         for metadata in self._metadatas], dtype=bool)
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Rows of the ``k`` best scores of every query row, best first"""
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return np.empty((len(scores), 0), dtype=np.intp)
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+    def _search(
+        self, queries: Any, k: int, filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        queries = self._prepare(queries)
+        with self._lock:
+            if self._size == 0:
+                return [[] for _ in queries]
+            scores = queries @ self._matrix[:self._size].T
+            mask = self._mask(filter)
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            results = []
+            for query_scores, rows in zip(scores, self._top_k(scores, k)):
+                results.append([(self._document(row), float(query_scores[row]))
+                                for row in rows if query_scores[row] != -np.inf])
+            return results
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self._search([embedding], k, filter)[0]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_batch(
+        self, queries: List[str], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Best ``k`` documents with scores for every query, in one matrix product"""
+        if not queries:
+            return []
+        return self._search(self.embedding.embed_documents(queries), k, filter)
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        if not self.normalize:
+            raise NotImplementedError("Relevance scores need normalized embeddings")
+        return lambda score: (score + 1) / 2
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        query = self._prepare([embedding])
+        with self._lock:
+            if self._size == 0:
+                return []
+            scores = query @ self._matrix[:self._size].T
+            mask = self._mask(filter)
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            rows = [row for row in self._top_k(scores, fetch_k)[0] if scores[0, row] != -np.inf]
+            candidates = np.array(self._matrix[rows])
+            selected = maximal_marginal_relevance(query[0], candidates, lambda_mult, k)
+            return [self._document(rows[i]) for i in selected]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding.embed_query(query), k, fetch_k, lambda_mult, filter)
+
+    def save(self, path: str) -> None:
+        """Write the index to the ``path`` directory"""
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            matrix = self._matrix[:self._size] if self._matrix is not None else np.empty((0, 0), np.float32)
+            index = {"normalize": self.normalize, "ids": self._ids, "texts": self._texts,
+                     "metadatas": self._metadatas}
+            _atomic_write(os.path.join(path, _VECTORS), lambda f: np.save(f, matrix))
+            _atomic_write(os.path.join(path, _INDEX),
+                          lambda f: f.write(json.dumps(index, ensure_ascii=False).encode("utf-8")))
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, mmap: bool = True) -> "NumpyVectorStore":
+        """Open an index written by :meth:`save`, mapping the matrix into memory unless ``mmap`` is false"""
+        with open(os.path.join(path, _INDEX), encoding="utf-8") as f:
+            index = json.load(f)
+        matrix = np.load(os.path.join(path, _VECTORS), mmap_mode="r" if mmap else None)
+        if len(matrix) != len(index["ids"]):
+            raise ValueError(f"Index at {path} is inconsistent: {len(matrix)} vectors, {len(index['ids'])} texts")
+        store = cls(embedding, normalize=index["normalize"])
+        store._matrix = matrix if len(matrix) else None
+        store._size = len(matrix)
+        store._ids = index["ids"]
+        store._texts = index["texts"]
+        store._metadatas = index["metadatas"]
+        store._rows = {id_: row for row, id_ in enumerate(store._ids)}
+        return store
+
+    @classmethod
+    def from_texts(
+        cls: Type["NumpyVectorStore"],
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        normalize: bool = True,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding, normalize=normalize)
+        store.add_texts(texts, metadatas, ids)
+        return store
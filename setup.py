@@ -7,4 +7,8 @@ setup(
     install_requires=[
        'langchain>=0.0.264'
     ],
+    extras_require={
+       'fast': ['orjson'],
+       'tokenizer': ['tokenizers'],
+    },
 )
\ No newline at end of file
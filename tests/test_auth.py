@@ -0,0 +1,38 @@
+import json
+import time
+
+from gigachain.auth import TokenManager
+from gigachain.testing import StubConfig, StubServer
+from gigachain.transport import HTTPTransport
+
+
+def manager(server, **kwargs) -> TokenManager:
+    return TokenManager(HTTPTransport(server.url), "user", "password", **kwargs)
+
+
+def test_short_lived_token_is_reused():
+    with StubServer(StubConfig(token_ttl=2)) as server:
+        tokens = manager(server)
+        assert len({tokens.get_token() for _ in range(3)}) == 1
+        assert server.stats().token_requests == 1
+
+
+def test_token_is_shared_through_cache_dir(tmp_path):
+    with StubServer(StubConfig(token_ttl=2)) as server:
+        token = manager(server, cache_dir=str(tmp_path)).get_token()
+        assert manager(server, cache_dir=str(tmp_path)).get_token() == token
+        assert server.stats().token_requests == 1
+        [path] = tmp_path.glob("gigachat-token-*.json")
+        assert 1 < json.loads(path.read_text())["ttl"] < 3
+
+
+def test_token_is_refreshed_before_it_goes_stale():
+    with StubServer(StubConfig(token_ttl=4)) as server:
+        tokens = manager(server)
+        first = tokens.get_token()
+        # Fresh until two seconds before expiry, the background refresh comes just before that
+        time.sleep(2.3)
+        assert server.stats().token_requests == 2
+        assert tokens.get_token() != first
+        assert server.stats().token_requests == 2
+
@@ -0,0 +1,55 @@
+import asyncio
+
+from gigachain.balancer import LoadBalancer, get_balancer
+
+URLS = ["http://first.test", "http://second.test"]
+
+
+def hedging_balancer() -> LoadBalancer:
+    balancer = LoadBalancer(URLS, hedge_percentile=0.5, hedge_min_samples=1)
+    balancer._latencies.append(0.5)
+    return balancer
+
+
+def test_async_hedge_returns_faster_answer():
+    balancer = hedging_balancer()
+    balancer._latencies[0] = 0.02
+
+    async def answer(endpoint):
+        await asyncio.sleep(1 if endpoint.api_url == URLS[0] else 0.01)
+        return endpoint.api_url
+
+    assert asyncio.run(balancer.acall(answer)) == URLS[1]
+    stats = balancer.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    assert [e["outstanding"] for e in stats["endpoints"]] == [0, 0]
+
+
+def test_cancelled_caller_cancels_request_before_hedge():
+    balancer = hedging_balancer()
+    finished = []
+
+    async def slow(endpoint):
+        try:
+            await asyncio.sleep(1)
+        finally:
+            finished.append(endpoint.api_url)
+
+    async def main():
+        call = asyncio.ensure_future(balancer.acall(slow))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        # The request is cancelled with the caller, not left running in the background
+        await asyncio.sleep(0)
+        return list(finished)
+
+    assert asyncio.run(main()) == [URLS[0]]
+    assert [e["outstanding"] for e in balancer.stats()["endpoints"]] == [0, 0]
+
+
+def test_balancers_are_shared_per_timeouts():
+    assert get_balancer(URLS, read_timeout=60) is get_balancer(URLS, read_timeout=60)
+    assert get_balancer(URLS, read_timeout=60).read_timeout == 60
+    assert get_balancer(URLS, read_timeout=120).read_timeout == 120
+    assert get_balancer(URLS, connect_timeout=1).connect_timeout == 1
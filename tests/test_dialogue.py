@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, List, Optional
+
+import pytest
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult, SystemMessage
+
+from gigachain import DialogueAgent, DialogueSimulator
+from gigachain.dialogue import Transcript
+
+
+class SlowChat(BaseChatModel):
+    """Answers after ``delay`` seconds, counting prompts and cancellations"""
+
+    delay: float = 0.05
+    prompts: List[str] = []
+    cancelled: int = 0
+    active: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow"
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        self.active += 1
+        try:
+            # The second contestant is the slowest, that reply is still running when the first one is done
+            await asyncio.sleep(self.delay * (3 if prompt.endswith("Борис:") else 1))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"ответ {len(self.prompts)}"))])
+
+
+def quiz(model: SlowChat, **kwargs: Any) -> DialogueSimulator:
+    """A host heard by two contestants who don't hear each other"""
+    agents = [
+        DialogueAgent("Ведущий", SystemMessage(content="host"), model),
+        DialogueAgent("Анна", SystemMessage(content="first"), model, hears=["Ведущий"]),
+        DialogueAgent("Борис", SystemMessage(content="second"), model, hears=["Ведущий"]),
+    ]
+    return DialogueSimulator(agents, speculate=True, **kwargs)
+
+
+def test_transcript_text_from_any_line():
+    transcript = Transcript()
+    transcript.append("a", "one")
+    assert transcript.text() == "a: one\n"
+    transcript.append("b", "two")
+    assert transcript.text() == "a: one\nb: two\n"
+    assert transcript.text(1) == "b: two\n"
+    assert transcript.view(hears=["b"]).text() == "b: two\n"
+    assert transcript.view(window=1).text() == "b: two\n"
+
+
+def test_speculation_hit():
+    model = SlowChat()
+    simulator = quiz(model)
+    turns = asyncio.run(simulator.arun(6))
+    assert [name for name, _ in turns] == ["Ведущий", "Анна", "Борис"] * 2
+    # The second contestant answers while the first one is still answering
+    assert simulator.stats.speculated == simulator.stats.speculation_hits == 2
+    assert model.cancelled == 0
+    assert model.prompts[2].endswith("Борис:") and "Анна" not in model.prompts[2]
+
+
+def test_stale_speculation_is_cancelled():
+    model = SlowChat()
+    injected = [0]
+
+    def contestants(step, agents):
+        return 1 + (step - injected[0]) % 2
+
+    simulator = quiz(model, selection_function=contestants)
+
+    async def main():
+        assert (await simulator.astep())[0] == "Анна"
+        # Борис hears the host, the reply started for him is stale now
+        simulator.inject("Ведущий", "Подсказка")
+        injected[0] += 1
+        simulator.speculate = False
+        name, _ = await simulator.astep()
+        return name
+
+    assert asyncio.run(main()) == "Борис"
+    assert (simulator.stats.speculated, simulator.stats.speculation_hits) == (1, 0)
+    assert model.cancelled == 1
+    assert "Подсказка" in model.prompts[-1]
+
+
+def test_cancelled_turns_leave_nothing_running():
+    model = SlowChat(delay=0.2)
+    simulator = quiz(model)
+
+    async def main():
+        consumer = asyncio.ensure_future(simulator.arun(6))
+        await asyncio.sleep(0.3)
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+        await asyncio.sleep(0)
+        return model.active
+
+    assert asyncio.run(main()) == 0
+    assert model.cancelled >= 1
+    assert simulator._speculation is None
+
+
+def test_closing_turns_early_drops_speculation():
+    model = SlowChat()
+    simulator = quiz(model)
+
+    async def main():
+        turns = simulator.aiter_turns(6)
+        first = [await turns.__anext__(), await turns.__anext__()]
+        # The reply of Борис was started during the turn of Анна
+        assert simulator._speculation is not None
+        await turns.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    assert [name for name, _ in asyncio.run(main())] == ["Ведущий", "Анна"]
+    assert simulator._speculation is None
+    assert model.cancelled == 1
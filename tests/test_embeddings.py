@@ -0,0 +1,122 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from gigachain.embeddings import (EmbeddingCache, GigaChatEmbeddings,
+                                  LocalEmbeddings, hash_embedding)
+from gigachain.testing import StubConfig, StubServer
+
+
+@pytest.fixture(scope="module")
+def server():
+    with StubServer(StubConfig()) as server:
+        yield server
+
+
+def embeddings(server, **kwargs) -> GigaChatEmbeddings:
+    return GigaChatEmbeddings(api_url=server.url, user="user", password="password", **kwargs)
+
+
+def test_cache_rejects_other_dimensions(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many([b"a" * 32], np.ones((1, 4), dtype=np.float32))
+    with pytest.raises(ValueError):
+        cache.put_many([b"b" * 32], np.ones((1, 8), dtype=np.float32))
+    assert len(cache) == 1
+    # A new process sees the stored rows and still rejects other dimensions
+    reopened = EmbeddingCache(str(tmp_path))
+    assert reopened.get_many([b"a" * 32])[0].tolist() == [1.0] * 4
+    with pytest.raises(ValueError):
+        reopened.put_many([b"c" * 32], np.ones((1, 8), dtype=np.float32))
+
+
+def test_cache_drops_half_written_tail(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many([b"a" * 32, b"b" * 32], np.arange(8, dtype=np.float32).reshape(2, 4))
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(b"\0" * 6)
+    reopened = EmbeddingCache(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get_many([b"b" * 32])[0].tolist() == [4.0, 5.0, 6.0, 7.0]
+
+
+def test_models_share_cache_dir(tmp_path):
+    small = LocalEmbeddings(cache_dir=str(tmp_path), dimensions=16)
+    large = LocalEmbeddings(cache_dir=str(tmp_path), dimensions=32)
+    assert len(small.embed_documents(["one text"])[0]) == 16
+    assert len(large.embed_documents(["one text"])[0]) == 32
+    assert len(LocalEmbeddings(cache_dir=str(tmp_path), dimensions=16).embed_documents(["one text"])[0]) == 16
+
+
+def test_batches_deduplicates_and_caches(server, tmp_path):
+    server.reset_stats()
+    model = embeddings(server, cache_dir=str(tmp_path), batch_size=2)
+    texts = ["a", "b", "c", "a", "d", "b"]
+    vectors = model.embed_documents(texts)
+    assert [np.allclose(vector, hash_embedding(text)) for vector, text in zip(vectors, texts)] == [True] * 6
+    stats = server.stats()
+    assert (stats.embedding_requests, stats.embedded_texts, stats.chat_requests) == (2, 4, 0)
+
+    # Only the new text is sent, also from a fresh model on the same directory
+    embeddings(server, cache_dir=str(tmp_path), batch_size=2).embed_documents(["a", "e"])
+    assert server.stats().embedded_texts == 5
+
+
+def test_queries_are_not_stored_by_default(server, tmp_path):
+    server.reset_stats()
+    model = embeddings(server, cache_dir=str(tmp_path))
+    model.embed_query("question")
+    model.embed_query("question")
+    assert server.stats().embedding_requests == 2
+    model.embed_documents(["question"])
+    model.embed_query("question")
+    assert server.stats().embedding_requests == 3
+
+    caching = embeddings(server, cache_dir=str(tmp_path), cache_queries=True)
+    caching.embed_query("other question")
+    caching.embed_query("other question")
+    assert server.stats().embedding_requests == 4
+
+
+def test_async_embeddings(server):
+    server.reset_stats()
+    model = embeddings(server, batch_size=1, max_concurrency=3)
+    vectors = asyncio.run(model.aembed_documents(["x", "y", "z"]))
+    assert np.allclose(vectors[2], hash_embedding("z"))
+    assert server.stats().max_in_flight <= 3
+
+
+def test_memory_cache_is_bounded():
+    cache = EmbeddingCache(max_size=2)
+    cache.put_many([b"a" * 32, b"b" * 32], np.ones((2, 4), dtype=np.float32))
+    cache.get_many([b"a" * 32])
+    cache.put_many([b"c" * 32], np.ones((1, 4), dtype=np.float32))
+    assert len(cache) == 2
+    assert [vector is None for vector in cache.get_many([b"a" * 32, b"b" * 32, b"c" * 32])] == [False, True, False]
+
+
+def test_models_without_cache_dir_share_bounded_cache():
+    model = LocalEmbeddings(memory_cache_size=3)
+    model.embed_documents([f"text {i}" for i in range(10)])
+    assert len(model._cache()) == 3
+    assert model._cache() is LocalEmbeddings(memory_cache_size=3)._cache()
+
+
+def test_async_writes_leave_event_loop(tmp_path, monkeypatch):
+    loop_threads = []
+    put_many = EmbeddingCache.put_many
+
+    def recording(self, keys, vectors):
+        try:
+            asyncio.get_running_loop()
+            loop_threads.append(True)
+        except RuntimeError:
+            loop_threads.append(False)
+        return put_many(self, keys, vectors)
+
+    monkeypatch.setattr(EmbeddingCache, "put_many", recording)
+    model = LocalEmbeddings(cache_dir=str(tmp_path), batch_size=1)
+    asyncio.run(model.aembed_documents(["x", "y"]))
+    assert loop_threads == [False, False]
+    assert len(LocalEmbeddings(cache_dir=str(tmp_path))._cache()) == 2
@@ -0,0 +1,58 @@
+from typing import Any, List, Optional
+
+from langchain.llms.base import LLM
+from langchain.schema import AIMessage, HumanMessage
+
+from gigachain import TokenBudgetMemory
+
+
+class FailingLLM(LLM):
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "failing"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.calls += 1
+        raise ConnectionError("summarizer is down")
+
+
+class EchoLLM(LLM):
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        return "summary"
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+def talk(memory: TokenBudgetMemory, turns: int) -> None:
+    for turn in range(turns):
+        memory.add_messages([HumanMessage(content=f"question {turn}"), AIMessage(content=f"answer {turn}")])
+        memory.wait()
+
+
+def test_summarizes_evicted_messages():
+    memory = TokenBudgetMemory(llm=EchoLLM(), max_token_limit=8, token_counter=words)
+    talk(memory, 10)
+    messages = memory.messages
+    assert memory.summary == "summary"
+    assert messages[0].content == "summary"
+    assert messages[-1].content == "answer 9"
+    assert memory.buffer_tokens <= 8
+
+
+def test_failing_summarizer_keeps_history_bounded():
+    llm = FailingLLM()
+    memory = TokenBudgetMemory(llm=llm, max_token_limit=8, token_counter=words)
+    talk(memory, 50)
+    messages = memory.messages
+    assert llm.calls > 0
+    assert memory.summary == ""
+    assert sum(words(message.content) for message in messages) <= 2 * 8
+    assert messages[-1].content == "answer 49"
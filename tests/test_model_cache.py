@@ -0,0 +1,75 @@
+import asyncio
+
+import gigachain.gigachat_model as gigachat_model
+from gigachain import GigaChatModel, ResponseCache
+from gigachain.testing import StubConfig, StubServer
+
+
+def count_encodings(monkeypatch):
+    calls = []
+    encode = gigachat_model.encode_payload
+
+    def counting(payload):
+        calls.append(payload)
+        return encode(payload)
+
+    monkeypatch.setattr(gigachat_model, "encode_payload", counting)
+    return calls
+
+
+def test_cached_request_is_encoded_once(monkeypatch):
+    calls = count_encodings(monkeypatch)
+    with StubServer(StubConfig()) as server:
+        giga = GigaChatModel(api_url=server.url, user="user", password="password", temperature=0,
+                             response_cache=ResponseCache())
+        answer = giga.predict("Привет")
+        assert len(calls) == 1
+        assert giga.predict("Привет") == answer
+        assert len(calls) == 2
+        assert server.stats().chat_requests == 1
+
+
+def test_concurrent_identical_requests_are_coalesced(monkeypatch):
+    calls = count_encodings(monkeypatch)
+    with StubServer(StubConfig(latency=0.2)) as server:
+        giga = GigaChatModel(api_url=server.url, user="user", password="password", temperature=0)
+
+        async def main():
+            return await asyncio.gather(*(giga.apredict("Привет") for _ in range(3)))
+
+        assert len(set(asyncio.run(main()))) == 1
+        assert server.stats().chat_requests == 1
+        assert len(calls) == 3
+
+
+def test_sampled_answers_are_not_cached():
+    cache = ResponseCache()
+    with StubServer(StubConfig()) as server:
+        giga = GigaChatModel(api_url=server.url, user="user", password="password", temperature=0.7,
+                             response_cache=cache)
+        giga.predict("Привет")
+        giga.predict("Привет")
+        assert server.stats().chat_requests == 2
+    assert len(cache._memory) == 0
+
+
+def test_database_is_bounded(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(max_size=16, path=path)
+    for i in range(100):
+        cache.set(str(i), {"answer": i})
+    rows = cache._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert rows <= 16 + 16 // 8
+    assert ResponseCache(max_size=16, path=path).get("99") == {"answer": 99}
+    cache.close()
+
+
+def test_expired_rows_are_purged_on_open(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path=path)
+    cache.set("old", {"answer": 1})
+    cache._db.execute("UPDATE responses SET created = created - 3600")
+    cache.close()
+    reopened = ResponseCache(ttl=60, path=path)
+    assert reopened._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+    reopened.close()
@@ -0,0 +1,31 @@
+from langchain.schema import Document
+
+from gigachain import GigaChatModel, MapReduceSummarizer, ResponseCache, SelfCheckChain
+from gigachain.testing import StubConfig, StubServer
+
+TEXT = "\n\n".join(f"Абзац номер {i}. " * 20 for i in range(12))
+
+
+def test_summaries_survive_restart_with_response_cache(tmp_path):
+    path = str(tmp_path / "summaries.sqlite")
+    with StubServer(StubConfig()) as server:
+        giga = GigaChatModel(api_url=server.url, user="user", password="password")
+        first = MapReduceSummarizer(llm=giga, chunk_tokens=200, summary_cache=ResponseCache(path=path))
+        summary, _ = first.combine_docs([Document(page_content=TEXT)])
+        sent = server.stats().chat_requests
+        assert sent > 1
+
+        second = MapReduceSummarizer(llm=giga, chunk_tokens=200, summary_cache=ResponseCache(path=path))
+        assert second.combine_docs([Document(page_content=TEXT)])[0] == summary
+        assert server.stats().chat_requests == sent
+
+
+def test_checks_are_cached_in_memory():
+    with StubServer(StubConfig()) as server:
+        giga = GigaChatModel(api_url=server.url, user="user", password="password")
+        chain = SelfCheckChain(llm=giga)
+        chain.run("Какой город столица России?")
+        sent = server.stats().chat_requests
+        chain.run("Какой город столица России?")
+        assert server.stats().chat_requests - sent <= 3
+        assert len(chain.check_cache) == sent - 3
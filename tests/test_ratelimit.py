@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+from gigachain import GigaChatModel
+from gigachain.ratelimit import AdaptiveConcurrencyLimiter, RateLimiter
+from gigachain.testing import StubConfig, StubServer
+
+
+def test_first_byte_sets_the_latency():
+    limiter = RateLimiter(concurrency=AdaptiveConcurrencyLimiter())
+    with limiter.limit() as permit:
+        permit.first_byte()
+        time.sleep(0.1)
+    latency = limiter.stats()["baseline_latency"]
+    assert latency < 0.05
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_streams_are_measured_to_the_first_byte():
+    config = StubConfig(completion_words=10, stream_chunk_delay=0.02)
+    with StubServer(config) as server:
+        limiter = RateLimiter(concurrency=AdaptiveConcurrencyLimiter(initial_limit=4))
+        giga = GigaChatModel(api_url=server.url, user="user", password="password",
+                             streaming=True, rate_limiter=limiter)
+        giga.predict("Привет")
+
+        async def main():
+            return await giga.apredict("Привет")
+
+        asyncio.run(main())
+    stats = limiter.stats()
+    # Ten chunks take 0.2 seconds, the limit would shrink if they counted as latency
+    assert stats["baseline_latency"] < 0.1
+    assert stats["limit"] >= 4
+    assert stats["in_flight"] == 0
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from gigachain.errors import CircuitOpenError, ResponseError
+from gigachain.retry import CircuitBreaker, RetryPolicy, acall_with_retries, call_with_retries
+
+
+def failing(budget):
+    raise requests.ConnectionError("down")
+
+
+def test_retries_transient_errors_until_success():
+    attempts = []
+
+    def flaky(budget):
+        attempts.append(budget)
+        if len(attempts) < 3:
+            raise ResponseError(503, "busy")
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=3, backoff_base=0.01, jitter=False)
+    assert call_with_retries(policy, None, flaky) == "ok"
+    assert len(attempts) == 3
+
+
+def test_client_errors_are_not_retried():
+    attempts = []
+
+    def rejected(budget):
+        attempts.append(budget)
+        raise ResponseError(400, "bad request")
+
+    with pytest.raises(ResponseError):
+        call_with_retries(RetryPolicy(backoff_base=0.01), None, rejected)
+    assert len(attempts) == 1
+
+
+def test_breaker_opens_and_probe_closes_it():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            call_with_retries(None, breaker, failing)
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(None, breaker, lambda budget: "ok")
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert call_with_retries(None, breaker, lambda budget: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_probe_does_not_keep_breaker_open():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+    with pytest.raises(requests.ConnectionError):
+        call_with_retries(None, breaker, failing)
+
+    async def main():
+        await asyncio.sleep(0.06)
+
+        async def hang(budget):
+            await asyncio.sleep(10)
+
+        probe = asyncio.ensure_future(acall_with_retries(None, breaker, hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def answer(budget):
+            return "ok"
+
+        return await acall_with_retries(None, breaker, answer)
+
+    assert asyncio.run(main()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_interrupted_sync_probe_frees_the_probe():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    with pytest.raises(requests.ConnectionError):
+        call_with_retries(None, breaker, failing)
+
+    def interrupted(budget):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        call_with_retries(None, breaker, interrupted)
+    assert call_with_retries(None, breaker, lambda budget: "ok") == "ok"
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from gigachain import GigaChatModel
+from gigachain.errors import DeadlineExceededError
+from gigachain.retry import RetryPolicy
+from gigachain.scheduler import BATCH, INTERACTIVE, RequestScheduler
+from gigachain.testing import StubConfig, StubServer
+
+
+def test_sync_deadline_drops_waiting_request():
+    scheduler = RequestScheduler(max_concurrency=1)
+    scheduler.acquire()
+    with pytest.raises(DeadlineExceededError):
+        scheduler.acquire(deadline=time.monotonic() + 0.05)
+    stats = scheduler.stats()
+    assert (stats.in_flight, stats.queued, stats.expired) == (1, {}, {INTERACTIVE: 1})
+    scheduler.release()
+    # The dropped waiter does not take the freed slot
+    assert scheduler.stats().in_flight == 0
+
+
+def test_waiting_thread_leaves_queue_at_deadline():
+    scheduler = RequestScheduler(max_concurrency=1)
+    scheduler.acquire()
+    outcome = []
+
+    def wait():
+        try:
+            scheduler.acquire(tenant="late", deadline=time.monotonic() + 0.2)
+            outcome.append("granted")
+        except DeadlineExceededError:
+            outcome.append("expired")
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(0.3)
+    thread.join()
+    assert outcome == ["expired"]
+    assert scheduler.stats().queued == {}
+    scheduler.release()
+    assert scheduler.stats().in_flight == 0
+
+
+def test_priorities_and_tenants_take_turns():
+    async def main():
+        scheduler = RequestScheduler(max_concurrency=1)
+        await scheduler.aacquire()
+        order = []
+
+        async def request(name, priority, tenant):
+            async with scheduler.aslot(priority, tenant):
+                order.append(name)
+
+        tasks = [asyncio.ensure_future(request(name, priority, tenant)) for name, priority, tenant in [
+            ("a1", BATCH, "a"), ("a2", BATCH, "a"), ("b1", BATCH, "b"), ("chat", INTERACTIVE, "c")]]
+        await asyncio.sleep(0.01)
+        assert scheduler.stats().queued == {INTERACTIVE: 1, BATCH: 3}
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(main())
+    assert order == ["chat", "a1", "b1", "a2"]
+    assert stats.in_flight == 0
+    assert stats.dispatched == {INTERACTIVE: 2, BATCH: 3}
+
+
+def test_async_deadline():
+    async def main():
+        scheduler = RequestScheduler(max_concurrency=1)
+        await scheduler.aacquire()
+        with pytest.raises(DeadlineExceededError):
+            await scheduler.aacquire(deadline=time.monotonic() + 0.05)
+        scheduler.release()
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert (stats.in_flight, stats.queued, stats.expired) == (0, {}, {INTERACTIVE: 1})
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        scheduler = RequestScheduler(max_concurrency=1)
+        await scheduler.aacquire()
+        waiting = asyncio.ensure_future(scheduler.aacquire(tenant="gone"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.stats().queued == {}
+        scheduler.release()
+        return scheduler.stats()
+
+    assert asyncio.run(main()).in_flight == 0
+
+
+def test_waiter_cancelled_after_grant_releases_slot():
+    async def main():
+        scheduler = RequestScheduler(max_concurrency=1)
+        await scheduler.aacquire()
+        waiting = asyncio.ensure_future(scheduler.aacquire())
+        await asyncio.sleep(0.01)
+        # The slot is handed over, the task is cancelled before it wakes up
+        scheduler.release()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert stats.in_flight == 0
+    assert stats.dispatched == {INTERACTIVE: 2}
+
+
+def test_model_request_misses_deadline_in_queue():
+    scheduler = RequestScheduler(max_concurrency=1)
+    with StubServer(StubConfig(latency=0.5)) as server:
+        def model(**kwargs):
+            return GigaChatModel(api_url=server.url, user="user", password="password", scheduler=scheduler, **kwargs)
+
+        busy = threading.Thread(target=model().predict, args=("Долгий вопрос",))
+        busy.start()
+        while not scheduler.stats().in_flight:
+            time.sleep(0.01)
+        hurried = model(retry_policy=RetryPolicy(deadline=0.1))
+        with pytest.raises(DeadlineExceededError):
+            hurried.predict("Быстрый вопрос")
+        busy.join()
+        assert server.stats().chat_requests == 1
+    assert scheduler.stats().expired == {INTERACTIVE: 1}
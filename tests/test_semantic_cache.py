@@ -0,0 +1,39 @@
+import asyncio
+
+from langchain.embeddings.base import Embeddings
+
+from gigachain import GigaChatModel
+from gigachain.embeddings import LocalEmbeddings
+from gigachain.semantic_cache import SemanticCache
+from gigachain.testing import StubConfig, StubServer
+
+
+class BrokenEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        raise ConnectionError("embeddings are down")
+
+    def embed_query(self, text):
+        raise ConnectionError("embeddings are down")
+
+
+def model(server, cache) -> GigaChatModel:
+    return GigaChatModel(api_url=server.url, user="user", password="password", semantic_cache=cache)
+
+
+def test_repeated_question_is_answered_from_cache():
+    with StubServer(StubConfig()) as server:
+        cache = SemanticCache(LocalEmbeddings())
+        giga = model(server, cache)
+        first = giga.predict("Сколько будет два плюс два?")
+        assert giga.predict("Сколько будет два плюс два?") == first
+        assert server.stats().chat_requests == 1
+        assert (cache.stats().hits, cache.stats().misses) == (1, 1)
+
+
+def test_embedding_outage_is_a_miss():
+    with StubServer(StubConfig()) as server:
+        giga = model(server, SemanticCache(BrokenEmbeddings()))
+        assert giga.predict("Привет")
+        assert giga.predict("Привет")
+        assert asyncio.run(giga.apredict("Привет"))
+        assert server.stats().chat_requests == 3
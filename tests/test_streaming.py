@@ -0,0 +1,75 @@
+from gigachain.streaming import (SSEParser, StopSequenceMatcher, iter_sse_events,
+                                 truncate_at_stop)
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_sse_chunks_split_mid_line():
+    body = b'data: {"a": 1}\n\ndata: {"b": 2}\n\n'
+    chunks = [body[i:i + 3] for i in range(0, len(body), 3)]
+    assert feed_all(SSEParser(), chunks) == ['{"a": 1}', '{"b": 2}']
+
+
+def test_sse_chunk_split_inside_a_multibyte_character():
+    body = "data: Привет\n\n".encode("utf-8")
+    # Every split point, including the ones between the two bytes of a letter
+    for split in range(1, len(body)):
+        assert feed_all(SSEParser(), [body[:split], body[split:]]) == ["Привет"]
+
+
+def test_sse_crlf_line_endings():
+    body = b"data: first\r\ndata: second\r\n\r\n: comment\r\ndata: [DONE]\r\n\r\n"
+    assert feed_all(SSEParser(), [body[:17], body[17:]]) == ["first\nsecond", "[DONE]"]
+    assert list(iter_sse_events([body])) == ["first\nsecond"]
+
+
+def test_sse_flush_without_trailing_blank_line():
+    parser = SSEParser()
+    assert parser.feed(b"data: one\n\ndata: two") == ["one"]
+    assert parser.flush() == ["two"]
+    assert parser.flush() == []
+
+    parser = SSEParser()
+    assert parser.feed(b"data: three\n") == []
+    assert parser.flush() == ["three"]
+
+
+def test_stop_sequence_split_across_chunks():
+    matcher = StopSequenceMatcher(["\nБорис:"])
+    assert matcher.feed("Привет!\nБо") == ("Привет!", False)
+    assert matcher.feed("рис: а я") == ("", True)
+    assert matcher.feed("дальше") == ("", True)
+
+    matcher = StopSequenceMatcher(["\nБорис:"])
+    assert matcher.feed("Привет!\nБо") == ("Привет!", False)
+    assert matcher.feed("льше не буду") == ("\nБольше не буду", False)
+    assert matcher.flush() == ""
+
+
+def test_held_back_text_is_flushed():
+    matcher = StopSequenceMatcher(["STOP"])
+    assert matcher.feed("конец ST") == ("конец ", False)
+    assert matcher.flush() == "ST"
+
+
+def test_overlapping_stop_sequences():
+    # The first sequence to be completed wins, not the first one to start
+    assert truncate_at_stop("xabcd", ["abcd", "bc"]) == "xa"
+    assert truncate_at_stop("xabcd", ["abc", "bcd"]) == "x"
+    assert truncate_at_stop("aaab", ["aab"]) == "a"
+
+    matcher = StopSequenceMatcher(["abcd", "bc"])
+    assert matcher.feed("xa") == ("x", False)
+    assert matcher.feed("bcd") == ("a", True)
+
+
+def test_truncate_at_stop():
+    assert truncate_at_stop("text", None) == "text"
+    assert truncate_at_stop("text", ["", "zz"]) == "text"
+    assert truncate_at_stop("one\nUser: two", ["\nUser:"]) == "one"
+    assert truncate_at_stop("one\nUse", ["\nUser:"]) == "one\nUse"
@@ -0,0 +1,72 @@
+import pytest
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+import gigachain.tokenizer as tokenizer
+from gigachain import GigaChatModel
+from gigachain.tokenizer import (MESSAGE_OVERHEAD, TokenCounter,
+                                 approximate_num_tokens)
+
+tokenizers = pytest.importorskip("tokenizers")
+
+WORDS = ["[UNK]", "привет", "мир", "hello", "world", ",", "!"]
+
+
+@pytest.fixture(scope="module")
+def vocab_path(tmp_path_factory):
+    vocab = tokenizers.Tokenizer(tokenizers.models.WordLevel(
+        {word: i for i, word in enumerate(WORDS)}, unk_token="[UNK]"))
+    vocab.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    path = str(tmp_path_factory.mktemp("vocab") / "tokenizer.json")
+    vocab.save(path)
+    return path
+
+
+def test_exact_counts(vocab_path):
+    counter = TokenCounter(vocab_path)
+    assert not counter.approximate
+    assert counter.encode("привет, мир!") == [1, 5, 2, 6]
+    assert counter.count("привет, мир!") == 4
+    assert counter.count("hello unknownword") == 2
+
+
+def test_approximate_counts():
+    counter = TokenCounter()
+    assert counter.approximate and not counter.has_vocabulary
+    assert counter.count("привет, мир!") == approximate_num_tokens("привет, мир!")
+    # Short words are one token, long ones are split, Cyrillic more often
+    assert approximate_num_tokens("a bb ccc") == 3
+    assert approximate_num_tokens("abcdefgh") == 2
+    assert approximate_num_tokens("абвгдеж") == 3
+    with pytest.raises(ValueError):
+        counter.encode("text")
+
+
+def test_count_batch_matches_single_counts(vocab_path):
+    texts = ["привет мир", "hello, world!", "привет мир", ""]
+    for counter in (TokenCounter(vocab_path), TokenCounter(vocab_path, approximate=True)):
+        assert counter.count_batch(texts) == [counter.count(text) for text in texts]
+
+
+def test_messages_count_markup(vocab_path):
+    messages = [SystemMessage(content="hello"), HumanMessage(content="привет мир"), AIMessage(content="!")]
+    giga = GigaChatModel(tokenizer_path=vocab_path)
+    assert giga.get_num_tokens_from_messages(messages) == 4 + 3 * MESSAGE_OVERHEAD
+    giga = GigaChatModel(tokenizer_path=vocab_path, message_token_overhead=5)
+    assert giga.get_num_tokens_from_messages(messages) == 4 + 3 * 5
+
+
+def test_token_ids_come_from_vocabulary_in_approximate_mode(vocab_path):
+    giga = GigaChatModel(tokenizer_path=vocab_path, approximate_token_count=True)
+    assert giga.get_token_ids("привет мир") == [1, 2]
+    assert giga.get_num_tokens("привет мир") == approximate_num_tokens("привет мир")
+
+
+def test_without_tokenizers_package(vocab_path, monkeypatch):
+    monkeypatch.setattr(tokenizer, "tokenizers", None)
+    with pytest.raises(ImportError):
+        TokenCounter(vocab_path)
+    counter = TokenCounter(vocab_path, approximate=True)
+    assert not counter.has_vocabulary
+    assert counter.count("привет мир") == approximate_num_tokens("привет мир")
+    with pytest.raises(ValueError):
+        counter.encode("привет мир")
@@ -0,0 +1,64 @@
+import asyncio
+
+from gigachain.errors import _parse_retry_after
+from gigachain.testing import StubConfig, StubServer
+from gigachain.transport import AsyncHTTPTransport, get_async_transport, get_transport
+
+
+def test_retry_after_in_any_case():
+    assert _parse_retry_after({"RETRY-AFTER": "2"}) == 2.0
+    assert _parse_retry_after({"retry-after": "3"}) == 3.0
+    assert _parse_retry_after({"Content-Type": "application/json"}) is None
+
+
+def test_async_response_headers_ignore_case():
+    async def request(url):
+        transport = AsyncHTTPTransport(url)
+        try:
+            return await transport.post("/v1/chat/completions", json={"messages": []})
+        finally:
+            await transport.aclose()
+
+    with StubServer(StubConfig(error_rate=1.0, retry_after=2, check_token=False)) as server:
+        response = asyncio.run(request(server.url))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == response.headers["RETRY-AFTER"] == "2"
+    assert _parse_retry_after(response.headers) == 2.0
+
+
+def test_transports_are_shared_per_timeouts():
+    url = "http://gigachat.test"
+    assert get_transport(url, 10, 5, 60) is get_transport(url + "/", 10, 5, 60)
+    assert get_transport(url, 10, 5, 60).timeout == (5, 60)
+    assert get_transport(url, 10, 5, 600).timeout == (5, 600)
+    assert get_async_transport(url, 8, 1, 60).timeout == (1, 60)
+    assert get_async_transport(url, 8, 2, 60).timeout == (2, 60)
+
+
+def test_sessions_close_with_their_loops():
+    sessions = []
+
+    async def request(transport):
+        response = await transport.post("/v1/chat/completions", json={"messages": []})
+        sessions.append((await transport._state()).session)
+        return response.status_code
+
+    with StubServer(StubConfig(check_token=False)) as server:
+        transport = AsyncHTTPTransport(server.url)
+        for _ in range(3):
+            assert asyncio.run(request(transport)) == 200
+            assert sessions[-1].closed
+            assert len(transport._states) == 0
+    assert len({id(session) for session in sessions}) == 3
+
+
+def test_explicit_close_and_reuse():
+    async def main(transport):
+        first = await transport.post("/v1/chat/completions", json={"messages": []})
+        session = (await transport._state()).session
+        await transport.aclose()
+        second = await transport.post("/v1/chat/completions", json={"messages": []})
+        return first.status_code, second.status_code, session.closed
+
+    with StubServer(StubConfig(check_token=False)) as server:
+        assert asyncio.run(main(AsyncHTTPTransport(server.url))) == (200, 200, True)
@@ -0,0 +1,88 @@
+from typing import List
+
+import numpy as np
+import pytest
+from langchain.embeddings.base import Embeddings
+
+from gigachain.vectorstore import NumpyVectorStore
+
+
+class LetterEmbeddings(Embeddings):
+    """Counts of the letters a-z, similar texts get similar vectors"""
+
+    @staticmethod
+    def _embed(text: str) -> List[float]:
+        vector = [0.0] * 26
+        for char in text.lower():
+            if "a" <= char <= "z":
+                vector[ord(char) - ord("a")] += 1
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+@pytest.fixture
+def store() -> NumpyVectorStore:
+    return NumpyVectorStore.from_texts(["aaa", "bbb", "ccc"], LetterEmbeddings(), ids=["a", "b", "c"])
+
+
+def contents(store: NumpyVectorStore) -> List[str]:
+    return sorted(store._texts)
+
+
+def test_delete_moves_last_row(store):
+    assert store.delete(["a"])
+    assert len(store) == 2
+    assert contents(store) == ["bbb", "ccc"]
+    assert store.similarity_search("ccc", k=1)[0].page_content == "ccc"
+
+
+def test_delete_duplicate_ids(store):
+    assert store.delete(["a", "a"])
+    assert len(store) == 2
+    assert contents(store) == ["bbb", "ccc"]
+    assert store._rows == {id_: row for row, id_ in enumerate(store._ids)}
+
+
+def test_delete_unknown_ids(store):
+    assert store.delete(["x", "y"]) is False
+    assert store.delete(["x", "c", "y"])
+    assert contents(store) == ["aaa", "bbb"]
+    assert store.delete(None) is False
+
+
+def test_delete_all(store):
+    assert store.delete(["c", "a", "b", "b"])
+    assert len(store) == 0
+    assert store.similarity_search("aaa") == []
+    store.add_texts(["ddd"], ids=["d"])
+    assert store.similarity_search("ddd", k=1)[0].page_content == "ddd"
+
+
+def test_add_existing_id_replaces(store):
+    store.add_texts(["abc"], ids=["b"])
+    assert len(store) == 3
+    assert contents(store) == ["aaa", "abc", "ccc"]
+
+
+def test_search_k_and_filter():
+    store = NumpyVectorStore.from_texts(
+        ["aab", "abb", "ccc"], LetterEmbeddings(), metadatas=[{"n": 1}, {"n": 2}, {"n": 1}])
+    assert [doc.page_content for doc in store.similarity_search("aaa", k=2)] == ["aab", "abb"]
+    assert [doc.page_content for doc in store.similarity_search("aaa", k=10, filter={"n": 1})] == ["aab", "ccc"]
+    batch = store.similarity_search_batch(["aaa", "ccc"], k=1)
+    assert [results[0][0].page_content for results in batch] == ["aab", "ccc"]
+
+
+def test_save_load_mmap_then_delete(store, tmp_path):
+    store.save(str(tmp_path))
+    loaded = NumpyVectorStore.load(str(tmp_path), LetterEmbeddings())
+    assert isinstance(loaded._matrix, np.memmap)
+    assert loaded.delete(["b", "b"])
+    assert contents(loaded) == ["aaa", "ccc"]
+    # The file on disk is not changed by the copy
+    assert len(NumpyVectorStore.load(str(tmp_path), LetterEmbeddings())) == 3